@@ -3,7 +3,7 @@ from PyQt5.QtCore import (
     QEasingCurve, QPropertyAnimation, QSequentialAnimationGroup,
     pyqtSlot, pyqtProperty)
 from PyQt5.QtWidgets import QCheckBox
-from PyQt5.QtGui import QColor, QBrush, QPaintEvent, QPen, QPainter
+from PyQt5.QtGui import QColor, QBrush, QPaintEvent, QPen, QPainter, QPixmap, QPixmapCache, QResizeEvent
 
 from PyQt5.QtCore import pyqtSlot as Slot, pyqtProperty as Property
 
@@ -14,6 +14,10 @@ class PToggle(QCheckBox):
     _light_grey_pen = QPen(Qt.lightGray)
     _dark_gray_pen = QPen(Qt.darkGray)
 
+    # Draw the bar from a pixmap shared through QPixmapCache by every toggle of the same size and colors, instead of
+    # tessellating the rounded rect on every animation frame
+    cache_pixmaps = True
+
     def __init__(self,
         parent=None,
         bar_color=Qt.gray,
@@ -39,6 +43,11 @@ class PToggle(QCheckBox):
         self.setContentsMargins(8, 0, 8, 0)
         self._handle_position = 0
 
+        # Bar and handle geometry for the current size, worked out on the first paint after a resize
+        self._geometry = None
+        self._handle_center = QPointF()
+        self._painter = QPainter()
+
         self.stateChanged.connect(self.handle_state_change)
 
     def sizeHint(self):
@@ -47,53 +56,90 @@ class PToggle(QCheckBox):
     def hitButton(self, pos: QPoint):
         return self.contentsRect().contains(pos)
 
-    def paintEvent(self, e: QPaintEvent):
+    def resizeEvent(self, e: QResizeEvent):
+        self._geometry = None
+        super().resizeEvent(e)
 
-        contRect = self.contentsRect()
-        handleRadius = round(0.24 * contRect.height())
+    def geometry_for_size(self):
+        """(barRect, rounding, handleRadius, trailStart, trailLength) for the current size, cached until a resize"""
+        if self._geometry is None:
+            contRect = self.contentsRect()
+            handleRadius = round(0.24 * contRect.height())
 
-        p = QPainter(self)
-        p.setRenderHint(QPainter.Antialiasing)
+            barRect = QRectF(
+                0, 0,
+                contRect.width() - handleRadius, 0.40 * contRect.height()
+            )
+            barRect.moveCenter(contRect.center())
+            rounding = barRect.height() / 2
 
-        p.setPen(self._transparent_pen)
-        barRect = QRectF(
-            0, 0,
-            contRect.width() - handleRadius, 0.40 * contRect.height()
-        )
-        barRect.moveCenter(contRect.center())
-        rounding = barRect.height() / 2
+            # the handle will move along this line
+            trailLength = contRect.width() - 2 * handleRadius
+            trailStart = contRect.x() + handleRadius
 
-        # the handle will move along this line
-        trailLength = contRect.width() - 2 * handleRadius
-        xPos = contRect.x() + handleRadius + trailLength * self._handle_position
+            self._geometry = (barRect, rounding, handleRadius, trailStart, trailLength)
+            self._handle_center.setY(barRect.center().y())
+        return self._geometry
 
+    def bar_brush(self):
         if self.checkState() == Qt.PartiallyChecked:
-            p.setBrush(self._bar_partially_checked_brush)
+            return self._bar_partially_checked_brush
+        elif self.checkState() == Qt.Checked:
+            return self._bar_checked_brush
+        return self._bar_brush
+
+    def draw_bar(self, p, barRect, rounding):
+        brush = self.bar_brush()
+        if not self.cache_pixmaps:
+            p.setBrush(brush)
             p.drawRoundedRect(barRect, rounding, rounding)
-            # Don't draw the handle if partially checked!
+            return
+
+        ratio = self.devicePixelRatioF()
+        key = 'PToggle-bar-%dx%d-%g-%g,%g-%x' % (
+            self.width(), self.height(), ratio, barRect.x(), barRect.y(), brush.color().rgba())
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            pixmap = QPixmap(self.size() * ratio)
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+            bar = QPainter(pixmap)
+            bar.setRenderHint(QPainter.Antialiasing)
+            bar.setPen(self._transparent_pen)
+            bar.setBrush(brush)
+            bar.drawRoundedRect(barRect, rounding, rounding)
+            bar.end()
+            QPixmapCache.insert(key, pixmap)
+        p.drawPixmap(0, 0, pixmap)
+
+    def draw_handle(self, p, handleRadius, trailStart, trailLength):
+        # Don't draw the handle if partially checked!
+        if self.checkState() == Qt.PartiallyChecked:
+            return
+
+        if self.checkState() == Qt.Unchecked:
+            p.setPen(self._light_grey_pen)
 
+        if not self.isEnabled():
+            p.setBrush(self._handle_disabled_brush)
         elif self.checkState() == Qt.Checked:
-            p.setBrush(self._bar_checked_brush)
-            p.drawRoundedRect(barRect, rounding, rounding)
+            p.setBrush(self._handle_checked_brush)
+        else:
+            p.setBrush(self._handle_brush)
 
-            if self.isEnabled():
-                p.setBrush(self._handle_checked_brush)
-            else:
-                p.setBrush(self._handle_disabled_brush)
+        self._handle_center.setX(trailStart + trailLength * self._handle_position)
+        p.drawEllipse(self._handle_center, handleRadius, handleRadius)
 
-            p.drawEllipse(QPointF(xPos, barRect.center().y()), handleRadius, handleRadius)
+    def paintEvent(self, e: QPaintEvent):
+        barRect, rounding, handleRadius, trailStart, trailLength = self.geometry_for_size()
 
-        # Unchecked
-        else:
-            p.setBrush(self._bar_brush)
-            p.drawRoundedRect(barRect, rounding, rounding)
-            p.setPen(self._light_grey_pen)
+        p = self._painter
+        p.begin(self)
+        p.setRenderHint(QPainter.Antialiasing)
+        p.setPen(self._transparent_pen)
 
-            if self.isEnabled():
-                p.setBrush(self._handle_brush)
-            else:
-                p.setBrush(self._handle_disabled_brush)
-            p.drawEllipse(QPointF(xPos, barRect.center().y()), handleRadius, handleRadius)
+        self.draw_bar(p, barRect, rounding)
+        self.draw_handle(p, handleRadius, trailStart, trailLength)
 
         p.end()
 
@@ -164,25 +210,12 @@ class PAnimatedToggle(PToggle):
         self.animations_group.start()
 
     def paintEvent(self, e: QPaintEvent):
+        barRect, rounding, handleRadius, trailStart, trailLength = self.geometry_for_size()
 
-        contRect = self.contentsRect()
-        handleRadius = round(0.24 * contRect.height())
-
-        p = QPainter(self)
+        p = self._painter
+        p.begin(self)
         p.setRenderHint(QPainter.Antialiasing)
-
         p.setPen(self._transparent_pen)
-        barRect = QRectF(
-            0, 0,
-            contRect.width() - handleRadius, 0.40 * contRect.height()
-        )
-        barRect.moveCenter(contRect.center())
-        rounding = barRect.height() / 2
-
-        # the handle will move along this line
-        trailLength = contRect.width() - 2 * handleRadius
-
-        xPos = contRect.x() + handleRadius + trailLength * self._handle_position
 
         # Animate, unless partially checked
         if self.checkState() in [Qt.Checked, Qt.Unchecked]:
@@ -190,34 +223,10 @@ class PAnimatedToggle(PToggle):
                 p.setBrush(
                     self._pulse_checked_animation if
                     self.isChecked() else self._pulse_unchecked_animation)
-                p.drawEllipse(QPointF(xPos, barRect.center().y()), self._pulse_radius, self._pulse_radius)
-
-        if self.checkState() == Qt.PartiallyChecked:
-            p.setBrush(self._bar_partially_checked_brush)
-            p.drawRoundedRect(barRect, rounding, rounding)
-            # Don't draw the handle if partially checked!
-
-        elif self.checkState() == Qt.Checked:
-            p.setBrush(self._bar_checked_brush)
-            p.drawRoundedRect(barRect, rounding, rounding)
-
-            if self.isEnabled():
-                p.setBrush(self._handle_checked_brush)
-            else:
-                p.setBrush(self._handle_disabled_brush)
+                self._handle_center.setX(trailStart + trailLength * self._handle_position)
+                p.drawEllipse(self._handle_center, self._pulse_radius, self._pulse_radius)
 
-            p.drawEllipse(QPointF(xPos, barRect.center().y()),handleRadius, handleRadius)
+        self.draw_bar(p, barRect, rounding)
+        self.draw_handle(p, handleRadius, trailStart, trailLength)
 
-        else:
-            p.setBrush(self._bar_brush)
-            p.drawRoundedRect(barRect, rounding, rounding)
-            p.setPen(self._light_grey_pen)
-
-            if self.isEnabled():
-                p.setBrush(self._handle_brush)
-            else:
-                p.setBrush(self._handle_disabled_brush)
-
-            p.drawEllipse(QPointF(xPos, barRect.center().y()),handleRadius, handleRadius)
-
-        p.end()
\ No newline at end of file
+        p.end()
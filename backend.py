@@ -0,0 +1,208 @@
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+log = logging.getLogger('')
+
+CONNECT_WORKERS = 8
+
+# Monitor signals of the kPyQt channel and keyword objects; not every object has both
+SIGNALS = ['floatCallback', 'stringCallback']
+
+# Setup an EPICS address list if one is not already defined
+addrs = 'localhost:5064 vm-k1epicsgateway:5064 vm-k2epicsgateway:5064 k1aoserver-new:8607 localhost:5555 localhost:5556 k1aoserver-new:5064'
+
+# addrs = 'localhost:5064 vm-k1epicsgateway:5064 vm-k2epicsgateway:5064 k1aoserver-new:5064 localhost:5555 localhost:5556'
+
+
+class KeckBackend:
+    '''
+    Live EPICS channels and KTL keywords, through kPyQt. This is what the GUI uses on the summit.
+
+    A backend hands out channel and keyword objects with the kPyQt interface: read(), write(value, wait=...),
+    runCallbacks()/primeCallback(), and floatCallback/stringCallback signals. See simulator.SimBackend for the
+    stand-in used off-summit. Here they are KeckChannel objects, so the health monitor can recreate them.
+    '''
+
+    def __init__(self):
+        print(f'Overriding EPICS address list to: {addrs}')
+        os.environ['EPICS_CA_ADDR_LIST'] = addrs
+        os.environ['EPICS_CA_AUTO_ADDR_LIST'] = 'NO'
+
+        # The Keck libraries are imported on first use, so that happens on whichever thread creates the first channel
+        self._ktl = None
+        self._kPyQt = None
+        self._lock = threading.Lock()
+        self._services = {}
+
+    @property
+    def ktl(self):
+        self._importLibraries()
+        return self._ktl
+
+    @property
+    def kPyQt(self):
+        self._importLibraries()
+        return self._kPyQt
+
+    def _importLibraries(self):
+        with self._lock:
+            if self._kPyQt is None:
+                # Keck library includes, only importable where kroot is installed
+                import ktl  # provided by kroot/ktl/keyword/python
+                import kPyQt  # provided by kroot/kui/kPyQt
+                self._ktl = ktl
+                self._kPyQt = kPyQt
+
+    def channel(self, name):
+        '''
+        Create an EPICS channel.
+
+        :param name: PV name, e.g. wndsim:ln:m1.RBV
+        '''
+        return KeckChannel(lambda: self.kPyQt.caFactory(name, self.kPyQt.Channel.caFloat), name)
+
+    def keyword(self, service, name):
+        '''
+        Create a KTL keyword.
+
+        :param service: KTL service, e.g. ao1
+        :param name: Keyword name, e.g. dtlp
+        '''
+        ktl = self.ktl
+        with self._lock:
+            if service not in self._services:
+                self._services[service] = ktl.cache(service)
+        return KeckChannel(lambda: self.kPyQt.kFactory(self._services[service][name]), f'{service}.{name}')
+
+    def run(self, application):
+        '''Run the Qt event loop'''
+        return self.kPyQt.run(application)
+
+
+class KeckChannel(QtCore.QObject):
+    '''
+    A kPyQt channel or keyword that can be created again, for health.HealthMonitor to reconnect it once its gateway
+    or service is back. The current object's monitor updates are passed on through this object's own signals, so
+    whatever is connected to them carries on across a reconnect; everything else is passed to the current object.
+    '''
+
+    floatCallback = pyqtSignal(float)
+    stringCallback = pyqtSignal(str)
+
+    def __init__(self, factory, name):
+        '''
+        :param factory: Creates the kPyQt object, e.g. lambda: kPyQt.caFactory(name, kPyQt.Channel.caFloat)
+        :param name: For messages
+        '''
+        super().__init__()
+        self.name = name
+        self._factory = factory
+        self._object = None
+        self._attach(factory())
+
+    def read(self):
+        return self._object.read()
+
+    def write(self, value, wait=True):
+        return self._object.write(value, wait=wait)
+
+    def runCallbacks(self):
+        self._object.runCallbacks()
+
+    def primeCallback(self):
+        self._object.primeCallback()
+
+    def reconnect(self):
+        '''
+        Create the channel or keyword again, from the thread calling this, and switch to it if it can be read.
+
+        :return: True if reconnected
+        '''
+        try:
+            obj = self._factory()
+            obj.read()
+        except Exception as e:
+            log.debug(f'{self.name}: reconnect failed: {type(e).__name__}: {e}')
+            return False
+        self._attach(obj)
+        obj.primeCallback()
+        return True
+
+    def moveToThread(self, thread):
+        '''Move the current kPyQt object along with this one'''
+        if isinstance(self._object, QtCore.QObject) and self._object.thread() == QtCore.QThread.currentThread():
+            self._object.moveToThread(thread)
+        super().moveToThread(thread)
+
+    def _attach(self, obj):
+        if obj is self._object:
+            return
+        if isinstance(obj, QtCore.QObject) and obj.thread() == QtCore.QThread.currentThread():
+            obj.moveToThread(self.thread())
+        for signal in SIGNALS:
+            if self._object is not None and hasattr(self._object, signal):
+                try:
+                    getattr(self._object, signal).disconnect(getattr(self, signal))
+                except TypeError:
+                    pass
+            if hasattr(obj, signal):
+                getattr(obj, signal).connect(getattr(self, signal))
+        self._object = obj
+
+    def __getattr__(self, attr):
+        if attr == '_object':
+            raise AttributeError(attr)
+        return getattr(self._object, attr)
+
+
+class ChannelConnector(QtCore.QThread):
+    '''
+    Creates a backend's channels and keywords in parallel, off the GUI thread, so the window can be shown while they
+    connect. Emits connected({attribute: object}, seconds) once all of them exist, or failed(message).
+
+    Objects that are QObjects are moved to the GUI thread before they are handed over, so their signals and timers
+    behave as if they had been created there.
+    '''
+
+    connected = pyqtSignal(dict, float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, backend, channels, keywords, workers=CONNECT_WORKERS, parent=None):
+        '''
+        :param backend: KeckBackend or simulator.SimBackend
+        :param channels: List of (attribute, PV name)
+        :param keywords: List of (attribute, service, keyword)
+        :param workers: Channels created at the same time
+        '''
+        super().__init__(parent)
+        self.backend = backend
+        self.channels = channels
+        self.keywords = keywords
+        self.workers = workers
+        self._guiThread = QtCore.QThread.currentThread()
+
+    def run(self):
+        start = time.monotonic()
+        jobs = [(attr, self.backend.channel, (name,)) for attr, name in self.channels]
+        jobs += [(attr, self.backend.keyword, (service, name)) for attr, service, name in self.keywords]
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                       thread_name_prefix='telsim-connect') as pool:
+                futures = {attr: pool.submit(self._create, factory, args) for attr, factory, args in jobs}
+                objects = {attr: future.result() for attr, future in futures.items()}
+        except Exception as e:
+            self.failed.emit(f'{type(e).__name__}: {e}')
+            return
+        self.connected.emit(objects, time.monotonic() - start)
+
+    def _create(self, factory, args):
+        obj = factory(*args)
+        if isinstance(obj, QtCore.QObject):
+            obj.moveToThread(self._guiThread)
+        return obj
@@ -0,0 +1,279 @@
+#! @KPYTHON3@
+'''
+Benchmarks of the GUI hot paths, run offscreen against the simulator, with results written as JSON.
+
+    python benchmark.py --output bench.json
+
+Measures the cost of each state machine transition, the latency from a channel monitor update to the edit box
+showing it under a high update rate, the simulated time and wall-clock cost of a full move sequence, and the
+PToggle/PAnimatedToggle paint cost. With --replay, also the cost of replaying a telemetry log into a window as fast
+as possible. Compare the JSON of two runs to catch regressions before deploying.
+'''
+
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from PyQt5 import QtCore, QtWidgets
+from PyQt5.QtCore import Qt, QTimer, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtGui import QPixmap
+
+from PToggle import PToggle, PAnimatedToggle
+from controller import TelSimController, TelSimStates, TelSimEvents
+from replay import ReplayBackend
+from sequenceplayer import Segment
+from simulator import SimBackend
+
+STATE_CYCLES = 200
+STATE_STEP_S = 1.0  # Simulated seconds per event loop pass in benchStateTicks, so each move takes a few passes
+MONITOR_RATE_HZ = 2000
+MONITOR_SECONDS = 2.0
+SIM_STEP_S = 0.02
+PAINTS = 2000
+
+
+def summarize(name, samples, unit='s', **extra):
+    '''One result row: count, mean, p50, p95 and max of samples, plus any extra fields'''
+    samples = np.asarray(samples, dtype=float)
+    p50, p95 = np.percentile(samples, [50, 95])
+    return dict(name=name, unit=unit, count=len(samples), mean=float(samples.mean()), p50=float(p50),
+                p95=float(p95), max=float(samples.max()), **extra)
+
+
+def benchStateTicks(cycles=STATE_CYCLES, step=STATE_STEP_S):
+    '''
+    Cost of each state machine transition, from real move, stop and cleanup cycles on a simulated clock: the handler
+    of every (state, event) pair that changes state, and each state's ENTER actions. Setpoint writes and waits run as
+    they would live; only the handlers themselves are timed, not the moves.
+    '''
+    backend = SimBackend(speed=None)
+    controller = TelSimController()
+    controller.connectChannels(backend)
+    controller.setup()
+    controller.waitForState(TelSimStates.IDLE)
+
+    samples = {}
+    handler = controller.stateMachine
+
+    def timedHandler(event, value=None):
+        state = controller.state
+        start = time.perf_counter()
+        handler(event, value)
+        elapsed = time.perf_counter() - start
+        if event == TelSimEvents.ENTER or controller.state != state:
+            samples.setdefault((state.name, event.name), []).append(elapsed)
+
+    def settle():
+        # Let the writes a stop left behind finish before the next cycle starts
+        while controller.writes.pending():
+            controller.wait(0.001)
+
+    stepper = QTimer()
+    stepper.timeout.connect(lambda: backend.advance(step))
+    stepper.start(0)
+    controller.stateMachine = timedHandler
+    for i in range(cycles):
+        alt, pos = (8.0, 20.0) if i % 2 == 0 else (6.0, -20.0)
+        for parallel in [False, True]:
+            controller.parallel = parallel
+            controller.move(alt=alt, pos=pos, vel=10.0, accel=0.5)
+        controller.parallel = False
+        controller.start(Segment(None, -pos, 10.0, 0.5, alt))
+        controller.stop()
+        controller.waitForState(TelSimStates.IDLE)
+        settle()
+        controller.close()
+        controller.waitForState(TelSimStates.OFF)
+        controller.setup()
+        controller.waitForState(TelSimStates.IDLE)
+    controller.stateMachine = handler
+    stepper.stop()
+    controller.shutdown()
+
+    return [summarize(f'state_tick.{state}.{event}', values) for (state, event), values in sorted(samples.items())]
+
+
+def benchMonitorLatency(window, backend, rate=MONITOR_RATE_HZ, seconds=MONITOR_SECONDS):
+    '''
+    Latency from a wind RBV monitor update to posBox showing it, and the cost of the box handler, with updates
+    arriving at rate per second. The display coalesces updates, so latency counts from the oldest update the box had
+    not yet shown: how stale the box was at worst.
+    '''
+    wind = window.stages.primary('wind')
+    motor = backend.motors[wind.prefix]
+    waiting = [None]
+    latencies = []
+    handler = []
+
+    apply = window.display._apply['posBox']
+
+    def timedApply(value):
+        start = time.perf_counter()
+        apply(value)
+        handler.append(time.perf_counter() - start)
+        if waiting[0] is not None:
+            latencies.append(start - waiting[0])
+            waiting[0] = None
+
+    window.display._apply['posBox'] = timedApply
+    def posted(value):
+        if waiting[0] is None:
+            waiting[0] = time.perf_counter()
+
+    window.controller.channel(wind, 'RBV').floatCallback.connect(posted)
+
+    # Post from a fast timer in bursts that keep up the average rate, as a busy IOC would
+    sent = [0]
+    begin = time.perf_counter()
+
+    def burst():
+        due = int((time.perf_counter() - begin) * rate)
+        while sent[0] < due:
+            sent[0] += 1
+            motor.set('RBV', sent[0] * 1e-3)
+
+    timer = QTimer()
+    timer.timeout.connect(burst)
+    timer.start(1)
+    loop = QtCore.QEventLoop()
+    QTimer.singleShot(round(seconds * 1000), loop.quit)
+    loop.exec_()
+    timer.stop()
+    QtWidgets.QApplication.processEvents()
+    window.display._apply['posBox'] = apply
+
+    return [summarize('monitor.latency.posBox', latencies, updates=sent[0], rateHz=rate),
+            summarize('monitor.handler.posBox', handler)]
+
+
+def benchMoveSequence(parallel=False, step=SIM_STEP_S):
+    '''
+    One homed move to alt 8, pos 20 at 10 units/s and back home, on a simulated clock stepped by step per event loop
+    pass while a stage is moving. The simulated sequence time is deterministic, a little under the prediction as
+    arrival counts from inside the tolerance; the wall time is what it cost to drive, setpoint writes included.
+    '''
+    moving = [TelSimStates.AWAIT_ALT, TelSimStates.AWAIT_WIND, TelSimStates.AWAIT_BOTH, TelSimStates.CLEANUP,
+              TelSimStates.AWAIT_CLEANUP]
+    backend = SimBackend(speed=None)
+    controller = TelSimController()
+    controller.parallel = parallel
+    controller.connectChannels(backend)
+    controller.setup()
+    controller.waitForState(TelSimStates.IDLE)
+
+    stepper = QTimer()
+    stepper.timeout.connect(lambda: backend.advance(step) if controller.state in moving else None)
+    stepper.start(0)
+    simStart = backend.clock.now()
+    wallStart = time.perf_counter()
+    controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+    simMove = backend.clock.now() - simStart
+    wallMove = time.perf_counter() - wallStart
+    controller.close()
+    controller.waitForState(TelSimStates.OFF)
+    stepper.stop()
+    controller.shutdown()
+
+    name = 'move_sequence.parallel' if parallel else 'move_sequence.sequential'
+    return [dict(name=name, unit='s', simulated=simMove, predicted=controller.prediction.total, wall=wallMove,
+                 steps=round(simMove / step))]
+
+
+def benchTogglePaint(paints=PAINTS):
+    '''paintEvent cost of both toggles, checked and unchecked, at their size hint'''
+    results = []
+    for kind in [PToggle, PAnimatedToggle]:
+        for checked in [False, True]:
+            toggle = kind(handle_color=Qt.red, checked_color=Qt.green)
+            toggle.resize(toggle.sizeHint())
+            toggle.setCheckState(Qt.Checked if checked else Qt.Unchecked)
+            # Let an animated toggle finish sliding before timing the steady state
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                QtWidgets.QApplication.processEvents()
+
+            pixmap = QPixmap(toggle.size())
+            samples = np.empty(paints)
+            for i in range(paints):
+                start = time.perf_counter()
+                toggle.render(pixmap)
+                samples[i] = time.perf_counter() - start
+            results.append(summarize(f'paint.{kind.__name__}.{"checked" if checked else "unchecked"}', samples))
+    return results
+
+
+def benchReplay(path):
+    '''
+    A telemetry log replayed at full speed into its own window: the wall time, and the monitor updates per second
+    the window, controller and recorder keep up with.
+    '''
+    import telsim
+    backend = ReplayBackend(path, speed=None)
+    window = telsim.TurbulenceSimulatorGUIMain()
+    window.setupUI(backend)
+    window.show()
+
+    loop = QtCore.QEventLoop()
+    backend.finished.connect(loop.quit)
+    start = time.perf_counter()
+    backend.play()
+    loop.exec_()
+    wall = time.perf_counter() - start
+    window.controller.shutdown()
+    window.close()
+    return [dict(name='replay.full_speed', unit='s', wall=wall, updates=backend.emitted,
+                 updatesPerSecond=backend.emitted / wall if wall else None, logged=backend.log.end - backend.log.start)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Telescope simulator GUI benchmarks')
+    parser.add_argument('-o', '--output', help='JSON file to write the results to (default stdout)')
+    parser.add_argument('--quick', help='A tenth of the iterations, for a smoke run', action='store_true')
+    parser.add_argument('--replay', help='Also time replaying this telemetry log into a window', metavar='LOG')
+    args = parser.parse_args()
+    scale = 0.1 if args.quick else 1.0
+
+    application = QtWidgets.QApplication(sys.argv)
+
+    import telsim
+    telsim.showDialog = lambda *args, **kwargs: True
+    backend = SimBackend(speed=None)
+    window = telsim.TurbulenceSimulatorGUIMain()
+    window.setupUI(backend)
+    window.show()
+
+    results = []
+    results += benchStateTicks(max(1, int(STATE_CYCLES * scale)))
+    results += benchMonitorLatency(window, backend, seconds=MONITOR_SECONDS * scale)
+    results += benchMoveSequence(parallel=False)
+    results += benchMoveSequence(parallel=True)
+    results += benchTogglePaint(int(PAINTS * scale))
+    window.controller.shutdown()
+    if args.replay:
+        results += benchReplay(args.replay)
+
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'qt': QT_VERSION_STR, 'pyqt': PYQT_VERSION_STR, 'platform': platform.platform(),
+                 'qpa': application.platformName(), 'quick': args.quick},
+        'results': results,
+    }
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
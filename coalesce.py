@@ -0,0 +1,56 @@
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer
+
+DISPLAY_FPS = 30
+
+
+class DisplayCoalescer(QtCore.QObject):
+    '''
+    Keeps only the latest value posted for each display target and applies it at most once per display frame.
+
+    Channel monitors can post far faster than anyone can read a text box. post() just stores the value; a
+    single-shot timer, started by the first value after an idle period, applies whatever is latest. Nothing runs
+    while no values arrive.
+    '''
+
+    def __init__(self, fps=DISPLAY_FPS, parent=None):
+        super().__init__(parent)
+        self._apply = {}
+        self._latest = {}
+        self.received = {}
+        self.applied = {}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(round(1000 / fps))
+        self._timer.timeout.connect(self.flush)
+
+    def register(self, name, apply):
+        '''
+        :param name: Display target, e.g. the widget name
+        :param apply: Called with the latest value once per frame
+        '''
+        self._apply[name] = apply
+        self.received[name] = 0
+        self.applied[name] = 0
+
+    def post(self, name, value):
+        self._latest[name] = value
+        self.received[name] += 1
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def poster(self, name):
+        '''A one-argument callable posting to name, for connecting to a callback signal'''
+        return lambda value: self.post(name, value)
+
+    def flush(self):
+        '''Apply the latest value of every target that received one since the last frame'''
+        latest, self._latest = self._latest, {}
+        for name, value in latest.items():
+            self._apply[name](value)
+            self.applied[name] += 1
+
+    def counts(self):
+        '''{name: (received, applied)} since start'''
+        return {name: (self.received[name], self.applied[name]) for name in self._apply}
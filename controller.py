@@ -0,0 +1,974 @@
+import collections
+import logging
+import sys
+import time
+from enum import Enum, auto
+
+import numpy as np
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+from health import HealthMonitor
+from motionprofile import predictSequence, timeoutMs
+from sequenceplayer import Segment, SequencePlayer
+from stages import StageRegistry, ArrivalCheck, ROLES, FIELDS
+from timing import Timing
+from validation import validateTable
+from watcher import ConditionWatcher
+from writepipeline import WritePipeline
+
+log = logging.getLogger('')
+
+STOP = "0"
+PAUSE = "1"
+MOVE = "3"
+TIMEOUT_MS = 45000
+LOOP_SETTLE_MS = 500  # Between the dmlp and dtlp writes when opening/closing the loop
+ARRIVAL_TOL = 0.05  # A stage has arrived once its readback is this close to the setpoint
+HOME_TOL = 0.01  # VELO/ACCL readback tolerance when checking the home settings
+
+# Stage fields the state machine waits on through the watcher
+WATCHED_FIELDS = ['RBV', 'MOVN', 'VELO', 'ACCL']
+
+
+class TelSimStates(Enum):
+    CONNECTING = -1
+    INIT = 0
+    OFF = auto()
+    IDLE = auto()
+    MOVE_ALT = auto()
+    AWAIT_ALT = auto()
+    MOVE_WIND = auto()
+    AWAIT_WIND = auto()
+    STOPPED = auto()
+    CLEANUP = auto()
+    AWAIT_CLEANUP = auto()
+    MOVE_BOTH = auto()
+    AWAIT_BOTH = auto()
+    PAUSED = auto()
+
+
+# States in which the stages may be moving; the health monitor probes the stage channels while in one
+MOTION_STATES = {TelSimStates.MOVE_ALT, TelSimStates.AWAIT_ALT, TelSimStates.MOVE_WIND, TelSimStates.AWAIT_WIND,
+                 TelSimStates.MOVE_BOTH, TelSimStates.AWAIT_BOTH, TelSimStates.PAUSED, TelSimStates.CLEANUP,
+                 TelSimStates.AWAIT_CLEANUP}
+
+
+class TelSimEvents(Enum):
+    ENTER = 0  # Posted by setState() so each state runs its entry actions once
+    SETUP = auto()
+    CLOSE = auto()
+    START = auto()
+    STOP = auto()
+    CONDITION_MET = auto()
+    WRITES_DONE = auto()
+    WRITES_FAILED = auto()
+    PLAY_SEGMENT = auto()
+    TIMEOUT = auto()
+    CHANNEL_LOST = auto()  # A stage channel dropped or went stale
+    CHANNEL_RESTORED = auto()  # Every stage channel is healthy again
+
+
+class TelSimController(QtCore.QObject):
+    '''
+    The telescope simulator sequencing, independent of any window: homing, the altitude-then-wind move of each
+    setpoint, stopping, and sequence file playback. The stages come from a StageRegistry; every stage of a role
+    moves to that role's field of the setpoint.
+
+    The GUI drives it through the event methods (setup(), start(), stop(), close(), playSequenceFile()) and follows
+    it through the signals. Scripts can do the same from a QCoreApplication, or use the blocking calls (waitForState(),
+    move()), which run the Qt event loop until the controller gets there.
+    '''
+
+    stateChanged = pyqtSignal(object)
+    message = pyqtSignal(str)  # Errors and sequence file reports worth showing the operator
+    predicted = pyqtSignal(object)  # motionprofile.SequencePrediction of the move about to start
+    moveStarted = pyqtSignal(float)  # Predicted seconds of the alt or wind phase that has just started
+    progress = pyqtSignal(str)  # Sequence file playback report after each segment
+    arrived = pyqtSignal(str, float)  # 'alt' or 'wind', and backend seconds since that role's setpoints were sent
+    settled = pyqtSignal(str, float)  # The same, once the role's stages have also stopped moving
+    pendingChanged = pyqtSignal(list)
+
+    def __init__(self, timing=None, stages=None, parent=None):
+        '''
+        :param timing: timing.Timing to record transitions, events and dialog waits in; a new one if not given
+        :param stages: stages.StageRegistry of the stages to drive; loaded from stages.ini if not given
+        '''
+        super().__init__(parent)
+        self.timing = Timing() if timing is None else timing
+        self.stages = StageRegistry.load() if stages is None else stages
+        self.channels = {}
+        self.clock = None  # simulator.SimClock of a backend that simulates time; time.monotonic() if None
+        self.state = None
+        self._stateStart = None
+        self._events = collections.deque()
+        self._dispatching = False
+
+        # Asked before an operator-started move; scripts run unattended, so the default is always yes
+        self.confirm = lambda text: True
+
+        self.stateTimeout = QTimer(self)
+        self.stateTimeout.setSingleShot(True)
+        self.stateTimeout.timeout.connect(lambda: self.postStateEvent(TelSimEvents.TIMEOUT))
+        self.writes = WritePipeline(parent=self)
+        self.writes.pendingChanged.connect(lambda pending: self.pendingChanged.emit(self.pending()))
+        self.writes.groupDone.connect(lambda groupId: self.postStateEvent(TelSimEvents.WRITES_DONE, groupId))
+        self.writes.groupFailed.connect(
+            lambda groupId, message: self.postStateEvent(TelSimEvents.WRITES_FAILED, (groupId, message)))
+        self.pendingWrites = None
+        # Arrival and home conditions, evaluated over cached monitor values
+        self.watcher = ConditionWatcher(self)
+        self.watcher.met.connect(lambda watchId: self.postStateEvent(TelSimEvents.CONDITION_MET, watchId))
+        self.watcher.pendingChanged.connect(lambda pending: self.pendingChanged.emit(self.pending()))
+        self.pendingWatch = None
+        # Connection and update age of every stage channel; motion pauses while one is unhealthy
+        self.health = HealthMonitor(parent=self)
+        self.health.lost.connect(lambda name: self.postStateEvent(TelSimEvents.CHANNEL_LOST, name))
+        self.health.restored.connect(lambda: self.postStateEvent(TelSimEvents.CHANNEL_RESTORED))
+        self.stateChanged.connect(lambda state: self.health.setActive(state in MOTION_STATES))
+        self.resumeState = None  # Move state to go back to from PAUSED
+        self.resumeTimeoutMs = None  # What was left of the interrupted move's timeout
+        self.phaseTimeoutMs = None  # Timeout of the move phase in progress, paused or not
+        self.arrival = None  # stages.ArrivalCheck of the move in progress
+        self.error = None  # Why the last move or cleanup was stopped, raised by waitForState()
+        self.moveStart = None  # now() when the setpoints of the move phase in progress were sent
+        self.unsettled = set()  # Roles that have arrived, or are moving, and not yet come to rest
+        # Move both stages at once (MOVE_BOTH/AWAIT_BOTH) instead of alt first, then wind
+        self.parallel = False
+        self.player = None
+        self.queued = None  # Next segment of a sequence file, posted while the one before was still moving
+        self.setpoint = None
+        self.prediction = None
+        self.stateChanged.connect(self.sequencePlayerStateChanged)
+
+    def connectChannels(self, backend):
+        '''Create the stage channels from a backend, timing their reads and writes, and start the state machine'''
+        self.backend = backend
+        self.attach({key: self.timing.channel(backend.channel(name), name) for key, name in self.stages.channels()},
+                    getattr(backend, 'clock', None))
+
+    def attach(self, channels, clock=None):
+        '''
+        Take already created stage channels and start the state machine.
+
+        :param channels: {key: channel} for every key in self.stages.channels()
+        :param clock: The backend's simulator.SimClock, if it simulates time
+        '''
+        self.channels = dict(channels)
+        self.clock = clock
+        self.setState(TelSimStates.INIT)
+
+    def channel(self, stage, field):
+        '''
+        :param stage: stages.Stage
+        :param field: Motor record field, one of stages.FIELDS
+        '''
+        return self.channels[stage.key(field)]
+
+    def now(self):
+        '''Seconds on the backend's clock, which move predictions and timeouts are in: simulated time on a simulator'''
+        return time.monotonic() if self.clock is None else self.clock.now()
+
+    def clockSpeed(self):
+        '''Backend seconds per wall-clock second; 1 for a live backend, and for a simulator stepped by hand'''
+        return 1.0 if self.clock is None or self.clock.speed is None else self.clock.speed
+
+    def startTimeout(self, ms):
+        '''Start the state timeout to fire after ms of backend time'''
+        self.stateTimeout.start(round(ms / self.clockSpeed()))
+
+    def readback(self, role, field='RBV'):
+        '''Latest monitored value of a field of the first stage of a role'''
+        return self.watcher.values[self.stages.primary(role).key(field)]
+
+    def shutdown(self):
+        self.writes.shutdown()
+        self.health.shutdown()
+        self.watcher.shutdown()
+
+    # -----------------------------------------------------------------------------
+    def setup(self):
+        '''Leave OFF for IDLE'''
+        self.postStateEvent(TelSimEvents.SETUP)
+
+    def start(self, setpoint):
+        '''
+        Move to a setpoint from IDLE, asking confirm() first.
+
+        :param setpoint: sequenceplayer.Segment; its time is not used
+        '''
+        self.postStateEvent(TelSimEvents.START, setpoint)
+
+    def stop(self):
+        '''Stop every stage where it is'''
+        self.postStateEvent(TelSimEvents.STOP)
+
+    def close(self):
+        '''Home every stage and go back to OFF'''
+        self.postStateEvent(TelSimEvents.CLOSE)
+
+    def playSequenceFile(self, path):
+        '''
+        Play a turbulence sequence file through the state machine, segment by segment. Only starts from IDLE with no
+        other file playing, and if confirm() agrees. Each segment is checked by checkSegment() as it is streamed.
+
+        :param path: Sequence .txt file, see sequenceplayer.readSegments() for the format
+        :return: True if playback started
+        '''
+        if self.state != TelSimStates.IDLE or (self.player is not None and self.player.playing):
+            return False
+        try:
+            self.motionState()
+        except ValueError as e:
+            self.message.emit(f'Cannot play {path}: {e}')
+            return False
+        with self.timing.timed('dialog', 'confirm sequence file'):
+            confirmed = self.confirm(f"Play sequence file {path}?\n\nAre you sure you want to START?")
+        if not confirmed:
+            return False
+
+        self.queued = None
+        self.player = SequencePlayer(path, lambda segment: self.postStateEvent(TelSimEvents.PLAY_SEGMENT, segment),
+                                     self.checkSegment, parent=self)
+        self.player.progress.connect(self.progress)
+        self.player.warning.connect(self.message)
+        self.player.finished.connect(self.message)
+        self.player.start()
+        return True
+
+    def motionState(self):
+        '''
+        Where the stages are and how the alt stages move, to predict moves from
+
+        :return: (Segment of the wind and alt readbacks and the wind VELO/ACCL, [(VELO, ACCL) of each alt stage])
+        :raises ValueError: If a stage channel the moves are predicted from has not sent a value yet
+        '''
+        wind, alt = self.stages.primary('wind'), self.stages.primary('alt')
+        needed = [wind.key('RBV'), wind.key('VELO'), wind.key('ACCL'), alt.key('RBV')] + \
+            [stage.key(field) for stage in self.stages.role('alt') for field in ['VELO', 'ACCL']]
+        values = self.watcher.values
+        missing = [key for key in needed if key not in values]
+        if missing:
+            raise ValueError(f"no value yet from {', '.join(missing)}")
+        start = Segment(None, values[wind.key('RBV')], values[wind.key('VELO')], values[wind.key('ACCL')],
+                        values[alt.key('RBV')])
+        altMotion = [(values[stage.key('VELO')], values[stage.key('ACCL')]) for stage in self.stages.role('alt')]
+        return start, altMotion
+
+    def checkSegment(self, previous, segment, following):
+        '''
+        Check one segment of a playing sequence file: its setpoints against the stage limits, and its move, from the
+        previous segment (or where the stages are now), against the time until the following one is due.
+
+        :param previous: Segment played before, or None for the first
+        :param segment: Segment about to be played
+        :param following: Next Segment in the file, or None for the last
+        :return: validation.Violation list for segment
+        '''
+        start, altMotion = self.motionState()
+        rows = [segment] if following is None else [segment, following]
+        table = dict(zip(Segment._fields, np.array(rows, dtype=float).T))
+        with self.timing.timed('validate', 'sequence segment'):
+            violations = validateTable(table, self.stages, start if previous is None else previous, altMotion,
+                                       self.parallel)
+        return [violation for violation in violations if violation.row == 0]
+
+    def sequencePlayerStateChanged(self, state):
+        '''Tell the sequence player, if one is playing, when a segment arrives or is stopped'''
+        if self.player is None:
+            return
+        if state == TelSimStates.IDLE:
+            self.player.segmentDone()
+        elif state in [TelSimStates.STOPPED, TelSimStates.CLEANUP]:
+            self.player.stop()
+
+    def pending(self):
+        '''Descriptions of the writes and waits still in flight'''
+        return self.writes.pending() + self.watcher.pending()
+
+    # -----------------------------------------------------------------------------
+    def waitForState(self, states, timeout=None):
+        '''
+        Run the Qt event loop until the state machine is in one of states.
+
+        An error that stopped the move or cleanup in progress, such as a move TimeoutError, is raised from here, once.
+
+        :param states: TelSimStates member or list of them
+        :param timeout: Seconds to wait at most, or None to wait for ever
+        :return: The state reached
+        :raises TimeoutError: If timeout passes first
+        '''
+        if isinstance(states, TelSimStates):
+            states = [states]
+        reached = self._runUntil(lambda: self.state in states or self.error is not None, self.stateChanged, timeout)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        if not reached:
+            raise TimeoutError(f"Still in {self.state.name} after {timeout:0.1f} seconds waiting for "
+                               f"{', '.join(state.name for state in states)}")
+        return self.state
+
+    def waitForPlayback(self, timeout=None):
+        '''
+        Run the Qt event loop until the sequence file started by playSequenceFile() has finished or been stopped.
+
+        :param timeout: Seconds to wait at most, or None to wait for ever
+        :raises TimeoutError: If timeout passes first
+        '''
+        if self.player is None:
+            return
+        if not self._runUntil(lambda: not self.player.playing, self.player.finished, timeout):
+            raise TimeoutError(f"{self.player.path} still playing after {timeout:0.1f} seconds")
+
+    def wait(self, seconds):
+        '''Run the Qt event loop for a while, e.g. to dwell at a setpoint'''
+        self._runUntil(lambda: False, None, seconds)
+
+    def _runUntil(self, done, signal, timeout):
+        '''Run a nested event loop until done() is true, checking each time signal (if any) is emitted'''
+        if done():
+            return True
+
+        loop = QtCore.QEventLoop()
+        errors = []
+
+        def check(*args):
+            if done():
+                loop.quit()
+
+        def excepthook(kind, error, traceback):
+            errors.append(error)
+            loop.quit()
+
+        if signal is not None:
+            signal.connect(check)
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(loop.quit)
+        if timeout is not None:
+            timer.start(round(timeout * 1000))
+
+        # PyQt hands exceptions raised in slots to sys.excepthook; catch them for the caller
+        previousHook, sys.excepthook = sys.excepthook, excepthook
+        try:
+            loop.exec_()
+        finally:
+            sys.excepthook = previousHook
+            if signal is not None:
+                signal.disconnect(check)
+
+        if errors:
+            raise errors[0]
+        return done()
+
+    def move(self, alt, pos, vel, accel=None):
+        '''
+        Move to a setpoint from IDLE and wait until every stage has arrived.
+
+        :param alt: Altitude setpoint
+        :param pos: Wind position setpoint
+        :param vel: Wind velocity
+        :param accel: Wind acceleration time; the wind stage's home ACCL if not given
+        :return: Backend seconds from the start of the move until the wind stages arrived
+        :raises RuntimeError: If the move was stopped or never started
+        '''
+        if self.state != TelSimStates.IDLE:
+            raise RuntimeError(f"Can only move from IDLE, not {self.state.name}")
+        if accel is None:
+            accel = self.stages.primary('wind').home('ACCL')
+
+        start = self.now()
+        reached = []
+        self.stateChanged.connect(reached.append)
+        try:
+            self.start(Segment(None, pos, vel, accel, alt))
+            self.waitForState(TelSimStates.IDLE)
+        finally:
+            self.stateChanged.disconnect(reached.append)
+        if not {TelSimStates.AWAIT_WIND, TelSimStates.AWAIT_BOTH} & set(reached) or TelSimStates.STOPPED in reached:
+            raise RuntimeError(f"Move to alt {alt}, pos {pos} did not complete: {' > '.join(s.name for s in reached)}")
+        return self.now() - start
+
+    def waitForSettled(self, timeout=None):
+        '''
+        Run the Qt event loop until the stages of the last move have come to rest: arrival counts from inside the
+        tolerance, so they may still be finishing their moves when move() returns.
+
+        :param timeout: Seconds to wait at most, or None to wait for ever
+        :raises TimeoutError: If timeout passes first
+        '''
+        if not self._runUntil(lambda: not self.unsettled, self.settled, timeout):
+            raise TimeoutError(f"{' and '.join(sorted(self.unsettled))} TS still moving after {timeout:g} s")
+
+    # -----------------------------------------------------------------------------
+    def postStateEvent(self, event, value=None):
+        '''
+        Queue an event for the state machine and process the queue, unless we are already inside the state machine
+        (a transition, or a callback fired from a modal dialog), in which case the running dispatch picks it up.
+
+        :param event: TelSimEvents member
+        :param value: Optional payload, e.g. the group id for WRITES_DONE
+        '''
+        self._events.append((event, value))
+        self.dispatchStateEvents()
+
+    def dispatchStateEvents(self):
+        '''Run the state machine until the event queue is empty. Re-entrant calls return immediately.'''
+        if self._dispatching:
+            return
+
+        self._dispatching = True
+        try:
+            while self._events:
+                event, value = self._events.popleft()
+                with self.timing.timed('event', event.name):
+                    self.stateMachine(event, value)
+        finally:
+            self._dispatching = False
+
+    def setState(self, state):
+        '''
+        Transition the state machine. The new state's entry actions run before any other queued event.
+
+        :param state: TelSimStates member
+        '''
+        now = time.monotonic()
+        if self.state is not None:
+            # Time spent in the state being left
+            self.timing.record('state', self.state.name, now - self._stateStart, self._stateStart)
+        self.state = state
+        self._stateStart = now
+        self.stateChanged.emit(state)
+        self._events.appendleft((TelSimEvents.ENTER, None))
+        self.dispatchStateEvents()
+
+    def stateMachine(self, event, value=None):
+        """
+        State machine processing for a single event.
+
+        :param event: TelSimEvents member; ENTER is posted by setState() on every transition
+        :param value: Optional payload of the event
+        """
+
+        # Nothing to do until attach() moves on to INIT
+        if self.state == TelSimStates.CONNECTING:
+            return
+
+        # The next segment of a sequence file, posted while the one before is still moving: IDLE starts it
+        if event == TelSimEvents.PLAY_SEGMENT and self.state != TelSimStates.IDLE:
+            if self.player is not None and self.player.playing:
+                self.queued = value
+            return
+
+        # ----- STATE 0 ------------------------------------------------
+        elif self.state == TelSimStates.INIT:
+            if event != TelSimEvents.ENTER:
+                return
+
+            # The state machine waits on these through the watcher, which keeps their latest values
+            for stage in self.stages:
+                for field in WATCHED_FIELDS:
+                    self.watcher.add(stage.key(field), self.channel(stage, field))
+                    self.channel(stage, field).runCallbacks()
+
+            for stage in self.stages:
+                for field in FIELDS:
+                    self.health.add(stage.key(field), self.channel(stage, field), required=True)
+
+            self.setState(TelSimStates.OFF)
+            return
+
+        # ----- STATE 1 ------------------------------------------------
+        elif self.state == TelSimStates.OFF:
+            # If setup is pressed, advance to IDLE
+            if event == TelSimEvents.SETUP:
+                self.setState(TelSimStates.IDLE)
+                return
+
+            return
+
+        # ----- STATE 2 -----------------------------------------
+        elif self.state == TelSimStates.IDLE:
+            if event == TelSimEvents.ENTER and self.queued is not None:
+                event, value, self.queued = TelSimEvents.PLAY_SEGMENT, self.queued, None
+
+            if event == TelSimEvents.START:
+                if self.player is not None and self.player.playing:
+                    return
+                if not self.health.healthy():
+                    self.message.emit(f"Not moving: {', '.join(self.health.unhealthy())} not connected or stale")
+                    return
+                self.setpoint = value
+                self.confirmMove = True
+                self.error = None
+                self.setState(TelSimStates.MOVE_BOTH if self.parallel else TelSimStates.MOVE_ALT)
+                return
+
+            # Segments from a sequence file are already confirmed; one posted before the file was stopped is dropped
+            if event == TelSimEvents.PLAY_SEGMENT:
+                if self.player is None or not self.player.playing:
+                    return
+                if not self.health.healthy():
+                    self.message.emit(f"Stopping the sequence: {', '.join(self.health.unhealthy())} not connected "
+                                      f"or stale")
+                    self.setState(TelSimStates.STOPPED)
+                    return
+                self.setpoint = value
+                self.confirmMove = False
+                self.error = None
+                self.setState(TelSimStates.MOVE_BOTH if self.parallel else TelSimStates.MOVE_ALT)
+                return
+
+            if event == TelSimEvents.CLOSE:
+                self.error = None
+                self.setState(TelSimStates.CLEANUP)
+                return
+
+            return
+
+        # ----- STATE 3 -----------------------------------------
+        elif self.state == TelSimStates.MOVE_ALT:
+            # The move is timed from sending the setpoints, and its timeout from when the puts have completed
+            if event == TelSimEvents.WRITES_DONE and value == self.pendingWrites:
+                self.moveStarted.emit(self.prediction.alt)
+                self.startTimeout(self.moveTimeoutMs(self.prediction.alt))
+                self.setState(TelSimStates.AWAIT_ALT)
+                return
+
+            if event == TelSimEvents.WRITES_FAILED and value[0] == self.pendingWrites:
+                self.message.emit(f'Alt setpoint write failed: {value[1]}')
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event != TelSimEvents.ENTER:
+                return
+
+            if self.predictMove():
+                self.moveStart = self.now()
+                self.pendingWrites, _ = self.writes.group('alt setpoint', self.setpointWrites(['alt']))
+                return
+            else:
+                self.setState(TelSimStates.IDLE)
+                return
+
+        # ----- STATE 4 -----------------------------------------
+        elif self.state == TelSimStates.AWAIT_ALT:
+            if event == TelSimEvents.ENTER:
+                # Met at once if the stages are already at the target
+                self.pendingWatch = self.watchArrival(['alt'], 'alt arriving')
+                return
+
+            if event == TelSimEvents.CONDITION_MET and value == self.pendingWatch:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.MOVE_WIND)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.CHANNEL_LOST:
+                self.pause(value)
+                return
+
+            if event == TelSimEvents.TIMEOUT:
+                self.fail(TimeoutError(f"Alt TS took more than {self.phaseTimeoutMs / 1000:0.1f} seconds to move "
+                                       f"(predicted {self.prediction.alt:0.2f} s)"))
+                return
+
+            return
+
+        # ----- STATE 5 -----------------------------------------
+        elif self.state == TelSimStates.MOVE_WIND:
+            if event == TelSimEvents.ENTER:
+                self.moveStart = self.now()
+                self.pendingWrites, _ = self.writes.group('wind setpoint', self.setpointWrites(['wind']))
+                return
+
+            if event == TelSimEvents.WRITES_DONE and value == self.pendingWrites:
+                self.moveStarted.emit(self.prediction.wind)
+                self.startTimeout(self.moveTimeoutMs(self.prediction.wind))
+                self.setState(TelSimStates.AWAIT_WIND)
+                return
+
+            if event == TelSimEvents.WRITES_FAILED and value[0] == self.pendingWrites:
+                self.message.emit(f'Wind setpoint write failed: {value[1]}')
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            return
+
+        # ----- STATE 6 -----------------------------------------
+        elif self.state == TelSimStates.AWAIT_WIND:
+            if event == TelSimEvents.ENTER:
+                self.pendingWatch = self.watchArrival(['wind'], 'wind arriving')
+                return
+
+            if event == TelSimEvents.CONDITION_MET and value == self.pendingWatch:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.IDLE)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.CHANNEL_LOST:
+                self.pause(value)
+                return
+
+            if event == TelSimEvents.TIMEOUT:
+                self.fail(TimeoutError(f"Wind TS took more than {self.phaseTimeoutMs / 1000:0.1f} seconds to "
+                                       f"move (predicted {self.prediction.wind:0.2f} s)"))
+                return
+
+            return
+
+        # ----- STATE 7 -----------------------------------------
+        elif self.state == TelSimStates.STOPPED:
+            if event != TelSimEvents.ENTER:
+                return
+
+            # Setpoint writes still going out must not restart a stage after the stop: send no more of them, and
+            # stop once those already sent have landed
+            inflight = self.writes.cancel(self.pendingWrites)
+            self.pendingWrites = None
+            self.stateTimeout.stop()
+            self.writes.group('stop', [[(self.channel(stage, 'SPMG'), STOP, True) for stage in self.stages]],
+                              after=inflight)
+            self.watcher.cancel()
+            self.unsettled.clear()
+            self.queued = None
+            self.resumeTimeoutMs = None
+            self.setState(TelSimStates.IDLE)
+            return
+
+        # ----- STATE 8 -----------------------------------------
+        elif self.state == TelSimStates.CLEANUP:
+            if event == TelSimEvents.ENTER:
+                # The home VAL puts complete when the stages have finished moving
+                self.startTimeout(TIMEOUT_MS)
+                self.pendingWrites, _ = self.writes.group('home stages', [
+                    [(self.channel(stage, 'SPMG'), MOVE, True) for stage in self.stages],
+                    [(self.channel(stage, field), stage.home(field), True) for stage in self.stages
+                     for field in ['VELO', 'ACCL'] if stage.home(field) is not None],
+                    [(self.channel(stage, 'VAL'), stage.home('VAL'), True) for stage in self.stages]])
+                return
+
+            if event == TelSimEvents.WRITES_DONE and value == self.pendingWrites:
+                self.setState(TelSimStates.AWAIT_CLEANUP)
+                return
+
+            if event == TelSimEvents.WRITES_FAILED and value[0] == self.pendingWrites:
+                self.message.emit(f'Home write failed: {value[1]}')
+                self.setState(TelSimStates.AWAIT_CLEANUP)
+                return
+
+            if event == TelSimEvents.TIMEOUT:
+                # The home VAL puts only complete once the stages stop, so the stop must not wait for them
+                self.writes.cancel(self.pendingWrites)
+                self.pendingWrites = None
+                self.fail(TimeoutError(f"Cleanup took more than {TIMEOUT_MS / 1000:0.0f} seconds"))
+                return
+
+            return
+
+        # ----- STATE 9 -----------------------------------------
+        elif self.state == TelSimStates.AWAIT_CLEANUP:
+            # Done once every stage has stopped and is back on its home VELO/ACCL. A MOVN of 0 is only trusted from a
+            # stage already at home or seen moving since the home write completed: the monitor can lag the put
+            # completion (e.g. through the telemetry proxy), and still show the stage at rest from before
+            if event == TelSimEvents.ENTER:
+                moving = [stage.key('MOVN') for stage in self.stages]
+                readbacks = [(stage.key('RBV'), stage.home('VAL')) for stage in self.stages]
+                settings = [(stage.key(field), stage.home(field)) for stage in self.stages
+                            for field in ['VELO', 'ACCL'] if stage.home(field) is not None]
+                homes = np.array([home for _, home in settings])
+                moved = set()
+
+                def settled(values):
+                    moved.update(key for key in moving if values[key])
+                    current = np.fromiter((values[key] for key, _ in settings), dtype=float, count=len(settings))
+                    return all(not values[key] and (key in moved or abs(values[rbv] - home) <= ARRIVAL_TOL)
+                               for key, (rbv, home) in zip(moving, readbacks)) and \
+                        bool(np.all(np.abs(current - homes) <= HOME_TOL))
+
+                self.pendingWatch = self.watcher.watch(moving + [key for key, _ in readbacks + settings], settled,
+                                                       'stages settling home')
+                return
+
+            if event == TelSimEvents.CONDITION_MET and value == self.pendingWatch:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.OFF)
+                return
+
+            # The stages keep homing without their channels; only the timeout waits for them to come back
+            if event == TelSimEvents.CHANNEL_LOST:
+                self.stateTimeout.stop()
+                self.message.emit(f'{value} lost while homing; waiting for it to come back')
+                return
+
+            if event == TelSimEvents.CHANNEL_RESTORED:
+                self.startTimeout(TIMEOUT_MS)
+                return
+
+            if event == TelSimEvents.TIMEOUT:
+                self.fail(TimeoutError(f"Cleanup took more than {TIMEOUT_MS / 1000:0.0f} seconds"))
+                return
+
+            return
+
+        # ----- STATE 10 -----------------------------------------
+        elif self.state == TelSimStates.MOVE_BOTH:
+            if event == TelSimEvents.ENTER:
+                if not self.predictMove():
+                    self.setState(TelSimStates.IDLE)
+                    return
+                # Same per-stage ordering as MOVE_ALT and MOVE_WIND, with every stage's writes side by side
+                self.moveStart = self.now()
+                self.pendingWrites, _ = self.writes.group('alt and wind setpoints', self.setpointWrites(ROLES))
+                return
+
+            if event == TelSimEvents.WRITES_DONE and value == self.pendingWrites:
+                self.moveStarted.emit(self.prediction.total)
+                self.startTimeout(self.moveTimeoutMs(self.prediction.total))
+                self.setState(TelSimStates.AWAIT_BOTH)
+                return
+
+            if event == TelSimEvents.WRITES_FAILED and value[0] == self.pendingWrites:
+                self.message.emit(f'Setpoint write failed: {value[1]}')
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            return
+
+        # ----- STATE 11 -----------------------------------------
+        elif self.state == TelSimStates.AWAIT_BOTH:
+            # One arrival check over every stage; each role's arrival time is reported as it comes in
+            if event == TelSimEvents.ENTER:
+                self.pendingWatch = self.watchArrival(ROLES, 'alt and wind arriving')
+                return
+
+            if event == TelSimEvents.CONDITION_MET and value == self.pendingWatch:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.IDLE)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.stateTimeout.stop()
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            if event == TelSimEvents.CHANNEL_LOST:
+                self.pause(value)
+                return
+
+            if event == TelSimEvents.TIMEOUT:
+                self.fail(TimeoutError(f"{' and '.join(self.arrival.waiting())} TS took more than "
+                                       f"{self.phaseTimeoutMs / 1000:0.1f} seconds to move (predicted alt "
+                                       f"{self.prediction.alt:0.2f} s, wind {self.prediction.wind:0.2f} s)"))
+                return
+
+            return
+
+        # ----- STATE 12 -----------------------------------------
+        elif self.state == TelSimStates.PAUSED:
+            # The stages are held where they are until every stage channel is healthy, then the interrupted move is
+            # planned again from the current readbacks
+            if event == TelSimEvents.ENTER:
+                pause = [(self.channel(stage, 'SPMG'), PAUSE, True) for stage in self.stages
+                         if self.health.channels[stage.key('SPMG')].connected]
+                if pause:
+                    self.writes.group('pause', [pause])
+                return
+
+            if event == TelSimEvents.CHANNEL_RESTORED:
+                self.message.emit('Stage channels are back; resuming the move')
+                self.confirmMove = False
+                self.setState(self.resumeState)
+                return
+
+            if event == TelSimEvents.STOP:
+                self.setState(TelSimStates.STOPPED)
+                return
+
+            return
+
+    def moveTimeoutMs(self, seconds):
+        '''
+        Timeout of a move phase predicted to take seconds. A phase resumed after PAUSED only gets what was left of its
+        timeout, so a stage that never moves still times out however often the move is paused.
+        '''
+        if self.resumeTimeoutMs is None:
+            self.phaseTimeoutMs = timeoutMs(seconds)
+            return self.phaseTimeoutMs
+        remaining, self.resumeTimeoutMs = self.resumeTimeoutMs, None
+        return remaining
+
+    def fail(self, error):
+        '''
+        Stop the move or cleanup in progress because of error. The error is shown through message and raised to a
+        script waiting in waitForState(); the window carries on.
+        '''
+        self.watcher.cancel(self.pendingWatch)
+        self.error = error
+        self.message.emit(str(error))
+        self.setState(TelSimStates.STOPPED)
+
+    def pause(self, name):
+        '''Leave an AWAIT state for PAUSED because channel name has dropped or gone stale'''
+        self.resumeTimeoutMs = max(round(self.stateTimeout.remainingTime() * self.clockSpeed()), 0)
+        self.stateTimeout.stop()
+        self.watcher.cancel(self.pendingWatch)
+        self.resumeState = {TelSimStates.AWAIT_ALT: TelSimStates.MOVE_ALT,
+                            TelSimStates.AWAIT_WIND: TelSimStates.MOVE_WIND,
+                            TelSimStates.AWAIT_BOTH: TelSimStates.MOVE_BOTH}[self.state]
+        self.message.emit(f'{name} {self.health.channels[name].describe()}; pausing the move')
+        self.setState(TelSimStates.PAUSED)
+
+    def setpointWrites(self, roles):
+        '''
+        Write stages sending self.setpoint to the stages of roles: Go, then the wind stages' ACCL and VELO (the motor
+        record takes them at the start of a move, so they must land before VAL), then VAL.
+
+        :param roles: Keys of stages.ROLES
+        :return: Stages for WritePipeline.group()
+        '''
+        stages = [stage for stage in self.stages if stage.role in roles]
+        go = [(self.channel(stage, 'SPMG'), MOVE, True) for stage in stages]
+        settings = [(self.channel(stage, field), float(value), True) for stage in stages if stage.role == 'wind'
+                    for field, value in [('ACCL', self.setpoint.accel), ('VELO', self.setpoint.velocity)]]
+        # VAL puts complete when the move does, so they are not waited on
+        targets = [(self.channel(stage, 'VAL'), self.target(stage), False) for stage in stages]
+        return [writes for writes in [go, settings, targets] if writes]
+
+    def target(self, stage):
+        '''Position a stage moves to for self.setpoint'''
+        return float(getattr(self.setpoint, ROLES[stage.role]))
+
+    def watchArrival(self, roles, description):
+        '''
+        Watch for every stage of roles to arrive at self.setpoint, reporting each role's arrival through arrived, and
+        its coming to rest through settled.
+
+        :return: Watch id
+        '''
+        stages = [stage for stage in self.stages if stage.role in roles]
+        self.unsettled.update(roles)
+        self.arrival = ArrivalCheck(stages, [self.target(stage) for stage in stages], ARRIVAL_TOL, self.reached)
+        return self.watcher.watch(self.arrival.names, self.arrival, description)
+
+    def reached(self, role):
+        '''Report the arrival of a role's stages, and watch for them to stop moving'''
+        start = self.moveStart
+        self.arrived.emit(role, self.now() - start)
+        moving = [stage.key('MOVN') for stage in self.stages if stage.role == role]
+
+        def stopped(values):
+            if any(values[key] for key in moving):
+                return False
+            self.unsettled.discard(role)
+            self.settled.emit(role, self.now() - start)
+            return True
+
+        self.watcher.watch(moving, stopped, f'{role} settling')
+
+    def predictMove(self):
+        '''
+        Predict the move to self.setpoint, show it, and ask confirm() if the move was started by the operator.
+
+        :return: True to go ahead with the move
+        '''
+        # Every stage follows the motor record's trapezoidal profile; a role takes as long as its slowest stage
+        moves = {role: [] for role in ROLES}
+        for stage in self.stages:
+            distance = self.target(stage) - float(self.channel(stage, 'RBV').read())
+            if stage.role == 'wind':
+                moves['wind'].append((distance, stage.clamp('VELO', self.setpoint.velocity),
+                                      stage.clamp('ACCL', self.setpoint.accel)))
+            else:
+                moves['alt'].append((distance, float(self.channel(stage, 'VELO').read()),
+                                     float(self.channel(stage, 'ACCL').read())))
+        self.prediction = predictSequence(moves['alt'], moves['wind'], self.parallel)
+        self.predicted.emit(self.prediction)
+        if not self.confirmMove:
+            return True
+        together = 'together with' if self.parallel else 'then'
+        with self.timing.timed('dialog', 'confirm move'):
+            return self.confirm(
+                f"Altitude move {self.prediction.alt:0.2f} s, {together} wind move {self.prediction.wind:0.2f} s."
+                f"\n\nAre you sure you want to START?")
+
+
+def runHeadless(backend, setpoint=None, path=None, sweep=None, parallel=False, timingPath=None, stages=None):
+    '''
+    Home the stages, make one move, play a sequence file or run a sweep, then home them again, with no window.
+
+    :param backend: KeckBackend or simulator.SimBackend
+    :param setpoint: sequenceplayer.Segment to move to
+    :param path: Sequence file to play instead
+    :param sweep: sweep.Sweep to run instead
+    :param parallel: Move the alt and wind stages at the same time
+    :param timingPath: Export the timings here as JSON lines at the end, if given
+    :param stages: stages.StageRegistry; loaded from stages.ini if not given
+    :return: Process exit status
+    '''
+    application = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication(sys.argv)
+    controller = TelSimController(stages=stages)
+    controller.parallel = parallel
+    controller.arrived.connect(lambda stage, seconds: log.info(f'{stage} arrived after {seconds:0.2f} s'))
+    controller.stateChanged.connect(lambda state: log.info(f'STATE: {state.name}'))
+    controller.message.connect(log.info)
+    controller.predicted.connect(lambda prediction: log.info(
+        f'Predicted altitude move {prediction.alt:0.2f} s, wind move {prediction.wind:0.2f} s'))
+    application.aboutToQuit.connect(controller.shutdown)
+    status = []
+
+    def script():
+        try:
+            controller.connectChannels(backend)
+            controller.setup()
+            controller.waitForState(TelSimStates.IDLE)
+            if path is not None:
+                if not controller.playSequenceFile(path):
+                    raise RuntimeError(f'Could not play {path}')
+                controller.waitForPlayback()
+                controller.waitForState(TelSimStates.IDLE)
+            elif sweep is not None:
+                sweep.run(controller, report=lambda result: log.info(
+                    f'Point {result.index}: alt {result.altitude}, pos {result.position}, loop {result.loop}, '
+                    f'settle {result.settleAlt:0.2f}/{result.settleWind:0.2f} s'))
+                log.info(f'Predicted stage travel {sweep.predicted[1]:0.1f} s in sweep order, '
+                         f'{sweep.predicted[0]:0.1f} s as given')
+            elif setpoint is not None:
+                seconds = controller.move(setpoint.altitude, setpoint.position, setpoint.velocity, setpoint.accel)
+                log.info(f'Move took {seconds:0.2f} s')
+            controller.close()
+            controller.waitForState(TelSimStates.OFF)
+            status.append(0)
+        except Exception as e:
+            log.error(f'{type(e).__name__}: {e}')
+            status.append(1)
+        application.exit(status[0])
+
+    QTimer.singleShot(0, script)
+    result = backend.run(application)
+    if timingPath is not None:
+        controller.timing.export(timingPath)
+    return status[0] if status else result
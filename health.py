@@ -0,0 +1,290 @@
+import concurrent.futures
+import math
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+PROBE_MS = 250  # Check interval while probing: during a move, or while a channel is suspect
+IDLE_POLL_MS = 1000  # Otherwise, for the isConnected() of channels with no connectionCallback; no reads
+PROBE_S = 0.5  # While probing, each required channel is read this often, to check it against its monitor
+PROBE_TIMEOUT_S = 0.5  # A probe read still running after this long counts as a dead connection
+PROBE_WORKERS = 4
+RECONNECT_TIMEOUT_S = 5.0  # A reconnect still running after this long has failed
+RECONNECT_WORKERS = 2
+STALE_S = 1.0  # A channel is stale once a probe has shown a value its monitor has not sent for this long
+BACKOFF_MIN_S = 0.5  # First reconnect attempt after a channel drops, doubling after each failure
+BACKOFF_MAX_S = 30.0
+VALUE_TOL = 1e-5  # Relative (near zero, absolute) difference of a read from its monitor's value that is still the same
+
+
+def sameValue(a, b, tolerance=VALUE_TOL):
+    '''
+    True if a monitor value and a read value are the same: as numbers within tolerance where they are numbers, so a
+    value that went through text or single precision on one side still matches
+    '''
+    try:
+        return math.isclose(float(a), float(b), rel_tol=tolerance, abs_tol=tolerance)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+class ChannelHealth:
+    '''Connection state and update age of one channel or keyword'''
+
+    def __init__(self, name, channel, required):
+        self.name = name
+        self.channel = channel
+        self.required = required
+        self.connected = True
+        self.stale = False
+        self.linkUp = True  # As last reported by the channel's connectionCallback, if it has one
+        self.polled = False  # Connection only known from isConnected(), which is polled
+        self.lastUpdate = time.monotonic()
+        self.lastValue = None  # Latest monitor value
+        self.behindSince = None  # When a probe first showed a value the monitor has not sent since
+        self.probe = None  # ([when the read started running, or None while it waits for a thread], future) in flight
+        self.lastProbe = None
+        self.probeFailed = False
+        self.backoff = BACKOFF_MIN_S
+        self.retryAt = None
+        self.reconnecting = None  # (started, future) of the reconnect in flight
+        self.reconnects = 0
+
+    @property
+    def healthy(self):
+        return self.connected and not self.stale
+
+    @property
+    def suspect(self):
+        '''Unhealthy, or a probe has seen a value its monitor has not sent yet'''
+        return not self.healthy or self.behindSince is not None
+
+    def age(self, now=None):
+        '''Seconds since the last update'''
+        return (time.monotonic() if now is None else now) - self.lastUpdate
+
+    def describe(self, now=None):
+        now = time.monotonic() if now is None else now
+        if not self.connected:
+            if self.retryAt is None:
+                return 'disconnected'
+            return f'disconnected, reconnecting in {max(self.retryAt - now, 0):0.1f} s'
+        if self.stale:
+            return f'stale, monitor behind its reads for {now - self.behindSince:0.1f} s'
+        return f'connected, updated {self.age(now):0.1f} s ago'
+
+
+class HealthMonitor(QtCore.QObject):
+    '''
+    Connection state and monitor freshness of a set of channels, so a dead gateway is noticed in about a second
+    rather than when a move times out.
+
+    A channel is disconnected as soon as its connectionCallback(False) says so, or, for channels without one, when
+    its isConnected() does; those are polled every IDLE_POLL_MS. Nothing is read while the stages are at rest. While
+    active (a move is in progress, see setActive()) or while a channel is suspect, the required channels are probed:
+    read every PROBE_S on their own threads. A probe read that fails or does not return within PROBE_TIMEOUT_S
+    disconnects the channel, and one that returns a value its monitor has not delivered for STALE_S makes it stale:
+    the gateway answers but the subscription has gone quiet. Probe reads go to the channel behind a
+    timing.TimedChannel, so they do not count in its read stats. Disconnected channels with a reconnect() (see
+    backend.KeckChannel) are retried on threads of their own, with exponential backoff from BACKOFF_MIN_S up to
+    BACKOFF_MAX_S.
+
+    changed(name) is emitted when a channel becomes healthy or unhealthy; lost(name) when a required one does, and
+    restored() once every required channel is healthy again.
+    '''
+
+    changed = pyqtSignal(str)
+    lost = pyqtSignal(str)
+    restored = pyqtSignal()
+
+    def __init__(self, probeMs=PROBE_MS, staleS=STALE_S, probeS=PROBE_S, parent=None):
+        super().__init__(parent)
+        self.probeMs = probeMs
+        self.staleS = staleS
+        self.probeS = probeS
+        self.active = False
+        self.channels = {}
+        self._connections = []  # (signal, slot) of every channel signal connected, to disconnect on shutdown
+        self._probes = concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS,
+                                                             thread_name_prefix='telsim-probe')
+        self._reconnects = concurrent.futures.ThreadPoolExecutor(max_workers=RECONNECT_WORKERS,
+                                                                 thread_name_prefix='telsim-reconnect')
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.poll)
+
+    def add(self, name, channel, required=False):
+        '''
+        Start tracking a channel or keyword.
+
+        :param name: Key the channel is reported under
+        :param required: Motion cannot go on while this channel is unhealthy; only required channels are probed
+        '''
+        entry = ChannelHealth(name, getattr(channel, 'untimed', channel), required)
+        self.channels[name] = entry
+        # kPyQt channels and keywords do not all have both signals
+        for signal in ['floatCallback', 'stringCallback']:
+            callback = getattr(entry.channel, signal, None)
+            if callback is not None:
+                self._connect(callback, lambda value: self.touch(name, value))
+        connection = getattr(entry.channel, 'connectionCallback', None)
+        if connection is not None:
+            self._connect(connection, lambda connected: self.connection(name, connected))
+        else:
+            entry.polled = getattr(entry.channel, 'isConnected', None) is not None
+        self._schedule()
+
+    def _connect(self, signal, slot):
+        signal.connect(slot)
+        self._connections.append((signal, slot))
+
+    def setActive(self, active):
+        '''A move has started or ended: the required channels are probed while one is in progress'''
+        if active == self.active:
+            return
+        self.active = active
+        if active:
+            self.poll()
+        else:
+            self._schedule()
+
+    def touch(self, name, value=None):
+        '''A monitor update arrived'''
+        entry = self.channels[name]
+        entry.lastUpdate = time.monotonic()
+        entry.lastValue = value
+        entry.behindSince = None
+        if entry.stale:
+            self._set(entry, entry.connected, False)
+
+    def connection(self, name, connected):
+        '''A channel's connectionCallback reported that it has connected or disconnected'''
+        entry = self.channels[name]
+        entry.linkUp = connected
+        self._check(entry, time.monotonic())
+        self._schedule()
+
+    def healthy(self):
+        '''True if every required channel is connected and up to date'''
+        return all(entry.healthy for entry in self.channels.values() if entry.required)
+
+    def unhealthy(self):
+        '''Names of the channels that are disconnected or stale'''
+        return [name for name, entry in self.channels.items() if not entry.healthy]
+
+    def shutdown(self):
+        '''Stop checking, and hear nothing more from the channels, which may outlive this monitor'''
+        for signal, slot in self._connections:
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        self._connections = []
+        self._timer.stop()
+        self._probes.shutdown(wait=False)
+        self._reconnects.shutdown(wait=False)
+
+    def poll(self):
+        now = time.monotonic()
+        for entry in self.channels.values():
+            self._check(entry, now)
+        self._schedule()
+
+    def _schedule(self):
+        '''Run the timer quickly while probing, slowly while isConnected() needs polling, and otherwise not at all'''
+        entries = self.channels.values()
+        if self.active or any(entry.suspect or entry.reconnecting is not None for entry in entries):
+            interval = self.probeMs
+        elif any(entry.polled for entry in entries):
+            interval = IDLE_POLL_MS
+        else:
+            self._timer.stop()
+            return
+        if not self._timer.isActive() or self._timer.interval() != interval:
+            self._timer.start(interval)
+
+    def _check(self, entry, now):
+        if entry.required and (self.active or entry.suspect) and entry.reconnecting is None:
+            self._probe(entry, now)
+        connected = entry.linkUp and not entry.probeFailed
+        isConnected = getattr(entry.channel, 'isConnected', None)
+        if connected and isConnected is not None:
+            connected = bool(isConnected())
+        if not connected:
+            connected = self._retry(entry, now)
+        stale = connected and entry.behindSince is not None and now - entry.behindSince > self.staleS
+        self._set(entry, connected, stale)
+
+    def _probe(self, entry, now):
+        '''Collect the last probe read of a channel, and start the next one when it is due'''
+        if entry.probe is not None:
+            (started,), future = entry.probe
+            if not future.done():
+                # Timed from when the read started, not while it waited for a thread
+                entry.probeFailed = entry.probeFailed or (started is not None and now - started > PROBE_TIMEOUT_S)
+                return
+            entry.probe = None
+            entry.probeFailed = future.exception() is not None
+            if not entry.probeFailed:
+                value = future.result()
+                if entry.lastValue is None:
+                    # Nothing to compare with until the monitor has sent something; its first value may predate add()
+                    entry.lastValue = value
+                elif not sameValue(value, entry.lastValue) and entry.lastUpdate < started and entry.behindSince is None:
+                    # The monitor may still be delivering what the read saw; touch() clears this when it does
+                    entry.behindSince = started
+        if entry.lastProbe is None or now - entry.lastProbe >= self.probeS:
+            entry.lastProbe = now
+            started = [None]
+            entry.probe = (started, self._probes.submit(self._read, entry.channel, started))
+
+    @staticmethod
+    def _read(channel, started):
+        started[0] = time.monotonic()
+        return channel.read()
+
+    def _retry(self, entry, now):
+        '''Reconnect a disconnected channel in the background if its backoff has run out; True once it is back'''
+        if entry.reconnecting is not None:
+            started, future = entry.reconnecting
+            if not future.done() and now - started <= RECONNECT_TIMEOUT_S:
+                return False
+            entry.reconnecting = None
+            if future.done() and future.exception() is None and future.result():
+                # A probe stuck on the old connection is abandoned
+                entry.probe = None
+                entry.probeFailed = False
+                entry.linkUp = True
+                return True
+            entry.backoff = min(entry.backoff * 2, BACKOFF_MAX_S)
+            entry.retryAt = now + entry.backoff
+            return False
+
+        if entry.retryAt is None:
+            entry.retryAt = now + entry.backoff
+            return False
+        reconnect = getattr(entry.channel, 'reconnect', None)
+        if now < entry.retryAt or reconnect is None:
+            return False
+        entry.reconnects += 1
+        entry.reconnecting = (now, self._reconnects.submit(reconnect))
+        return False
+
+    def _set(self, entry, connected, stale):
+        wasHealthy = entry.healthy
+        if connected and not entry.connected:
+            entry.backoff = BACKOFF_MIN_S
+            entry.retryAt = None
+            # Whatever was last received is no newer than the reconnection
+            entry.lastUpdate = time.monotonic()
+            entry.behindSince = None
+        entry.connected = connected
+        entry.stale = stale
+        if entry.healthy == wasHealthy:
+            return
+        self.changed.emit(entry.name)
+        if entry.required:
+            if not entry.healthy:
+                self.lost.emit(entry.name)
+            elif self.healthy():
+                self.restored.emit()
@@ -0,0 +1,158 @@
+import os
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QProcess, QTimer, pyqtSignal
+
+# Where the Other GUIs menu runs its GUIs, and the script that starts them
+SSH_HOST = 'k1obsao@k1aoserver-new'
+OTHER_GUI_COMMAND = '/kroot/rel/ao/qfix/setup_ao.csh'
+
+# Every launch shares one SSH master connection, which stays open this long after the last session ends, so each
+# launch after the first only opens a channel on it instead of a new handshake
+CONTROL_PATH = os.path.join(os.path.expanduser('~'), '.ssh', 'telsim-%C')
+CONTROL_PERSIST_S = 600
+
+SSH_FAILED = 255  # ssh's own exit status when it could not connect
+KILL_AFTER_MS = 3000  # From asking a child to stop to killing it
+FINISHED_KEPT = 10  # Finished children still listed
+
+
+class Child:
+    '''One launched GUI: its process, and how it ended once it has'''
+
+    def __init__(self, name, process):
+        self.name = name
+        self.process = process
+        self.started = time.monotonic()
+        self.ended = None
+        self.exitCode = None
+        self.error = None
+
+    @property
+    def running(self):
+        return self.ended is None
+
+    def describe(self):
+        '''One line for the menu, e.g. "AO: running 2:05 (pid 1234)"'''
+        elapsed = int((time.monotonic() if self.running else self.ended) - self.started)
+        duration = f'{elapsed // 60}:{elapsed % 60:02d}'
+        if self.error is not None:
+            return f'{self.name}: {self.error}'
+        if self.running:
+            return f'{self.name}: running {duration} (pid {self.process.processId()})'
+        if self.exitCode == SSH_FAILED:
+            return f'{self.name}: SSH connection failed'
+        return f'{self.name}: exited {self.exitCode} after {duration}'
+
+
+class ProcessLauncher(QtCore.QObject):
+    '''
+    Starts external GUIs without blocking the Qt event loop, and keeps track of them until they exit.
+
+    Each GUI runs as an ssh child process sharing one multiplexed master connection (ControlMaster), which warm() can
+    open ahead of the first launch. Setting command runs that local command instead of ssh, to try the menu without
+    the AO server. Closing the GUI (shutdown()) ends the sessions it started.
+    '''
+
+    changed = pyqtSignal()  # A child started or finished
+    message = pyqtSignal(str)
+
+    def __init__(self, host=SSH_HOST, command=None, parent=None):
+        '''
+        :param host: user@host the GUIs run on
+        :param command: Local command (argument list) run instead of ssh, or None
+        '''
+        super().__init__(parent)
+        self.host = host
+        self.command = command
+        self.children = []
+        self._master = None
+
+    def sshArguments(self):
+        return ['-o', 'ControlMaster=auto', '-o', f'ControlPath={CONTROL_PATH}',
+                '-o', f'ControlPersist={CONTROL_PERSIST_S}']
+
+    def warm(self):
+        '''
+        Open the shared SSH connection in the background, if it is not already open or opening, so the next launch
+        does not wait for the handshake.
+        '''
+        if self.command is not None or self._master is not None:
+            return
+        self._master = QProcess(self)
+        self._master.setProcessChannelMode(QProcess.ForwardedChannels)
+        # With ControlMaster=auto this connects only if there is no master yet, which then persists after "true"
+        self._master.finished.connect(self._masterDone)
+        self._master.errorOccurred.connect(lambda error: self._masterDone())
+        self._master.start('ssh', self.sshArguments() + [self.host, 'true'])
+
+    def _masterDone(self, *args):
+        if self._master is not None:
+            self._master.deleteLater()
+            self._master = None
+
+    def launch(self, name, remoteCommand=OTHER_GUI_COMMAND):
+        '''
+        Start a GUI and return at once.
+
+        :param name: Shown in the menu and messages
+        :param remoteCommand: Command run on the host through ssh
+        :return: Child
+        '''
+        if self.command is not None:
+            program, arguments = self.command[0], self.command[1:]
+        else:
+            program, arguments = 'ssh', self.sshArguments() + [self.host, remoteCommand]
+        process = QProcess(self)
+        process.setProcessChannelMode(QProcess.ForwardedChannels)
+        child = Child(name, process)
+        process.finished.connect(lambda exitCode, exitStatus: self._finished(child, exitCode, exitStatus))
+        process.errorOccurred.connect(lambda error: self._failed(child, error))
+
+        self.children.append(child)
+        finished = [other for other in self.children if not other.running]
+        for other in finished[:-FINISHED_KEPT]:
+            self.children.remove(other)
+        process.start(program, arguments)
+        self.changed.emit()
+        return child
+
+    def _finished(self, child, exitCode, exitStatus):
+        if not child.running:
+            return
+        child.ended = time.monotonic()
+        child.exitCode = exitCode if exitStatus == QProcess.NormalExit else None
+        if exitStatus == QProcess.CrashExit:
+            child.error = 'stopped'
+        self.message.emit(child.describe())
+        child.process.deleteLater()
+        self.changed.emit()
+
+    def _failed(self, child, error):
+        # Crashes also arrive through finished(); only a failed start ends the child here
+        if error != QProcess.FailedToStart or not child.running:
+            return
+        child.ended = time.monotonic()
+        child.error = f'failed to start: {child.process.errorString()}'
+        self.message.emit(child.describe())
+        child.process.deleteLater()
+        self.changed.emit()
+
+    def running(self):
+        return [child for child in self.children if child.running]
+
+    def stop(self, child):
+        '''Ask a child to exit, and kill it if it has not after KILL_AFTER_MS'''
+        if not child.running:
+            return
+        child.process.terminate()
+        QTimer.singleShot(KILL_AFTER_MS, lambda: child.process.kill() if child.running else None)
+
+    def shutdown(self):
+        '''Stop every running child, waiting at most KILL_AFTER_MS for each'''
+        for child in self.running():
+            child.process.terminate()
+            if not child.process.waitForFinished(KILL_AFTER_MS):
+                child.process.kill()
+                child.process.waitForFinished(KILL_AFTER_MS)
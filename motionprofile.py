@@ -0,0 +1,95 @@
+import collections
+import math
+
+import numpy as np
+
+# Per-move timeouts: the predicted move time stretched by this factor, plus a fixed allowance for channel latency and
+# settling inside the arrival tolerance
+TIMEOUT_FACTOR = 1.5
+TIMEOUT_MARGIN_S = 3.0
+
+
+def trapezoid(distance, velocity, accelTime):
+    '''
+    Motion phases for a rest-to-rest move, as (duration, startVelocity, acceleration) tuples.
+
+    Like the EPICS motor record, ACCL is the time in seconds to reach VELO, not an acceleration. Short moves never
+    reach VELO and get a triangular profile instead.
+
+    :param distance: Signed distance to travel
+    :param velocity: VELO, units per second
+    :param accelTime: ACCL, seconds to reach VELO
+    '''
+    direction = math.copysign(1, distance)
+    distance = abs(distance)
+    if distance == 0 or velocity <= 0:
+        return []
+    if accelTime <= 0:
+        return [(distance / velocity, direction * velocity, 0.0)]
+
+    accel = velocity / accelTime
+    if distance >= velocity * accelTime:
+        # Accelerating and decelerating together cover velocity * accelTime
+        cruise = (distance - velocity * accelTime) / velocity
+        return [(accelTime, 0.0, direction * accel),
+                (cruise, direction * velocity, 0.0),
+                (accelTime, direction * velocity, -direction * accel)]
+
+    peakTime = math.sqrt(distance / accel)
+    return [(peakTime, 0.0, direction * accel),
+            (peakTime, direction * accel * peakTime, -direction * accel)]
+
+
+def moveTime(distance, velocity, accelTime):
+    '''
+    Seconds for a rest-to-rest move, from the same trapezoidal/triangular profile as trapezoid().
+
+    :param distance: Signed distance to travel
+    :param velocity: VELO, units per second
+    :param accelTime: ACCL, seconds to reach VELO
+    '''
+    return sum(duration for duration, startVelocity, accel in trapezoid(distance, velocity, accelTime))
+
+
+def moveTimes(distance, velocity, accelTime):
+    '''
+    moveTime() over arrays, for costing many moves at once.
+
+    :param distance: Signed distances to travel
+    :param velocity: VELO, units per second; must be positive
+    :param accelTime: ACCL, seconds to reach VELO
+    '''
+    distance, velocity, accelTime = np.broadcast_arrays(np.abs(distance), velocity, np.maximum(accelTime, 0))
+    trapezoidal = distance / velocity + accelTime
+    triangular = 2 * np.sqrt(distance * accelTime / velocity)
+    return np.where(distance >= velocity * accelTime, trapezoidal, triangular)
+
+
+class SequencePrediction(collections.namedtuple('SequencePrediction', ['alt', 'wind', 'parallel'])):
+    '''
+    Predicted seconds for the altitude and wind moves of a sequence: MOVE_ALT..AWAIT_WIND, or MOVE_BOTH..AWAIT_BOTH
+    when parallel.
+    '''
+
+    @property
+    def total(self):
+        if self.parallel:
+            return max(self.alt, self.wind)
+        return self.alt + self.wind
+
+
+def predictSequence(alt, wind, parallel=False):
+    '''
+    Predict both phases of a move sequence. Each phase lasts as long as the slowest of its stages.
+
+    :param alt: (distance, velocity, accelTime) of each altitude stage
+    :param wind: (distance, velocity, accelTime) of each wind stage
+    :param parallel: The stages move at the same time rather than one after the other
+    '''
+    return SequencePrediction(max((moveTime(*move) for move in alt), default=0.0),
+                              max((moveTime(*move) for move in wind), default=0.0), parallel)
+
+
+def timeoutMs(seconds):
+    '''Timeout in milliseconds for a move predicted to take the given number of seconds'''
+    return int(math.ceil((seconds * TIMEOUT_FACTOR + TIMEOUT_MARGIN_S) * 1000))
@@ -0,0 +1,441 @@
+import concurrent.futures
+import functools
+import itertools
+import json
+import logging
+import socket
+import threading
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+log = logging.getLogger('')
+
+PROXY_SOCKET = '/tmp/telsim-proxy'
+PROXY_FLUSH_MS = 20  # Updates are coalesced to at most one per channel per flush
+PROXY_WRITE_WORKERS = 8
+PROXY_TIMEOUT_S = 10  # For the proxy to answer a hello or subscribe
+PROXY_PUT_TIMEOUT_S = 60  # For a put with wait to complete through the proxy: VAL puts last as long as the move
+PROXY_PROBE_MS = 1000  # For a proxy already on the socket to accept a connection
+
+
+def channelId(name):
+    '''Proxy id of an EPICS channel'''
+    return f'ca:{name}'
+
+
+def keywordId(service, name):
+    '''Proxy id of a KTL keyword'''
+    return f'ktl:{service}.{name}'
+
+
+class TelemetryProxy(QtCore.QObject):
+    '''
+    Holds one set of channel and keyword subscriptions on a backend and republishes them to any number of GUIs over a
+    local socket, so the gateways see the same connections however many people are watching.
+
+    The protocol is one JSON object per line. A client says hello, asking for control if it wants to write; only one
+    client has control at a time, until it disconnects. It then subscribes to channels and keywords by id (see
+    channelId() and keywordId()), each answered with the current value. Monitor updates are coalesced and sent every
+    flushMs as {"op": "values", "values": {id: value}}, each client getting only the ids it subscribed to. Writes from
+    the controlling client are put from worker threads and answered when the put completes.
+
+    Objects are created on the first subscribe and kept for as long as the proxy runs; preload() creates them up
+    front, so clients never wait on a channel connecting.
+    '''
+
+    _written = pyqtSignal(object, int, object)  # client, seq, error message or None
+
+    def __init__(self, backend, path=PROXY_SOCKET, flushMs=PROXY_FLUSH_MS, shared=False, parent=None):
+        '''
+        :param backend: KeckBackend or simulator.SimBackend the subscriptions are made on
+        :param path: Local socket the clients connect to
+        :param shared: Let other accounts on the machine connect; only this user can otherwise
+        '''
+        super().__init__(parent)
+        self.backend = backend
+        self.path = path
+        self.objects = {}  # id: channel or keyword
+        self.values = {}  # id: latest value
+        self.clients = {}  # QLocalSocket: ids subscribed to
+        self.controller = None  # Client with control, if any
+        self._dirty = {}  # id: latest value, since the last flush
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=PROXY_WRITE_WORKERS,
+                                                           thread_name_prefix='telsim-proxy-put')
+        self._written.connect(self._writeDone)
+
+        self._server = QLocalServer(self)
+        self._server.setSocketOptions(QLocalServer.WorldAccessOption if shared else QLocalServer.UserAccessOption)
+        self._server.newConnection.connect(self._accept)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(flushMs)
+        self._timer.timeout.connect(self.flush)
+
+    def listen(self):
+        '''
+        Start accepting clients, replacing a socket left behind by a proxy that did not exit cleanly.
+
+        :raises OSError: If another proxy is running on the socket, or it cannot be created
+        '''
+        probe = QLocalSocket()
+        probe.connectToServer(self.path)
+        if probe.waitForConnected(PROXY_PROBE_MS):
+            probe.disconnectFromServer()
+            raise OSError(f'A telemetry proxy is already running on {self.path}')
+        QLocalServer.removeServer(self.path)
+        if not self._server.listen(self.path):
+            raise OSError(f'Cannot listen on {self.path}: {self._server.errorString()}')
+        log.info(f'Telemetry proxy listening on {self.path}')
+
+    def preload(self, channels, keywords):
+        '''
+        Subscribe ahead of the first client.
+
+        :param channels: List of (attribute, PV name), as the GUI creates them
+        :param keywords: List of (attribute, service, keyword)
+        '''
+        for _, name in channels:
+            self.subscribe(channelId(name), 'channel', name)
+        for _, service, name in keywords:
+            self.subscribe(keywordId(service, name), 'keyword', name, service)
+
+    def subscribe(self, id, kind, name, service=None):
+        '''
+        The object for an id, creating it and monitoring it on the backend the first time.
+
+        :param kind: 'channel' or 'keyword'
+        '''
+        if id not in self.objects:
+            if kind == 'channel':
+                obj = self.backend.channel(name)
+                # The GUI reads channels as floats and keywords as strings
+                obj.floatCallback.connect(functools.partial(self._update, id))
+            else:
+                obj = self.backend.keyword(service, name)
+                obj.stringCallback.connect(functools.partial(self._update, id))
+            self.objects[id] = obj
+            self.values[id] = obj.read()
+        return self.objects[id]
+
+    def _update(self, id, value):
+        self.values[id] = value
+        self._dirty[id] = value
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        '''Send every client the latest value of each of its ids updated since the last flush'''
+        dirty, self._dirty = self._dirty, {}
+        for client, ids in self.clients.items():
+            values = {id: value for id, value in dirty.items() if id in ids}
+            if values:
+                self._send(client, {'op': 'values', 'values': values})
+
+    # -----------------------------------------------------------------------------
+    def _accept(self):
+        while self._server.hasPendingConnections():
+            client = self._server.nextPendingConnection()
+            self.clients[client] = set()
+            client.readyRead.connect(functools.partial(self._receive, client))
+            client.disconnected.connect(functools.partial(self._disconnected, client))
+            log.info(f'Telemetry proxy: client connected, {len(self.clients)} now')
+
+    def _disconnected(self, client):
+        if client not in self.clients:
+            return
+        del self.clients[client]
+        if self.controller is client:
+            self.controller = None
+        client.deleteLater()
+        log.info(f'Telemetry proxy: client disconnected, {len(self.clients)} left')
+
+    def _receive(self, client):
+        while client.canReadLine():
+            line = bytes(client.readLine()).decode()
+            message = None
+            try:
+                message = json.loads(line)
+                self._handle(client, message)
+            except Exception as e:
+                log.warning(f'Telemetry proxy: bad request {line.strip()!r}: {e}')
+                # Answer it anyway, so a client waiting on the reply is not left hanging
+                if isinstance(message, dict) and message.get('seq') is not None:
+                    self._send(client, {'seq': message['seq'], 'error': f'Bad request: {type(e).__name__}: {e}'})
+
+    def _handle(self, client, message):
+        op, seq = message['op'], message.get('seq')
+        if op == 'hello':
+            if message.get('control') and self.controller is None:
+                self.controller = client
+            self._send(client, {'seq': seq, 'control': self.controller is client})
+        elif op == 'subscribe':
+            try:
+                self.subscribe(message['id'], message['kind'], message['name'], message.get('service'))
+            except Exception as e:
+                self._send(client, {'seq': seq, 'error': f'{type(e).__name__}: {e}'})
+                return
+            self.clients[client].add(message['id'])
+            self._send(client, {'seq': seq, 'value': self.values[message['id']]})
+        elif op == 'write':
+            if client is not self.controller:
+                self._send(client, {'seq': seq, 'error': 'This client does not have control'})
+                return
+            if message['id'] not in self.clients[client]:
+                self._send(client, {'seq': seq, 'error': f'{message["id"]} is not subscribed to'})
+                return
+            obj = self.objects[message['id']]
+            future = self._pool.submit(obj.write, message['value'], wait=message.get('wait', True))
+            future.add_done_callback(lambda future: self._written.emit(
+                client, seq, None if future.exception() is None else str(future.exception())))
+        elif op == 'release':
+            if self.controller is client:
+                self.controller = None
+
+    def _writeDone(self, client, seq, error):
+        if client in self.clients:
+            self._send(client, {'seq': seq, 'error': error})
+
+    def _send(self, client, message):
+        client.write((json.dumps(message) + '\n').encode())
+
+    def close(self):
+        self._server.close()
+        self._pool.shutdown(wait=False)
+
+
+class ProxyChannel(QtCore.QObject):
+    '''
+    A channel or keyword seen through a TelemetryProxy, with the same interface as the kPyQt objects. Reads return
+    the latest value the proxy sent.
+    '''
+
+    floatCallback = pyqtSignal(float)
+    stringCallback = pyqtSignal(str)
+    connectionCallback = pyqtSignal(bool)
+
+    def __init__(self, backend, id):
+        super().__init__()
+        self.backend = backend
+        self.id = id
+
+    def read(self):
+        return self.backend.values[self.id]
+
+    def write(self, value, wait=True):
+        '''
+        :raises PermissionError: On a read-only client
+        :raises RuntimeError: If the put failed on the proxy
+        '''
+        self.backend.write(self.id, value, wait)
+
+    def isConnected(self):
+        return self.backend.connected
+
+    def reconnect(self):
+        return self.backend.reconnect()
+
+    def runCallbacks(self):
+        self._emit(self.read())
+
+    def primeCallback(self):
+        self._emit(self.read())
+
+    def _emit(self, value):
+        try:
+            self.floatCallback.emit(float(value))
+        except ValueError:
+            pass
+        self.stringCallback.emit(str(value))
+
+
+class ProxyBackend:
+    '''
+    Channels and keywords from a TelemetryProxy instead of from the gateways, for watching alongside other GUIs. Only
+    a backend created with control=True, while no other client has control, can write.
+
+    Updates arrive on a reader thread and are emitted from there, as kPyQt does; connections to GUI objects are
+    queued onto the GUI thread.
+    '''
+
+    def __init__(self, path=PROXY_SOCKET, control=False, timeout=PROXY_TIMEOUT_S):
+        '''
+        :param path: The proxy's local socket
+        :param control: Ask for control, to write
+        :raises OSError: If the proxy is not running
+        :raises PermissionError: If control was asked for and another client has it
+        '''
+        self.path = path
+        self.timeout = timeout
+        self.values = {}
+        self.connected = False
+        self.control = False
+        self._channels = {}  # id: ProxyChannel objects
+        self._requests = {}  # id: subscribe request, to repeat on reconnecting
+        self._replies = {}  # seq: [threading.Event, reply]
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._reconnectLock = threading.Lock()
+        self._connect(control)
+
+    def _connect(self, control):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.path)
+        self.connected = True
+        self._reader = threading.Thread(target=self._read, args=(self._socket,), name='telsim-proxy-reader',
+                                        daemon=True)
+        self._reader.start()
+
+        self.control = self._request({'op': 'hello', 'control': control})['control']
+        if control and not self.control:
+            self._socket.close()
+            raise PermissionError(f'Another client has control of the telemetry proxy on {self.path}')
+
+    def reconnect(self):
+        '''
+        Connect to the proxy again after losing it, taking control back if this client had it, and subscribe again.
+        Each channel's callbacks fire with the value the proxy has now.
+
+        :return: True if connected
+        '''
+        # Every channel's health monitor entry may ask at once, from its own thread
+        with self._reconnectLock:
+            if self.connected:
+                return True
+            return self._reconnect()
+
+    def _reconnect(self):
+        try:
+            self._connect(self.control)
+            for id, request in list(self._requests.items()):
+                reply = self._request(request)
+                if not reply.get('error'):
+                    self._dispatch({'op': 'values', 'values': {id: reply['value']}})
+        except (OSError, TimeoutError):
+            self.connected = False
+            return False
+        self._connectionChanged(True)
+        return True
+
+    @property
+    def readOnly(self):
+        return not self.control
+
+    def channel(self, name):
+        '''
+        A proxied EPICS channel, once the proxy has sent its value.
+
+        :param name: PV name, e.g. wndsim:ln:m1.RBV
+        '''
+        return self._subscribe(channelId(name), {'kind': 'channel', 'name': name})
+
+    def keyword(self, service, name):
+        '''
+        A proxied KTL keyword, once the proxy has sent its value.
+
+        :param service: KTL service, e.g. ao1
+        :param name: Keyword name, e.g. dtlp
+        '''
+        return self._subscribe(keywordId(service, name), {'kind': 'keyword', 'service': service, 'name': name})
+
+    def _subscribe(self, id, request):
+        channel = ProxyChannel(self, id)
+        request = dict(request, op='subscribe', id=id)
+        with self._lock:
+            self._channels.setdefault(id, []).append(channel)
+            self._requests[id] = request
+        reply = self._request(request)
+        if reply.get('error'):
+            raise RuntimeError(f'{id}: {reply["error"]}')
+        with self._lock:
+            self.values.setdefault(id, reply['value'])
+        return channel
+
+    def write(self, id, value, wait=True, timeout=PROXY_PUT_TIMEOUT_S):
+        '''
+        Put a value through the proxy; with wait, return once the proxy's put has completed.
+
+        :param timeout: Seconds to wait for the put with wait to complete
+        :raises TimeoutError: If it does not complete in time
+        '''
+        if not self.control:
+            raise PermissionError(f'{id}: read-only telemetry proxy client')
+        message = {'op': 'write', 'id': id, 'value': value, 'wait': wait}
+        if not wait:
+            self._send(dict(message, seq=next(self._seq)))
+            return
+        reply = self._request(message, timeout=timeout)
+        if reply.get('error'):
+            raise RuntimeError(f'{id}: {reply["error"]}')
+
+    def _request(self, message, timeout=-1):
+        '''Send a request and wait for its reply; timeout -1 is self.timeout'''
+        seq = next(self._seq)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            if not self.connected:
+                raise ConnectionError(f'Telemetry proxy on {self.path} has gone away')
+            self._replies[seq] = waiter
+        self._send(dict(message, seq=seq))
+        if not waiter[0].wait(self.timeout if timeout == -1 else timeout):
+            with self._lock:
+                self._replies.pop(seq, None)
+            raise TimeoutError(f'No answer from the telemetry proxy to {message["op"]}')
+        if waiter[1] is None:
+            raise ConnectionError(f'Telemetry proxy on {self.path} has gone away')
+        return waiter[1]
+
+    def _send(self, message):
+        data = (json.dumps(message) + '\n').encode()
+        with self._lock:
+            self._socket.sendall(data)
+
+    def _read(self, connection):
+        buffer = b''
+        try:
+            while True:
+                data = connection.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    self._dispatch(json.loads(line))
+        except OSError:
+            pass
+        log.error(f'Lost the telemetry proxy on {self.path}')
+        with self._lock:
+            self.connected = False
+            waiters, self._replies = list(self._replies.values()), {}
+        for waiter in waiters:
+            waiter[0].set()
+        self._connectionChanged(False)
+
+    def _connectionChanged(self, connected):
+        with self._lock:
+            channels = [channel for channels in self._channels.values() for channel in channels]
+        for channel in channels:
+            channel.connectionCallback.emit(connected)
+
+    def _dispatch(self, message):
+        if message.get('op') == 'values':
+            for id, value in message['values'].items():
+                with self._lock:
+                    self.values[id] = value
+                    channels = list(self._channels.get(id, []))
+                for channel in channels:
+                    channel._emit(value)
+            return
+        with self._lock:
+            waiter = self._replies.pop(message.get('seq'), None)
+        if waiter is not None:
+            waiter[1] = message
+            waiter[0].set()
+
+    def close(self):
+        self._socket.close()
+
+    def run(self, application):
+        '''Run the Qt event loop'''
+        return application.exec_()
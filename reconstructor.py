@@ -0,0 +1,104 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+# Parsed matrices are kept here as .npy files, one per distinct file content and modification time
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'telsim', 'reconstructors')
+
+_fileKeys = {}  # (path, mtime, size): fileKey(), so a file is only hashed again once it has changed
+
+
+def fileKey(path):
+    '''
+    Cache key for a reconstructor file: a hash of its content and modification time. The hash is remembered for as
+    long as the file's modification time and size stay the same.
+
+    :param path: Reconstructor .txt file
+    '''
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if signature not in _fileKeys:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(str(stat.st_mtime_ns).encode())
+        _fileKeys[signature] = digest.hexdigest()
+    return _fileKeys[signature]
+
+
+def validate(matrix, shape=None):
+    '''
+    Check that a reconstructor matrix can be applied.
+
+    :param matrix: Parsed matrix
+    :param shape: Expected (rows, columns), if known
+    :raises ValueError: If the matrix is not 2-D, is empty, has the wrong shape, or has NaN/Inf entries
+    '''
+    if matrix.ndim != 2 or matrix.size == 0:
+        raise ValueError(f'Reconstructor must be a non-empty 2-D matrix, got shape {matrix.shape}')
+    if shape is not None and matrix.shape != tuple(shape):
+        raise ValueError(f'Reconstructor shape {matrix.shape} does not match the expected {tuple(shape)}')
+    if not np.isfinite(matrix).all():
+        raise ValueError(f'Reconstructor has {np.count_nonzero(~np.isfinite(matrix))} non-finite entries')
+
+
+def loadReconstructor(path, shape=None, cacheDir=CACHE_DIR):
+    '''
+    Load a text reconstructor matrix, parsing it only the first time.
+
+    The parsed matrix is validated and saved as a .npy sidecar in cacheDir; later loads of the same unchanged file
+    memory-map the sidecar instead of parsing the text again.
+
+    :param path: Reconstructor .txt file
+    :param shape: Expected (rows, columns), if known
+    :param cacheDir: Where the .npy sidecars are kept
+    :return: (read-only matrix, True if it came from the cache)
+    '''
+    cached = os.path.join(cacheDir, f'{os.path.basename(path)}.{fileKey(path)}.npy')
+    if os.path.exists(cached):
+        matrix = np.load(cached, mmap_mode='r')
+        validate(matrix, shape)
+        return matrix, True
+
+    matrix = np.loadtxt(path, dtype=np.float64, ndmin=2)
+    validate(matrix, shape)
+
+    # Write under a temporary name first, so an interrupted save never leaves a truncated sidecar behind
+    os.makedirs(cacheDir, exist_ok=True)
+    partial = f'{cached}.{os.getpid()}.partial'
+    with open(partial, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(partial, cached)
+    return np.load(cached, mmap_mode='r'), False
+
+
+class ReconstructorLoader(QtCore.QThread):
+    '''
+    Runs loadReconstructor() off the GUI thread. Emits loaded(path, matrix, message) or failed(path, message).
+    '''
+
+    loaded = pyqtSignal(str, object, str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, path, shape=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.shape = shape
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            matrix, fromCache = loadReconstructor(self.path, self.shape)
+        except (OSError, ValueError) as e:
+            self.failed.emit(self.path, str(e))
+            return
+
+        source = 'cache' if fromCache else 'text'
+        self.loaded.emit(self.path, matrix, f'Loaded {matrix.shape[0]}x{matrix.shape[1]} reconstructor from '
+                                            f'{source} in {(time.monotonic() - start) * 1000:0.1f} ms')
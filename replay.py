@@ -0,0 +1,204 @@
+import logging
+import math
+import time
+
+import numpy as np
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+from telemetry import TelemetryLog, KEYWORD_VALUES
+
+log = logging.getLogger('')
+
+REPLAY_BATCH = 2000  # Records emitted per event loop pass at most, so the window keeps repainting
+REPLAY_MAX_WAIT_MS = 100  # Longest sleep between passes, so position keeps being reported through quiet stretches
+
+KEYWORD_NAMES = {value: name for name, value in KEYWORD_VALUES.items()}
+
+
+class ReplayChannel(QtCore.QObject):
+    '''
+    One channel or keyword of a replayed telemetry log, with the same interface as the kPyQt objects. Keywords get
+    their logged numbers back as strings (OPEN/CLOSE, or the number), as a live keyword would send them.
+    '''
+
+    floatCallback = pyqtSignal(float)
+    stringCallback = pyqtSignal(str)
+
+    def __init__(self, backend, name, keyword=False):
+        super().__init__()
+        self.backend = backend
+        self.name = name
+        self.keyword = keyword
+
+    def read(self):
+        return self._convert(self.backend.values.get(self.name, math.nan))
+
+    def write(self, value, wait=True):
+        raise PermissionError(f'{self.name}: replayed telemetry cannot be written')
+
+    def runCallbacks(self):
+        self._emit(self.backend.values.get(self.name, math.nan))
+
+    def primeCallback(self):
+        self._emit(self.backend.values.get(self.name, math.nan))
+
+    def _convert(self, value):
+        if not self.keyword:
+            return 0.0 if math.isnan(value) else value
+        if math.isnan(value):
+            return ''
+        if value in KEYWORD_NAMES:
+            return KEYWORD_NAMES[value]
+        return str(int(value)) if value.is_integer() else str(value)
+
+    def _emit(self, value):
+        value = self._convert(value)
+        try:
+            self.floatCallback.emit(float(value))
+        except ValueError:
+            pass
+        self.stringCallback.emit(str(value))
+
+
+class ReplayBackend(QtCore.QObject):
+    '''
+    Channels and keywords fed from a telemetry log instead of the gateways, so the window, controller and displays
+    see a recorded night's monitor updates through the same callbacks as live ones.
+
+    Records are emitted in log order whatever the speed, so a replay drives the callbacks through the same sequence
+    every time: at speed times the recorded rate, or as fast as the event loop takes them with speed=None. seek()
+    jumps to any time through the log's index and first sends every channel's value at that time. playTo() emits
+    synchronously, with no event loop, for tests and profiling.
+
+    Replayed channels cannot be written; the window treats the backend as read only.
+    '''
+
+    position = pyqtSignal(float)  # Log time reached, after each pass
+    finished = pyqtSignal()
+
+    readOnly = True
+
+    def __init__(self, path, speed=1.0, start=None, batch=REPLAY_BATCH, parent=None):
+        '''
+        :param path: Telemetry log written with --record
+        :param speed: Log seconds per real second, or None for as fast as possible
+        :param start: Log time (telemetry.telemetryTime() seconds) to start from; the start of the log if not given
+        :param batch: Most records emitted per event loop pass
+        :raises ValueError: If path is not a telemetry log
+        '''
+        super().__init__(parent)
+        self.log = TelemetryLog(path)
+        self.speed = speed
+        self.batch = batch
+        self.values = {}  # Channel name: latest raw logged value
+        self.cursor = 0  # Next record to emit
+        self.time = self.log.start
+        self.playing = False
+        self.emitted = 0
+        self._channels = {}  # Name: ReplayChannel objects
+        self._times = self.log.records['time']
+        self._anchor = None  # (monotonic, log time) playback is timed from
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._pass)
+        self.seek(self.log.start if start is None else start)
+
+    def channel(self, name):
+        '''
+        A replayed EPICS channel.
+
+        :param name: PV name, as recorded, e.g. wndsim:ln:m1.RBV
+        '''
+        return self._create(name, False)
+
+    def keyword(self, service, name):
+        '''
+        A replayed KTL keyword.
+
+        :param service: KTL service, e.g. ao1
+        :param name: Keyword name, e.g. dtlp
+        '''
+        return self._create(f'{service}.{name}', True)
+
+    def _create(self, name, keyword):
+        if name not in self.log.channels:
+            log.debug(f'{name} is not in {self.log.path}; it will not update')
+        channel = ReplayChannel(self, name, keyword)
+        self._channels.setdefault(name, []).append(channel)
+        return channel
+
+    def seek(self, t):
+        '''
+        Continue from log time t, sending every channel the value it had then.
+
+        :param t: Log time, in telemetry.telemetryTime() seconds
+        '''
+        self.cursor = self.log.locate(t)
+        self.time = t
+        snapshot = self.log.snapshot(self.cursor)
+        for index, name in enumerate(self.log.channels):
+            if not math.isnan(snapshot[index]):
+                self.values[name] = snapshot[index]
+                for channel in self._channels.get(name, []):
+                    channel._emit(snapshot[index])
+        self._anchor = (time.monotonic(), t)
+        self.position.emit(t)
+
+    def play(self):
+        '''Start or continue replaying from the Qt event loop'''
+        self.playing = True
+        self._anchor = (time.monotonic(), self.time)
+        self._timer.start(0)
+
+    def pause(self):
+        self.playing = False
+        self._timer.stop()
+
+    def playTo(self, t=math.inf):
+        '''Emit every record up to log time t at once, without the event loop'''
+        end = self.cursor + int(np.searchsorted(self._times[self.cursor:], t, side='right'))
+        self._emitRecords(end)
+        self.time = min(t, self.log.end)
+
+    def _pass(self):
+        if not self.playing:
+            return
+        if self.speed is None:
+            end = min(self.cursor + self.batch, len(self.log))
+            due = math.inf
+        else:
+            started, logStart = self._anchor
+            due = logStart + (time.monotonic() - started) * self.speed
+            times = self._times[self.cursor:self.cursor + self.batch]
+            end = self.cursor + int(np.searchsorted(times, due, side='right'))
+        self._emitRecords(end)
+        self.time = min(due, self.log.end) if self.cursor < len(self.log) else self.log.end
+        self.position.emit(self.time)
+
+        if self.cursor >= len(self.log):
+            self.playing = False
+            self.finished.emit()
+            return
+        if self.speed is None:
+            self._timer.start(0)
+        else:
+            wait = (float(self._times[self.cursor]) - self.time) / self.speed
+            self._timer.start(min(max(round(wait * 1000), 0), REPLAY_MAX_WAIT_MS))
+
+    def _emitRecords(self, end):
+        records = np.array(self.log.records[self.cursor:end])
+        names = self.log.channels
+        for channel, value in zip(records['channel'].tolist(), records['value'].tolist()):
+            name = names[channel]
+            self.values[name] = value
+            for replayChannel in self._channels.get(name, ()):
+                replayChannel._emit(value)
+        self.cursor = end
+        self.emitted += len(records)
+
+    def run(self, application):
+        '''Replay the log while running the Qt event loop'''
+        self.play()
+        return application.exec_()
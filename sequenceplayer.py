@@ -0,0 +1,203 @@
+import collections
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+WARNINGS_SHOWN = 5  # Problems with a playing sequence shown as messages; the rest are counted
+
+# One row of a turbulence sequence file. A single move from the GUI boxes is a segment with no time.
+Segment = collections.namedtuple('Segment', ['time', 'position', 'velocity', 'accel', 'altitude'])
+
+
+def readSegments(path):
+    '''
+    Stream the segments of a wind profile file, one row at a time.
+
+    Each non-blank row holds time (seconds from the start of the sequence), wind position, velocity, acceleration
+    and altitude, separated by whitespace or commas. Lines starting with # are comments.
+
+    :param path: Sequence .txt file
+    :return: Generator of (file line number, Segment)
+    :raises ValueError: On a row that does not have five numbers, or whose time goes backwards
+    '''
+    last = None
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.replace(',', ' ').split()
+            if len(fields) != len(Segment._fields):
+                raise ValueError(f'{path} line {number}: expected {len(Segment._fields)} columns, got {len(fields)}')
+            try:
+                segment = Segment(*map(float, fields))
+            except ValueError:
+                raise ValueError(f'{path} line {number}: not a number in "{line}"') from None
+            if last is not None and segment.time < last:
+                raise ValueError(f'{path} line {number}: time {segment.time} is before {last}')
+            last = segment.time
+            yield number, segment
+
+
+class SequencePlayer(QtCore.QObject):
+    '''
+    Plays a sequence file through the state machine, one segment per MOVE_ALT..AWAIT_WIND sequence.
+
+    The file is read lazily, keeping only `lookahead` parsed segments in memory however long the file is, and each
+    segment is checked as it is sent, so nothing reads the whole file. Each segment is posted when its start time has
+    come, even while the one before it is still moving: the state machine queues it and starts it as soon as that move
+    has arrived. At most one segment waits behind the moving one.
+    '''
+
+    progress = pyqtSignal(str)
+    warning = pyqtSignal(str)
+    finished = pyqtSignal(str)
+
+    def __init__(self, path, post, check=None, lookahead=4, parent=None):
+        '''
+        :param path: Sequence .txt file
+        :param post: Called with each Segment when it is due
+        :param check: Called as check(previous, segment, following) before posting a segment, to return its
+                      validation.Violation list; previous is None for the first segment and following for the last.
+                      A 'limit' violation stops playback before the segment is posted; the rest are warnings.
+        :param lookahead: Segments parsed ahead of the one being posted
+        '''
+        super().__init__(parent)
+        self.path = path
+        self.post = post
+        self.check = check
+        self.lookahead = lookahead
+        self.playing = False
+        self.completed = 0
+        self.late = 0  # Segments predicted to run late
+
+        self._segments = None
+        self._buffer = collections.deque()  # (line, Segment) parsed ahead
+        self._posted = collections.deque()  # Segments posted and not yet arrived: the moving one, and one queued
+        self._previous = None  # Last segment posted
+        self._warnings = 0
+        self._start = None
+        self._firstTime = None
+        self._firstDone = None  # When the first segment arrived, and its time in the file
+        self._firstDoneTime = None
+        self._lastDone = None  # When the last segment arrived, and its time in the file
+        self._lastDoneTime = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._issue)
+
+    def start(self):
+        self._segments = readSegments(self.path)
+        self.playing = True
+        self.completed = 0
+        self.late = 0
+        self._warnings = 0
+        self._previous = None
+        if not self._fill():
+            return
+        if not self._buffer:
+            self.stop('empty sequence')
+            return
+        self._start = time.monotonic()
+        self._firstTime = self._buffer[0][1].time
+        self._next()
+
+    def stop(self, reason='stopped'):
+        if not self.playing:
+            return
+        self.playing = False
+        self._timer.stop()
+        self._buffer.clear()
+        self._posted.clear()
+        self._segments = None
+        late = f' {self.late} predicted to run late.' if self.late else ''
+        self.finished.emit(f'{self.path}: {reason}. {self.rateReport()}.{late}')
+
+    def segmentDone(self):
+        '''The state machine is back in IDLE; count the segment that was moving and go on to the next'''
+        if not self.playing or not self._posted:
+            return
+        done = self._posted.popleft()
+        now = time.monotonic()
+        if not self.completed:
+            self._firstDone, self._firstDoneTime = now, done.time
+        self._lastDone, self._lastDoneTime = now, done.time
+        self.completed += 1
+        self.progress.emit(self.rateReport())
+        self._next()
+
+    def rates(self):
+        '''
+        Achieved and requested segments per second so far: the intervals between the completed segments' arrivals,
+        and between their start times in the file. N segments span N - 1 intervals, so there are no rates until two
+        segments have completed.
+
+        :return: (achieved, requested), or None
+        '''
+        if self.completed < 2:
+            return None
+        elapsed = self._lastDone - self._firstDone
+        achieved = (self.completed - 1) / elapsed if elapsed > 0 else float('inf')
+        span = self._lastDoneTime - self._firstDoneTime
+        requested = (self.completed - 1) / span if span > 0 else float('inf')
+        return achieved, requested
+
+    def rateReport(self):
+        rates = self.rates()
+        if rates is None:
+            return f'{self.completed} segments'
+        return f'{self.completed} segments, {rates[0]:0.2f} segments/s achieved vs {rates[1]:0.2f} requested'
+
+    def _fill(self):
+        try:
+            while len(self._buffer) < self.lookahead:
+                self._buffer.append(next(self._segments))
+        except StopIteration:
+            pass
+        except (OSError, ValueError) as e:
+            self.stop(str(e))
+            return False
+        return True
+
+    def _next(self):
+        if not self.playing:
+            return
+        if len(self._posted) > 1:
+            # One moving and one queued behind it: wait for an arrival
+            return
+        if not self._buffer:
+            if not self._posted:
+                self.stop('finished')
+            return
+
+        due = self._start + self._buffer[0][1].time - self._firstTime
+        self._timer.start(max(0, round((due - time.monotonic()) * 1000)))
+
+    def _issue(self):
+        if not self.playing:
+            return
+        line, segment = self._buffer.popleft()
+        if not self._fill():
+            return
+        if self.check is not None:
+            following = self._buffer[0][1] if self._buffer else None
+            for violation in self.check(self._previous, segment, following):
+                if violation.kind == 'limit':
+                    self.stop(f'line {line}: {violation.message}')
+                    return
+                if violation.kind == 'timing':
+                    self.late += 1
+                self._warn(f'{self.path} line {line}: {violation.message}')
+        self._previous = segment
+        self._posted.append(segment)
+        self.post(segment)
+        self._next()
+
+    def _warn(self, message):
+        self._warnings += 1
+        if self._warnings <= WARNINGS_SHOWN:
+            self.warning.emit(message)
+        elif self._warnings == WARNINGS_SHOWN + 1:
+            self.warning.emit(f'{self.path}: further problems are counted in the summary, not shown')
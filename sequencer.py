@@ -0,0 +1,124 @@
+import collections
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+# Step kinds
+CALL = 'call'
+WAIT = 'wait'
+WAIT_UNTIL = 'until'
+
+Step = collections.namedtuple('Step', ['kind', 'description', 'action', 'timeoutMs', 'onTimeout'])
+
+
+class ActionSequencer(QtCore.QObject):
+    '''
+    Runs "write, wait N ms or until a condition, write" steps from the Qt event loop without blocking it.
+
+    Steps are queued with call(), wait() and waitUntil() and run in order. Waiting is done with a single-shot timer,
+    so channel callbacks and repaints keep running in between. The descriptions of the steps that have not finished
+    yet are available from pending() and are emitted with pendingChanged whenever the queue changes.
+    '''
+
+    pendingChanged = pyqtSignal(list)
+
+    def __init__(self, parent=None, pollMs=50):
+        super().__init__(parent)
+        self._steps = collections.deque()
+        self._running = None  # Step currently waiting on the timer
+        self._deadline = None
+        self._pollMs = pollMs
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._wake)
+
+    def call(self, action, description):
+        '''
+        Queue a function call, e.g. a channel or keyword write.
+
+        :param action: Callable taking no arguments
+        :param description: Text shown while the step is pending
+        '''
+        return self._queue(Step(CALL, description, action, None, None))
+
+    def wait(self, ms, description=None):
+        '''
+        Queue a fixed delay.
+
+        :param ms: Delay in milliseconds
+        :param description: Text shown while the step is pending
+        '''
+        return self._queue(Step(WAIT, description or f'wait {ms} ms', None, ms, None))
+
+    def waitUntil(self, predicate, timeoutMs, description, onTimeout=None):
+        '''
+        Queue a wait for a condition, checked every pollMs until it is true or timeoutMs runs out. On timeout the
+        remaining steps are dropped and onTimeout (if given) is called.
+
+        :param predicate: Callable returning True when the sequence may continue
+        :param timeoutMs: Longest time to wait, in milliseconds
+        :param description: Text shown while the step is pending
+        :param onTimeout: Optional callable run if the condition is never met
+        '''
+        return self._queue(Step(WAIT_UNTIL, description, predicate, timeoutMs, onTimeout))
+
+    def pending(self):
+        '''Descriptions of the step in flight followed by the queued steps.'''
+        steps = ([self._running] if self._running else []) + list(self._steps)
+        return [step.description for step in steps]
+
+    def isBusy(self):
+        return self._running is not None or len(self._steps) > 0
+
+    def cancel(self):
+        '''Drop every pending step.'''
+        self._timer.stop()
+        self._running = None
+        self._steps.clear()
+        self.pendingChanged.emit(self.pending())
+
+    def _queue(self, step):
+        self._steps.append(step)
+        self.pendingChanged.emit(self.pending())
+        if self._running is None:
+            # Start on the next pass of the event loop, so callers can finish queueing the whole sequence first
+            self._timer.start(0)
+        return self
+
+    def _wake(self):
+        running = self._running
+        if running is not None and running.kind == WAIT_UNTIL and not running.action():
+            if time.monotonic() >= self._deadline:
+                self._running = None
+                self._steps.clear()
+                self.pendingChanged.emit(self.pending())
+                if running.onTimeout is not None:
+                    running.onTimeout()
+                return
+            self._timer.start(self._pollMs)
+            return
+
+        self._running = None
+        self._advance()
+
+    def _advance(self):
+        while self._steps:
+            step = self._steps.popleft()
+
+            if step.kind == CALL:
+                self.pendingChanged.emit(self.pending())
+                step.action()
+                continue
+
+            self._running = step
+            if step.kind == WAIT:
+                self._timer.start(step.timeoutMs)
+            else:
+                self._deadline = time.monotonic() + step.timeoutMs / 1000
+                self._timer.start(0)
+            self.pendingChanged.emit(self.pending())
+            return
+
+        self.pendingChanged.emit(self.pending())
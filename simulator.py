@@ -0,0 +1,336 @@
+import math
+import threading
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+from motionprofile import trapezoid
+from stages import StageRegistry
+
+# Motor record SPMG values
+SPMG_STOP = 0
+SPMG_PAUSE = 1
+SPMG_MOVE = 2
+SPMG_GO = 3
+
+# VELO and ACCL of a simulated stage whose stages file entry has no home for them
+SIM_VELOCITY = 1.0
+SIM_ACCEL_TIME = 0.5
+
+# Longest a VAL put with wait=True blocks for the move to finish, as a channel access put timeout would
+SIM_PUT_TIMEOUT_S = 60.0
+
+
+class SimClock:
+    '''
+    Simulated time in seconds. Runs at speed times wall-clock time, or only when advance() is called if speed is None,
+    which makes runs fully deterministic.
+    '''
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._start = time.monotonic()
+        self._manual = 0.0
+
+    def now(self):
+        if self.speed is None:
+            return self._manual
+        return (time.monotonic() - self._start) * self.speed
+
+    def advance(self, seconds):
+        self._manual += seconds
+
+
+class SimRecord:
+    '''
+    A set of named fields with change listeners, standing in for an EPICS record or a KTL service. Puts may come
+    from WritePipeline worker threads, so field access is serialised with a re-entrant lock.
+
+    While disconnected (setConnected(False)) the record keeps changing but its listeners hear nothing, as behind a
+    dead gateway, and channels refuse writes. Reconnecting sends every field to its listeners, as a reconnected
+    monitor does.
+    '''
+
+    def __init__(self, **fields):
+        self.fields = dict(fields)
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)  # Notified on every field or connection change
+        self.connected = True
+        self._listeners = {}
+        self._connectionListeners = []
+
+    def get(self, field):
+        with self.lock:
+            return self.fields[field]
+
+    def put(self, field, value):
+        self.set(field, value)
+
+    def set(self, field, value):
+        '''Update a field and notify its listeners, if the value changed'''
+        with self.lock:
+            if self.fields.get(field) == value:
+                return
+            self.fields[field] = value
+            self.changed.notify_all()
+            if not self.connected:
+                return
+            for listener in self._listeners.get(field, []):
+                listener(value)
+
+    def complete(self, field):
+        '''Wait for a put to field to complete; plain fields complete at once'''
+
+    def subscribe(self, field, listener):
+        with self.lock:
+            self._listeners.setdefault(field, []).append(listener)
+
+    def subscribeConnection(self, listener):
+        '''Call listener(connected) on every connection change'''
+        with self.lock:
+            self._connectionListeners.append(listener)
+
+    def setConnected(self, connected):
+        with self.lock:
+            if connected == self.connected:
+                return
+            self.connected = connected
+            self.changed.notify_all()
+            for listener in self._connectionListeners:
+                listener(connected)
+            if connected:
+                for field, listeners in self._listeners.items():
+                    for listener in listeners:
+                        listener(self.fields[field])
+
+
+class SimMotor(SimRecord):
+    '''
+    In-process model of an EPICS motor record: RBV, VAL, MOVN, DMOV, VELO, ACCL and SPMG, with trapezoidal motion.
+
+    Writing VAL while SPMG is Go starts a move from the current readback. Writing SPMG Stop or Pause decelerates
+    to rest over ACCL and leaves VAL at the stopping position. A new VAL during a move is planned from the current
+    position as if from rest, which is close enough for the GUI's purposes.
+    '''
+
+    def __init__(self, clock, position, velocity, accelTime):
+        super().__init__(RBV=position, VAL=position, MOVN=0, DMOV=1, VELO=velocity, ACCL=accelTime,
+                         SPMG=SPMG_GO)
+        self.clock = clock
+        self._profile = None  # (start time, start position, phases)
+        self._target = position
+
+    def put(self, field, value):
+        value = float(value)
+        if field == 'SPMG':
+            value = int(value)
+
+        with self.lock:
+            self.set(field, value)
+            if field == 'VAL' and self.fields['SPMG'] == SPMG_GO:
+                self.update()
+                self._target = value
+                self._plan(self.fields['RBV'], trapezoid(value - self.fields['RBV'], self.fields['VELO'],
+                                                         self.fields['ACCL']))
+            elif field == 'SPMG' and value in [SPMG_STOP, SPMG_PAUSE] and self._profile is not None:
+                self._decelerate()
+
+    def complete(self, field):
+        '''
+        A VAL put completes when the move has finished (DMOV), as with a channel access put callback. The motion
+        is stepped from the GUI thread, so only wait from another thread, such as a WritePipeline worker.
+
+        :raises ConnectionError: If the motor is disconnected while waiting
+        :raises TimeoutError: If the move has not finished after SIM_PUT_TIMEOUT_S
+        '''
+        if field != 'VAL':
+            return
+        with self.lock:
+            if not self.changed.wait_for(lambda: self.fields['DMOV'] == 1 or not self.connected, SIM_PUT_TIMEOUT_S):
+                raise TimeoutError(f'VAL put still waiting after {SIM_PUT_TIMEOUT_S:g} s')
+            if not self.connected:
+                raise ConnectionError('VAL put lost its connection before the move finished')
+
+    def position(self, now):
+        '''Position and velocity at simulated time now, and whether the current move is complete'''
+        start, position, phases = self._profile
+        elapsed = now - start
+        velocity = 0.0
+        for duration, velocity, accel in phases:
+            step = min(elapsed, duration)
+            position += velocity * step + 0.5 * accel * step * step
+            velocity += accel * step
+            elapsed -= duration
+            if elapsed < 0:
+                return position, velocity, False
+        return position, 0.0, True
+
+    def update(self):
+        '''Advance the readback to the clock's current time'''
+        with self.lock:
+            if self._profile is None:
+                return
+
+            position, velocity, done = self.position(self.clock.now())
+            if done:
+                self._profile = None
+                self.set('RBV', self._target)
+                self.set('MOVN', 0)
+                self.set('DMOV', 1)
+            else:
+                self.set('RBV', position)
+
+    def _plan(self, position, phases):
+        if not phases:
+            self._profile = None
+            return
+        self._profile = (self.clock.now(), position, phases)
+        self.set('MOVN', 1)
+        self.set('DMOV', 0)
+
+    def _decelerate(self):
+        now = self.clock.now()
+        position, velocity, done = self.position(now)
+        if done or self.fields['ACCL'] <= 0 or velocity == 0:
+            self._target = position
+            self._profile = (now, position, [])
+        else:
+            accel = self.fields['VELO'] / self.fields['ACCL']
+            duration = abs(velocity) / accel
+            self._target = position + velocity * duration / 2
+            self._profile = (now, position, [(duration, velocity, -math.copysign(accel, velocity))])
+        self.set('VAL', self._target)
+        self.update()
+
+
+class SimChannel(QtCore.QObject):
+    '''
+    One field of a SimRecord, with the same interface as the kPyQt channel and keyword objects the GUI uses.
+    '''
+
+    floatCallback = pyqtSignal(float)
+    stringCallback = pyqtSignal(str)
+    connectionCallback = pyqtSignal(bool)
+
+    def __init__(self, record, field):
+        super().__init__()
+        self.record = record
+        self.field = field
+        record.subscribe(field, self._emit)
+        record.subscribeConnection(self.connectionCallback.emit)
+
+    def read(self):
+        return self.record.get(self.field)
+
+    def write(self, value, wait=True):
+        if not self.record.connected:
+            raise ConnectionError(f'{self.field} is disconnected')
+        self.record.put(self.field, value)
+        if wait:
+            self.record.complete(self.field)
+
+    def isConnected(self):
+        return self.record.connected
+
+    def reconnect(self):
+        '''The simulator reconnects by itself (SimBackend.setConnected()); this just reports whether it has'''
+        return self.record.connected
+
+    def runCallbacks(self):
+        self._emit(self.read())
+
+    def primeCallback(self):
+        self._emit(self.read())
+
+    def _emit(self, value):
+        try:
+            self.floatCallback.emit(float(value))
+        except ValueError:
+            pass
+        self.stringCallback.emit(str(value))
+
+
+class SimBackend(QtCore.QObject):
+    '''
+    Simulated stage motors, the ao1 loop, frame rate and gain keywords, for running the GUI off-summit.
+
+    With a speed the motors are stepped from a timer at speed times real time. With speed=None nothing moves until
+    advance() is called, so a test or benchmark controls time exactly.
+    '''
+
+    def __init__(self, speed=1.0, tickMs=20, stages=None, parent=None):
+        '''
+        :param stages: stages.StageRegistry; one motor is simulated per stage, starting at home. Loaded from
+                       stages.ini if not given.
+        '''
+        super().__init__(parent)
+        self.clock = SimClock(speed)
+        if stages is None:
+            stages = StageRegistry.load()
+        self.motors = {}
+        for stage in stages:
+            velocity, accelTime = stage.home('VELO'), stage.home('ACCL')
+            self.motors[stage.prefix] = SimMotor(self.clock, position=stage.home('VAL'),
+                                                 velocity=SIM_VELOCITY if velocity is None else velocity,
+                                                 accelTime=SIM_ACCEL_TIME if accelTime is None else accelTime)
+        self.pvs = SimRecord(**{'k1:ao:wc:dt:sv:gain': 0.5})
+        self.services = {'ao1': SimRecord(dtlp='OPEN', dmlp='OPEN', wsfrrt='1000', dtgain='0.5')}
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.update)
+        if speed is not None:
+            self._timer.start(tickMs)
+
+    def channel(self, name):
+        '''
+        Create a simulated EPICS channel.
+
+        :param name: PV name. Fields of the simulated motors (wndsim:ln:m1.RBV) are backed by the motion model,
+                     anything else by a plain stored value.
+        '''
+        prefix, _, field = name.rpartition('.')
+        if prefix in self.motors:
+            return SimChannel(self.motors[prefix], field)
+        if name not in self.pvs.fields:
+            self.pvs.fields[name] = 0.0
+        return SimChannel(self.pvs, name)
+
+    def keyword(self, service, name):
+        '''
+        Create a simulated KTL keyword.
+
+        :param service: KTL service, e.g. ao1
+        :param name: Keyword name, e.g. dtlp
+        '''
+        record = self.services.setdefault(service, SimRecord())
+        if name not in record.fields:
+            record.fields[name] = ''
+        return SimChannel(record, name)
+
+    def setConnected(self, name, connected):
+        '''
+        Drop or restore the connection to a simulated motor, PV or KTL service, e.g. to try out the health monitor.
+
+        :param name: Motor prefix (wndsim:ln:m1), PV name or KTL service (ao1)
+        '''
+        if name in self.motors:
+            self.motors[name].setConnected(connected)
+        elif name in self.services:
+            self.services[name].setConnected(connected)
+        else:
+            # Plain PVs share one record
+            self.pvs.setConnected(connected)
+
+    def advance(self, seconds):
+        '''Step simulated time forward; only meaningful with speed=None'''
+        self.clock.advance(seconds)
+        self.update()
+
+    def update(self):
+        for motor in self.motors.values():
+            motor.update()
+
+    def run(self, application):
+        '''Run the Qt event loop'''
+        return application.exec_()
@@ -0,0 +1,233 @@
+import collections
+import configparser
+import functools
+import os
+
+import numpy as np
+
+from PyQt5.QtGui import QDoubleValidator, QIntValidator
+
+STAGES_FILE = 'stages.ini'
+
+# Section of the stages file with the loop settings rather than a stage
+LOOP_SECTION = 'loop'
+
+# Roles a stage can play in a move, and the Segment field each role's stages move to
+ROLES = {'alt': 'altitude', 'wind': 'position'}
+
+# Motor record fields created as channels for every stage
+FIELDS = ['RBV', 'VAL', 'MOVN', 'VELO', 'ACCL', 'SPMG']
+
+# Limits and home value of one setpoint field; home is None for fields that are not homed
+Limits = collections.namedtuple('Limits', ['low', 'high', 'home', 'precision'])
+
+
+@functools.lru_cache(maxsize=None)
+def validator(limits):
+    '''
+    The Qt validator for a Limits, created once and shared by every edit box with the same limits: a QIntValidator
+    for precision 0, a QDoubleValidator otherwise.
+    '''
+    if limits.precision == 0:
+        return QIntValidator(int(limits.low), int(limits.high))
+    return QDoubleValidator(limits.low, limits.high, limits.precision, notation=QDoubleValidator.StandardNotation)
+
+
+class Stage:
+    '''
+    One translation stage: its motor record, the role it plays in a move, and the limits of its setpoints.
+    '''
+
+    def __init__(self, name, label, quantity, prefix, role, position, velocity=None, accel=None):
+        '''
+        :param name: Section name in the stages file; channel and watcher keys are name.FIELD
+        :param label: Shown next to the stage's toggle
+        :param quantity: What the position means, e.g. "Altitude", for error messages
+        :param prefix: Motor record PV prefix, e.g. wndsim:ln:m1
+        :param role: Key of ROLES
+        :param position: Limits of VAL (and RBV)
+        :param velocity: Limits of VELO, if the GUI writes it
+        :param accel: Limits of ACCL, if the GUI writes it
+        '''
+        self.name = name
+        self.label = label
+        self.quantity = quantity
+        self.prefix = prefix
+        self.role = role
+        self.limits = {'VAL': position, 'RBV': position}
+        if velocity is not None:
+            self.limits['VELO'] = velocity
+        if accel is not None:
+            self.limits['ACCL'] = accel
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, {self.prefix!r}, {self.role!r})'
+
+    def key(self, field):
+        '''Channel and watcher key of one of the stage's fields'''
+        return f'{self.name}.{field}'
+
+    def pv(self, field):
+        return f'{self.prefix}.{field}'
+
+    def home(self, field):
+        '''Home value of a field, or None if the stage has no limits for it'''
+        limits = self.limits.get(field)
+        return None if limits is None else limits.home
+
+    def clamp(self, field, value):
+        limits = self.limits[field]
+        return min(max(value, limits.low), limits.high)
+
+    def validator(self, field):
+        '''Qt validator for a field's limits and precision'''
+        return validator(self.limits[field])
+
+    def format(self, field, value):
+        '''A value of a field, to the field's precision'''
+        return f'{value:0.{self.limits[field].precision}f}'
+
+
+class StageRegistry:
+    '''
+    The translation stages, in the order of the stages file. Everything that handles stages (channels, watches,
+    setpoint writes, validators, toggles) iterates over this rather than naming the stages.
+    '''
+
+    def __init__(self, stages, reconstructorShape=None):
+        '''
+        :param stages: Stage objects
+        :param reconstructorShape: (rows, columns) a reconstructor matrix must have, if known
+        :raises ValueError: If a role has no stage, or two stages share a name
+        '''
+        self.stages = list(stages)
+        self.reconstructorShape = reconstructorShape
+        self._byName = {stage.name: stage for stage in self.stages}
+        if len(self._byName) != len(self.stages):
+            raise ValueError('Stage names must be unique')
+        for role in ROLES:
+            if not self.role(role):
+                raise ValueError(f'No {role} stage configured')
+
+    @classmethod
+    def load(cls, path=None):
+        '''
+        Read the stages file. Without a path, stages.ini is looked for in the current directory, then in the release
+        data directory, like telsim.ui.
+
+        :raises ValueError: On a missing or invalid setting
+        '''
+        if path is None:
+            path = STAGES_FILE
+            if not os.path.exists(path):
+                path = os.path.join(os.environ.get('KROOT', '/kroot'), 'rel/ao/default/data', STAGES_FILE)
+        parser = configparser.ConfigParser()
+        if not parser.read(path):
+            raise ValueError(f'Cannot read stages file {path}')
+        loop = parser[LOOP_SECTION] if parser.has_section(LOOP_SECTION) else {}
+        return cls((readStage(path, name, parser[name]) for name in parser.sections() if name != LOOP_SECTION),
+                   readReconstructorShape(path, loop))
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __getitem__(self, name):
+        return self._byName[name]
+
+    def role(self, role):
+        '''Stages with a role, in file order'''
+        return [stage for stage in self.stages if stage.role == role]
+
+    def primary(self, role):
+        '''The first stage of a role: the one the GUI's edit boxes show'''
+        return self.role(role)[0]
+
+    def channels(self):
+        '''(key, PV name) of every stage channel'''
+        return [(stage.key(field), stage.pv(field)) for stage in self.stages for field in FIELDS]
+
+
+def readStage(path, name, section):
+    '''Stage from one section of a stages file'''
+
+    def limits(prefix, required):
+        keys = [f'{prefix}min', f'{prefix}max', f'{prefix}home']
+        if not any(key in section for key in keys):
+            if required:
+                raise ValueError(f'{path} [{name}]: {prefix}min, {prefix}max and {prefix}home are required')
+            return None
+        try:
+            low, high, home = (section.getfloat(key) for key in keys)
+            precision = section.getint(f'{prefix}precision', 2)
+        except (TypeError, ValueError):
+            raise ValueError(f'{path} [{name}]: {", ".join(keys)} must all be numbers') from None
+        if not low <= home <= high:
+            raise ValueError(f'{path} [{name}]: {prefix}home {home} is outside {low}..{high}')
+        return Limits(low, high, home, precision)
+
+    role = section.get('role')
+    if role not in ROLES:
+        raise ValueError(f'{path} [{name}]: role must be one of {", ".join(ROLES)}, not {role}')
+    if 'prefix' not in section:
+        raise ValueError(f'{path} [{name}]: no prefix')
+    # The wind stages' VELO and ACCL are written from every setpoint, so they need limits
+    return Stage(name, section.get('label', name), section.get('quantity', 'Position'), section['prefix'], role,
+                 limits('', True), limits('velocity_', role == 'wind'), limits('accel_', role == 'wind'))
+
+
+def readReconstructorShape(path, section):
+    '''(rows, columns) from reconstructor_rows and reconstructor_columns of the loop section, or None if not set'''
+    keys = ['reconstructor_rows', 'reconstructor_columns']
+    if not any(key in section for key in keys):
+        return None
+    try:
+        shape = tuple(int(section[key]) for key in keys)
+    except (KeyError, ValueError):
+        raise ValueError(f'{path} [{LOOP_SECTION}]: {" and ".join(keys)} must both be whole numbers') from None
+    if min(shape) <= 0:
+        raise ValueError(f'{path} [{LOOP_SECTION}]: {" and ".join(keys)} must be positive')
+    return shape
+
+
+class ArrivalCheck:
+    '''
+    Arrival of several stages at their targets, as one vectorized test over their cached readbacks. Used as a
+    ConditionWatcher predicate, so each monitor update re-checks every stage in a single NumPy comparison whatever the
+    number of stages.
+
+    A stage counts as arrived from the first time its readback is inside the tolerance. The check holds once every
+    stage has arrived; reached(group) is called the first time all the stages of a group have.
+    '''
+
+    def __init__(self, stages, targets, tolerance, reached=None):
+        '''
+        :param stages: Stage objects
+        :param targets: Target position of each stage
+        :param tolerance: Largest |readback - target| that counts as arrived
+        :param reached: Called with the role, as each role's stages have all arrived
+        '''
+        self.names = [stage.key('RBV') for stage in stages]
+        self.targets = np.asarray(targets, dtype=float)
+        self.tolerance = tolerance
+        self.arrived = np.zeros(len(self.names), dtype=bool)
+        self.groups = {}
+        for index, stage in enumerate(stages):
+            self.groups.setdefault(stage.role, []).append(index)
+        self.reached = reached
+
+    def __call__(self, values):
+        readbacks = np.fromiter((values[name] for name in self.names), dtype=float, count=len(self.names))
+        self.arrived |= np.abs(readbacks - self.targets) <= self.tolerance
+        for group, indices in list(self.groups.items()):
+            if self.arrived[indices].all():
+                del self.groups[group]
+                if self.reached is not None:
+                    self.reached(group)
+        return bool(self.arrived.all())
+
+    def waiting(self):
+        '''Roles with a stage that has not arrived yet'''
+        return sorted(self.groups)
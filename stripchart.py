@@ -0,0 +1,203 @@
+import numpy as np
+
+from PyQt5.QtCore import Qt, QTimer, QLineF, QRectF
+from PyQt5.QtGui import QPainter, QPen, QColor
+from PyQt5.QtWidgets import QWidget
+
+from telemetry import telemetryTime
+
+CHART_FPS = 5
+CHART_WINDOW_S = 600
+CHART_RATE_HZ = 10  # Updates per second per channel that the recorder keeps a whole window of; see historyCapacity()
+LABEL_WIDTH = 120
+PANEL_GAP = 6
+
+
+def historyCapacity(window, minimum):
+    '''
+    Ring buffer capacity for a chart window: enough for CHART_RATE_HZ updates per second over the whole window. A
+    channel updating faster than that shows only its newest capacity samples, from partway across the window.
+
+    :param window: Seconds of history shown
+    :param minimum: Capacity to keep at least, e.g. telemetry.RING_CAPACITY
+    '''
+    return max(minimum, int(np.ceil(window * CHART_RATE_HZ)))
+
+
+class ColumnTrace:
+    '''
+    One trace reduced to a (min, max) span per pixel column, kept up to date by folding in only the samples recorded
+    since the last frame, so a frame costs the same however many samples the window holds.
+
+    Column k covers [k * span, (k + 1) * span) seconds, so a column's samples stay in it as the chart scrolls. Each
+    column spans from the value held coming into it to everything sampled inside it; columns are NaN until anything is
+    known. The newest width columns are kept, in circular arrays.
+    '''
+
+    def __init__(self, ring, span, width):
+        '''
+        :param ring: RingBuffer of the channel
+        :param span: Seconds per column
+        :param width: Number of pixel columns
+        '''
+        self.ring = ring
+        self.span = span
+        self.width = width
+        self.low = np.full(width, np.nan)
+        self.high = np.full(width, np.nan)
+        self.column = None  # Newest column kept; column k is at k % width
+        self.held = np.nan  # Newest value folded in
+        self.consumed = 0  # Ring sample count folded in up to
+
+    def fill(self, t1):
+        '''
+        Start over from the samples in the ring for the width columns up to time t1: the only step that copies the
+        whole window out of the ring.
+        '''
+        first = int(t1 // self.span) - self.width + 1
+        times, values, before, end = self.ring.window(first * self.span)
+        self.low[:] = np.nan
+        self.high[:] = np.nan
+        self.column = first - 1
+        self.held = np.nan if before is None else before
+        self._fold(times, values)
+        self.consumed = end
+
+    def update(self):
+        '''Fold in the samples recorded since the last fill() or update()'''
+        times, values, self.consumed = self.ring.since(self.consumed)
+        self._fold(times, values)
+
+    def columns(self, column):
+        '''
+        :param column: Newest column to show, at or after any sample folded in
+        :return: (low, high) arrays of the width columns up to column, oldest first
+        '''
+        self._advance(column)
+        index = np.arange(column - self.width + 1, column + 1) % self.width
+        return self.low[index], self.high[index]
+
+    def _fold(self, times, values):
+        if not len(times):
+            return
+        # A sample stamped while the last frame read the clock can be older than its newest column: it goes in that one
+        columns = np.maximum((times // self.span).astype(np.int64), self.column)
+        starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+        lows = np.minimum.reduceat(values, starts)
+        highs = np.maximum.reduceat(values, starts)
+        lasts = values[np.r_[starts[1:], len(values)] - 1]
+        for column, low, high, last in zip(columns[starts], lows, highs, lasts):
+            self._advance(column)
+            i = column % self.width
+            self.low[i] = np.fmin(self.low[i], low)
+            self.high[i] = np.fmax(self.high[i], high)
+            self.held = last
+
+    def _advance(self, column):
+        '''Start the columns after the newest one kept up to column at the value held'''
+        if column <= self.column:
+            return
+        index = np.arange(max(self.column + 1, column - self.width + 1), column + 1) % self.width
+        self.low[index] = self.held
+        self.high[index] = self.held
+        self.column = column
+
+
+class StripChart(QWidget):
+    '''
+    Scrolling plot of recorded telemetry, one panel per group of traces sharing a vertical range.
+
+    Each trace is a ColumnTrace of its TelemetryRecorder ring buffer, min/max decimated to the widget width: a frame
+    folds in only the samples recorded since the last one. The window is copied out of the rings again only when the
+    chart is shown or resized. A trace can only reach as far back as its ring holds, so the recorder should be sized
+    with historyCapacity(). Repaints run from a timer at fps, independent of how often the channels update, and the
+    timer only runs while the chart is shown.
+    '''
+
+    def __init__(self, recorder, panels, window=CHART_WINDOW_S, fps=CHART_FPS, parent=None):
+        '''
+        :param recorder: TelemetryRecorder holding the data
+        :param panels: List of (title, (low, high), [(channel name, color), ...])
+        :param window: Seconds of history shown
+        :param fps: Repaint rate
+        '''
+        super().__init__(parent)
+        self.recorder = recorder
+        self.panels = panels
+        self.window = window
+        self.setMinimumHeight(80 * len(panels))
+
+        self._counts = None
+        self._paintedAt = 0
+        self._traces = {}  # ColumnTrace of each channel, for _layout
+        self._layout = None  # (width, window) the traces were filled for
+        self._interval = round(1000 / fps)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+
+    def setFps(self, fps):
+        self._interval = round(1000 / fps)
+        if self._timer.isActive():
+            self._timer.start(self._interval)
+
+    def showEvent(self, e):
+        self._timer.start(self._interval)
+        super().showEvent(e)
+
+    def hideEvent(self, e):
+        # Hidden, nothing is folded in: start over from the rings when shown again
+        self._timer.stop()
+        self._traces = {}
+        self._layout = None
+        super().hideEvent(e)
+
+    def refresh(self):
+        '''Repaint if anything was recorded since the last frame, or time has scrolled a pixel'''
+        counts = [self.recorder.buffers[name].count for _, _, traces in self.panels for name, _ in traces]
+        scrolled = self.window / max(1, self.width() - LABEL_WIDTH)
+        if counts != self._counts or telemetryTime() - self._paintedAt >= scrolled:
+            self._counts = counts
+            self.update()
+
+    def paintEvent(self, e):
+        width = self.width() - LABEL_WIDTH
+        if width <= 0:
+            return
+        span = self.window / width
+        if self._layout != (width, self.window):
+            t1 = telemetryTime()
+            self._traces = {name: ColumnTrace(self.recorder.buffers[name], span, width)
+                            for _, _, traces in self.panels for name, _ in traces}
+            for trace in self._traces.values():
+                trace.fill(t1)
+            self._layout = (width, self.window)
+        else:
+            for trace in self._traces.values():
+                trace.update()
+        # Read the clock after the rings, so that every sample folded in is at or before the newest column
+        self._paintedAt = telemetryTime()
+        newest = int(self._paintedAt // span)
+        height = (self.height() - PANEL_GAP * (len(self.panels) - 1)) / len(self.panels)
+
+        p = QPainter(self)
+        for row, (title, (bottom, top), traces) in enumerate(self.panels):
+            y = row * (height + PANEL_GAP)
+            rect = QRectF(LABEL_WIDTH, y, width, height)
+            p.setPen(QPen(Qt.lightGray))
+            p.drawRect(rect)
+            p.setPen(QPen(Qt.black))
+            p.drawText(QRectF(0, y, LABEL_WIDTH - 4, height), Qt.AlignRight | Qt.AlignVCenter, title)
+            p.drawText(QRectF(0, y, LABEL_WIDTH - 4, height), Qt.AlignRight | Qt.AlignTop, f'{top:g}')
+            p.drawText(QRectF(0, y, LABEL_WIDTH - 4, height), Qt.AlignRight | Qt.AlignBottom, f'{bottom:g}')
+
+            scale = (height - 2) / (top - bottom)
+            for name, color in traces:
+                low, high = self._traces[name].columns(newest)
+
+                columns = np.flatnonzero(~np.isnan(low))
+                ylow = y + height - 1 - (np.clip(low[columns], bottom, top) - bottom) * scale
+                yhigh = y + height - 1 - (np.clip(high[columns], bottom, top) - bottom) * scale
+                x = LABEL_WIDTH + columns + 0.5
+                p.setPen(QPen(QColor(color)))
+                p.drawLines([QLineF(x[i], ylow[i] + 0.5, x[i], yhigh[i] - 0.5) for i in range(len(columns))])
+        p.end()
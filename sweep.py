@@ -0,0 +1,204 @@
+import collections
+import csv
+import itertools
+
+import numpy as np
+
+import motionprofile
+from controller import LOOP_SETTLE_MS
+from motionprofile import moveTimes
+from sequenceplayer import Segment
+
+# Loop states a sweep can visit at each setpoint, and the dtlp/dmlp value for each
+LOOP_STATES = {'open': 'OPEN', 'closed': 'CLOSE'}
+TWO_OPT_PASSES = 50
+
+# One row of a sweep's results: the setpoint, the loop state, and how long the move took against its prediction.
+# actual is the backend time from sending a role's setpoints until its stages came to rest, and settle how much of it
+# went beyond the predicted profile.
+SweepResult = collections.namedtuple('SweepResult', [
+    'index', 'altitude', 'position', 'velocity', 'accel', 'loop', 'predictedAlt', 'predictedWind', 'actualAlt',
+    'actualWind', 'settleAlt', 'settleWind'])
+
+
+def parseValues(text):
+    '''
+    Values for one axis of a grid: "start:stop:step" (stop included) or a comma separated list.
+
+    :param text: e.g. "5:12:1" or "10,20,40"
+    '''
+    if ':' in text:
+        start, stop, step = map(float, text.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return list(np.round(start + step * np.arange(count), 9))
+    return [float(value) for value in text.split(',')]
+
+
+def grid(altitudes, positions, velocities, accels):
+    '''Every combination of the axis values, in raster order, as Segments'''
+    return [Segment(None, position, velocity, accel, altitude)
+            for altitude, position, velocity, accel in itertools.product(altitudes, positions, velocities, accels)]
+
+
+def transitionTimes(points, start, altVelocity, altAccelTime, parallel=False):
+    '''
+    Predicted seconds from each setpoint to each other one: the altitude move at the altitude stage's own VELO/ACCL,
+    then the wind move at the destination's velocity and acceleration.
+
+    :param points: Setpoints as Segments
+    :param start: Segment the stages start from; becomes node 0
+    :param parallel: The stages move at the same time, so the longer move is the cost
+    :return: (n + 1, n + 1) array; [i, j] is the time from node i to node j, where node j > 0 is points[j - 1]
+    '''
+    nodes = [start] + list(points)
+    altitude = np.array([node.altitude for node in nodes])
+    position = np.array([node.position for node in nodes])
+    velocity = np.array([node.velocity for node in nodes])
+    accel = np.array([node.accel for node in nodes])
+    alt = moveTimes(altitude[None, :] - altitude[:, None], altVelocity, altAccelTime)
+    wind = moveTimes(position[None, :] - position[:, None], velocity[None, :], accel[None, :])
+    if parallel:
+        return np.maximum(alt, wind)
+    return alt + wind
+
+
+def pathTime(costs, tour):
+    '''Predicted seconds to visit the nodes of tour in order'''
+    tour = np.asarray(tour)
+    return float(costs[tour[:-1], tour[1:]].sum())
+
+
+def order(costs, passes=TWO_OPT_PASSES):
+    '''
+    Order the setpoints to keep total stage travel time short: a nearest-neighbour tour from node 0, improved by
+    2-opt segment reversals. Move times are not symmetric (the wind move runs at the destination's velocity), so each
+    reversal is costed in the direction it would actually be travelled.
+
+    :param costs: Matrix from transitionTimes()
+    :param passes: Most 2-opt passes to make
+    :return: Node numbers in visiting order, starting with 0
+    '''
+    n = len(costs)
+    tour = [0]
+    left = set(range(1, n))
+    while left:
+        here = tour[-1]
+        nearest = min(left, key=lambda node: costs[here, node])
+        tour.append(nearest)
+        left.remove(nearest)
+
+    tour = np.array(tour)
+    for _ in range(passes):
+        improved = False
+        for i in range(1, n - 1):
+            forward = np.r_[0, np.cumsum(costs[tour[:-1], tour[1:]])]
+            backward = np.r_[0, np.cumsum(costs[tour[1:], tour[:-1]])]
+            j = np.arange(i + 1, n)
+            after = np.append(tour[j[:-1] + 1], -1)
+            last = after < 0
+            old = costs[tour[i - 1], tour[i]] + forward[j] - forward[i] + \
+                np.where(last, 0, costs[tour[j], after])
+            new = costs[tour[i - 1], tour[j]] + backward[j] - backward[i] + \
+                np.where(last, 0, costs[tour[i], after])
+            best = np.argmin(new - old)
+            if new[best] - old[best] < -1e-9:
+                tour[i:j[best] + 1] = tour[i:j[best] + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return list(tour)
+
+
+class Sweep:
+    '''
+    Runs a list of setpoints through a TelSimController, in the order that keeps stage travel shortest, optionally
+    opening and closing the loop at each one.
+    '''
+
+    def __init__(self, points, loops=(None,), dwell=0.0, reorder=True, measure=None):
+        '''
+        :param points: Setpoints as Segments, e.g. from grid()
+        :param loops: Loop states to visit at each setpoint, keys of LOOP_STATES; None leaves the loop alone
+        :param dwell: Seconds to stay in each loop state
+        :param reorder: Visit the points in order() rather than as given
+        :param measure: Called with (Segment, loop) after each dwell, e.g. to take calibration data
+        '''
+        self.points = list(points)
+        self.loops = list(loops)
+        self.dwell = dwell
+        self.reorder = reorder
+        self.measure = measure
+        self.results = []
+        self.predicted = None  # Predicted stage travel seconds, (as given, as run)
+
+    def run(self, controller, report=None):
+        '''
+        Visit every point. The controller must be in IDLE.
+
+        :param controller: TelSimController
+        :param report: Called with each SweepResult as it is recorded
+        :return: List of SweepResult
+        '''
+        # Costed on the first stage of each role; the others move to the same setpoints
+        start = Segment(None, controller.readback('wind'), controller.readback('wind', 'VELO'),
+                        controller.readback('wind', 'ACCL'), controller.readback('alt'))
+        costs = transitionTimes(self.points, start, controller.readback('alt', 'VELO'),
+                                controller.readback('alt', 'ACCL'), controller.parallel)
+        given = list(range(len(self.points) + 1))
+        tour = order(costs) if self.reorder else given
+        self.predicted = (pathTime(costs, given), pathTime(costs, tour))
+
+        keywords = {}
+        if any(self.loops):
+            keywords = {name: controller.backend.keyword('ao1', name) for name in ['dtlp', 'dmlp']}
+
+        settled = {}
+
+        def stopped(role, seconds):
+            settled[role] = seconds
+
+        controller.settled.connect(stopped)
+        try:
+            self._visit(controller, keywords, tour, settled, report)
+        finally:
+            controller.settled.disconnect(stopped)
+        return self.results
+
+    def _visit(self, controller, keywords, tour, settled, report):
+        for node in tour[1:]:
+            point = self.points[node - 1]
+            settled.clear()
+            controller.move(point.altitude, point.position, point.velocity, point.accel)
+            controller.waitForSettled(motionprofile.TIMEOUT_MARGIN_S)
+            actualAlt = settled['alt']
+            actualWind = settled['wind']
+            prediction = controller.prediction
+
+            for loop in self.loops:
+                if loop is not None:
+                    self.setLoop(controller, keywords, LOOP_STATES[loop])
+                controller.wait(self.dwell)
+                if self.measure is not None:
+                    self.measure(point, loop)
+                result = SweepResult(node - 1, point.altitude, point.position, point.velocity, point.accel, loop,
+                                     prediction.alt, prediction.wind, actualAlt, actualWind,
+                                     actualAlt - prediction.alt, actualWind - prediction.wind)
+                self.results.append(result)
+                if report is not None:
+                    report(result)
+
+    def setLoop(self, controller, keywords, value):
+        '''Open or close the loop in the same order as the GUI buttons: dmlp first to open, dtlp first to close'''
+        first, second = ('dmlp', 'dtlp') if value == 'OPEN' else ('dtlp', 'dmlp')
+        if keywords[first].read() != value:
+            keywords[first].write(value)
+            controller.wait(LOOP_SETTLE_MS / 1000)
+        if keywords[second].read() != value:
+            keywords[second].write(value)
+
+    def write(self, path):
+        '''Save the results as CSV'''
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(SweepResult._fields)
+            writer.writerows(self.results)
@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Samples kept in memory per channel
+RING_CAPACITY = 1 << 18
+
+# On-disk log: MAGIC, one line of JSON header, then packed RECORD_DTYPE records appended in batches
+MAGIC = b'TELSIMLOG1\n'
+RECORD_DTYPE = np.dtype([('time', '<f8'), ('channel', '<u2'), ('value', '<f8')])
+FLUSH_INTERVAL_S = 1.0
+
+# KTL string keywords are logged as numbers
+KEYWORD_VALUES = {'OPEN': 0.0, 'CLOSE': 1.0}
+
+# Records between TelemetryLog index entries, and records read at once while building the index
+INDEX_STRIDE = 4096
+INDEX_CHUNK = INDEX_STRIDE * 256
+
+
+def telemetryTime():
+    '''
+    Time telemetry is stamped with: time.monotonic(), which never steps back as the wall clock can. A log's header
+    holds wallOffset, to add to get time.time().
+    '''
+    return time.monotonic()
+
+
+class RingBuffer:
+    '''
+    Preallocated timestamp/value arrays for one channel. append() only writes into the arrays, so recording a sample
+    allocates nothing that outlives the call.
+    '''
+
+    def __init__(self, capacity=RING_CAPACITY, lock=None):
+        '''
+        :param capacity: Samples kept
+        :param lock: Lock shared with other buffers, so that they can all be read at one instant
+        '''
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.count = 0  # Samples ever appended; the newest is at (count - 1) % capacity
+        self.lock = threading.Lock() if lock is None else lock
+
+    def append(self, t, value):
+        with self.lock:
+            self._append(t, value)
+
+    def stamp(self, value):
+        '''
+        Append a value at telemetryTime(), read under the lock: the samples of buffers sharing the lock are stamped in
+        the order they are appended.
+        '''
+        with self.lock:
+            self._append(telemetryTime(), value)
+
+    def _append(self, t, value):
+        i = self.count % self.capacity
+        self.times[i] = t
+        self.values[i] = value
+        self.count += 1
+
+    def since(self, start):
+        '''
+        Copies of the samples appended since sample number start, oldest first, and the new count. Samples that have
+        already been overwritten are skipped.
+        '''
+        with self.lock:
+            return self._since(start)
+
+    def _since(self, start):
+        end = self.count
+        start = max(start, end - self.capacity)
+        index = np.arange(start, end) % self.capacity
+        return self.times[index], self.values[index], end
+
+    def window(self, t0):
+        '''
+        Copies of the samples from time t0 on, oldest first, the value held coming into t0 (None if that sample has
+        been overwritten or there is none) and the count, as for since(). Only the samples in the window are copied.
+        '''
+        with self.lock:
+            end = self.count
+            n = min(end, self.capacity)
+            # Retained samples are in time order in two runs: from the oldest to the end of the arrays, then from 0
+            oldest = (end - n) % self.capacity
+            firstRun = min(n, self.capacity - oldest)
+            if n > firstRun and self.times[0] <= t0:
+                skip = firstRun + int(np.searchsorted(self.times[:n - firstRun], t0))
+            else:
+                skip = int(np.searchsorted(self.times[oldest:oldest + firstRun], t0))
+            start = end - n + skip
+            before = self.values[(start - 1) % self.capacity] if skip > 0 else None
+            index = np.arange(start, end) % self.capacity
+            return self.times[index], self.values[index], before, end
+
+
+class TelemetryRecorder:
+    '''
+    Timestamps channel monitor updates with telemetryTime() into one RingBuffer per channel and, if given a path,
+    appends them to a binary log from a background thread every FLUSH_INTERVAL_S.
+
+    The GUI thread only ever calls record()/recordKeyword(), which write into the ring buffers; the file I/O happens
+    on the flush thread.
+    '''
+
+    def __init__(self, channels, path=None, capacity=RING_CAPACITY):
+        '''
+        :param channels: Names of the channels to record, e.g. PV names
+        :param path: Log file to create; None keeps the history in memory only
+        :param capacity: Samples kept in memory per channel
+        '''
+        self.channels = list(channels)
+        # One lock for every buffer, so a flush reads them all at the same instant
+        self._lock = threading.Lock()
+        self.buffers = {name: RingBuffer(capacity, self._lock) for name in self.channels}
+        self.path = path
+        self.dropped = 0  # Samples overwritten before the flush thread got to them
+
+        self._flushed = {name: 0 for name in self.channels}
+        self._stop = threading.Event()
+        self._thread = None
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(json.dumps({'channels': self.channels, 'dtype': RECORD_DTYPE.descr, 'created': telemetryTime(),
+                                    'wallOffset': time.time() - telemetryTime()}).encode() + b'\n')
+            self._thread = threading.Thread(target=self._flushLoop, name='telemetry-flush', daemon=True)
+            self._thread.start()
+
+    def record(self, name, value):
+        self.buffers[name].stamp(value)
+
+    def recordKeyword(self, name, value):
+        '''Record a KTL string keyword: OPEN/CLOSE as 0/1, anything else as a number if it is one'''
+        if value in KEYWORD_VALUES:
+            self.record(name, KEYWORD_VALUES[value])
+            return
+        try:
+            self.record(name, float(value))
+        except ValueError:
+            pass
+
+    def recorder(self, name):
+        '''A one-argument callable recording into channel name, for connecting to a floatCallback signal'''
+        return self.buffers[name].stamp
+
+    def flush(self):
+        '''Append every sample not yet written to the log'''
+        if self.path is None:
+            return
+
+        # Every channel is read at one instant, under the lock the samples are stamped under: any sample not in this
+        # batch is stamped later than every sample in it, so the log stays in time order across batches
+        with self._lock:
+            new = [self.buffers[name]._since(self._flushed[name]) for name in self.channels]
+        batches = []
+        for channel, (name, (times, values, end)) in enumerate(zip(self.channels, new)):
+            self.dropped += end - self._flushed[name] - len(times)
+            self._flushed[name] = end
+            if len(times):
+                batch = np.empty(len(times), dtype=RECORD_DTYPE)
+                batch['time'] = times
+                batch['channel'] = channel
+                batch['value'] = values
+                batches.append(batch)
+
+        if batches:
+            records = np.concatenate(batches)
+            records.sort(order='time', kind='stable')
+            with open(self.path, 'ab') as f:
+                records.tofile(f)
+
+    def close(self):
+        '''Stop the flush thread and write out whatever is left'''
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.flush()
+
+    def _flushLoop(self):
+        while not self._stop.wait(FLUSH_INTERVAL_S):
+            self.flush()
+
+
+def readLog(path):
+    '''
+    Read a whole telemetry log.
+
+    :param path: File written by TelemetryRecorder
+    :return: (channel names, RECORD_DTYPE array)
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a telemetry log')
+        header = json.loads(f.readline())
+        offset = f.tell()
+    return header['channels'], np.fromfile(path, dtype=RECORD_DTYPE, offset=offset)
+
+
+class TelemetryLog:
+    '''
+    A telemetry log opened for random access. The records are memory mapped, not read, and a sparse index (the time
+    and the latest value of every channel every INDEX_STRIDE records) finds the records and channel values at any
+    time by reading at most INDEX_STRIDE records.
+
+    The index is built with one pass over the log the first time it is opened, and saved next to it as
+    <log>.index.npz, so later opens of a long night's log do not read the records at all. It is rebuilt if the log
+    has grown since.
+    '''
+
+    def __init__(self, path, stride=INDEX_STRIDE):
+        '''
+        :param path: File written by TelemetryRecorder
+        :raises ValueError: If it is not a telemetry log
+        '''
+        self.path = path
+        self.stride = stride
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a telemetry log')
+            self.header = json.loads(f.readline())
+            offset = f.tell()
+        self.channels = self.header['channels']
+        # Add to record times for time.time(); logs from before telemetryTime() were stamped with time.time()
+        self.wallOffset = self.header.get('wallOffset', 0.0)
+        # A log still being written may end part way through a record
+        count = (os.path.getsize(path) - offset) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.indexTimes, self.snapshots = self._loadIndex()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def start(self):
+        return float(self.records[0]['time']) if len(self.records) else self.header['created']
+
+    @property
+    def end(self):
+        return float(self.records[-1]['time']) if len(self.records) else self.header['created']
+
+    def locate(self, t):
+        '''Number of the first record at or after time t'''
+        block = max(int(np.searchsorted(self.indexTimes, t, side='right')) - 1, 0)
+        first = block * self.stride
+        times = self.records['time'][first:first + self.stride + 1]
+        return first + int(np.searchsorted(times, t, side='left'))
+
+    def snapshot(self, n):
+        '''Latest value of every channel before record n, NaN for a channel not logged by then'''
+        block = min(n // self.stride, len(self.snapshots) - 1)
+        values = self.snapshots[block].copy() if len(self.snapshots) else np.full(len(self.channels), np.nan)
+        records = np.array(self.records[block * self.stride:n])[::-1]
+        channels, newest = np.unique(records['channel'], return_index=True)
+        values[channels] = records['value'][newest]
+        return values
+
+    def _loadIndex(self):
+        indexPath = self.path + '.index.npz'
+        try:
+            with np.load(indexPath) as index:
+                if int(index['count']) == len(self.records) and int(index['stride']) == self.stride:
+                    return index['times'], index['snapshots']
+        except (OSError, KeyError, ValueError):
+            pass
+
+        times, snapshots = self._buildIndex()
+        try:
+            np.savez(indexPath, count=len(self.records), stride=self.stride, times=times, snapshots=snapshots)
+        except OSError:
+            # A log in a read-only directory is indexed every time it is opened
+            pass
+        return times, snapshots
+
+    def _buildIndex(self):
+        '''Times of every stride-th record, and the latest value of each channel before it'''
+        boundaries = np.arange(0, len(self.records), self.stride)
+        times = np.array(self.records['time'][boundaries])
+        snapshots = np.full((len(boundaries), len(self.channels)), np.nan)
+        latest = np.full(len(self.channels), np.nan)
+        chunkSize = max(INDEX_CHUNK // self.stride, 1) * self.stride
+        for start in range(0, len(self.records), chunkSize):
+            chunk = np.array(self.records[start:start + chunkSize])
+            rows = np.arange(start // self.stride, min((start + len(chunk) - 1) // self.stride + 1, len(boundaries)))
+            relative = boundaries[rows] - start
+            for channel in range(len(self.channels)):
+                positions = np.flatnonzero(chunk['channel'] == channel)
+                before = np.searchsorted(positions, relative, side='left') - 1
+                if len(positions):
+                    values = chunk['value'][positions[np.maximum(before, 0)]]
+                    snapshots[rows, channel] = np.where(before >= 0, values, latest[channel])
+                    latest[channel] = chunk['value'][positions[-1]]
+                else:
+                    snapshots[rows, channel] = latest[channel]
+        return times, snapshots
@@ -4,84 +4,171 @@
 # the actual Python interpreter.
 
 import os
+import time
 
-# Setup an EPICS address list if one is not already defined
-addrs = 'localhost:5064 vm-k1epicsgateway:5064 vm-k2epicsgateway:5064 k1aoserver-new:8607 localhost:5555 localhost:5556 k1aoserver-new:5064'
-
-
-
-# addrs = 'localhost:5064 vm-k1epicsgateway:5064 vm-k2epicsgateway:5064 k1aoserver-new:5064 localhost:5555 localhost:5556'
-
-print(f'Overriding EPICS address list to: {addrs}')
-os.environ['EPICS_CA_ADDR_LIST'] = addrs
-os.environ['EPICS_CA_AUTO_ADDR_LIST'] = 'NO'
-
-# Keck library includes
-import ktl  # provided by kroot/ktl/keyword/python
-import kPyQt  # provided by kroot/kui/kPyQt
+_importStart = time.perf_counter()  # For --profile-startup
 
 import logging, coloredlogs
 import argparse
 import sys
-import base64
-from dateutil.parser import isoparse
-import requests
-import io
-from enum import Enum, auto
-import urllib
 import functools
-import subprocess
-import time
-import math
+import itertools
+import shlex
 
 from PyQt5 import QtCore, QtWidgets, uic
 from PyQt5.QtWidgets import QStatusBar, QMessageBox, QWidget, QVBoxLayout, QLabel, QPushButton, \
-    QToolButton, QSpacerItem, QSizePolicy, QFileDialog, QShortcut, QLCDNumber, QLayout
+    QToolButton, QSpacerItem, QSizePolicy, QFileDialog, QShortcut, QLCDNumber, QLayout, QDockWidget
 from PyQt5.QtCore import Qt, QSize, QTimer
 from PyQt5.QtGui import QFont, QIcon, QPixmap, QImage, QIntValidator, QDoubleValidator, QKeySequence
 from PyQt5.Qt import QApplication
 
 from PToggle import PToggle, PAnimatedToggle
+from sequencer import ActionSequencer
+from backend import KeckBackend, ChannelConnector
+from sequenceplayer import Segment
+from reconstructor import ReconstructorLoader
+from telemetry import TelemetryRecorder, RING_CAPACITY
+from stripchart import StripChart, CHART_FPS, CHART_RATE_HZ, CHART_WINDOW_S, historyCapacity
+from coalesce import DisplayCoalescer
+from controller import TelSimController, TelSimStates, runHeadless, LOOP_SETTLE_MS
+from stages import StageRegistry, validator, FIELDS
+from sweep import Sweep, grid, parseValues
+from timing import TimingPanel
+from launcher import ProcessLauncher
+from proxy import TelemetryProxy, ProxyBackend, PROXY_SOCKET
+from validation import GAIN, FRAME_RATE
+
+# Widgets built by pyuic5 from telsim.ui, if that has been run (see README); loading the .ui file is the fallback
+try:
+    from telsim_ui import Ui_MainWindow
+except ImportError:
+    Ui_MainWindow = None
 
 debug = False
+log = logging.getLogger('')
 
 SECONDS = 1
-UNBINNED_MODE = 2000
-BINNED_MODE = 3600
-WIND_POS_HOME = 0.00
-VEL_HOME = 2.00
-ACCEL_HOME = 0.10
-ALT_POS_HOME = 5.0
-STOP = "0"
-MOVE = "3"
-WIND_POS_MIN = -40.00
-WIND_POS_MAX = 40.00
-VEL_MIN = 2.00
-VEL_MAX = 80.00
-ACCEL_MIN = 0.00
-ACCEL_MAX = 10.00
-ALT_MIN = 5.0
-ALT_MAX = 12.0
-GAIN_MIN = 0
-GAIN_MAX = 1
-FRAMERATE_MIN = 1
-TIMEOUT_MS = 45000
 STATUS_RED_STYLE = 'background-color: rgb(255, 0, 0);'
 # STATUS_GREEN_STYLE = 'background-color: rgb(0, 255, 0);'
 MESSAGE_LIMIT = 100
-
-
-class TelSimStates(Enum):
-    INIT = 0
-    OFF = auto()
-    IDLE = auto()
-    MOVE_ALT = auto()
-    AWAIT_ALT = auto()
-    MOVE_WIND = auto()
-    AWAIT_WIND = auto()
-    STOPPED = auto()
-    CLEANUP = auto()
-    AWAIT_CLEANUP = auto()
+LOOP_CONFIRM_MS = 5000  # Longest wait for the first loop keyword to read back before the second is written
+
+# Monitors kept by the telemetry recorder for every stage, and for the loop state, frame rate and gain: everything the
+# window and controller follow, so that a log can be replayed into them (--replay)
+STAGE_TELEMETRY = {'alt': ['RBV', 'VAL', 'VELO', 'ACCL', 'MOVN'], 'wind': ['RBV', 'VAL', 'VELO', 'ACCL', 'MOVN']}
+LOOP_TELEMETRY = ['ao1.dtlp', 'ao1.dmlp', 'ao1.wsfrrt', 'k1:ao:wc:dt:sv:gain']
+
+# Strip chart colors of the setpoint and readback, and of the velocity, of each stage of a role in turn
+CHART_COLORS = [('gray', 'blue'), ('darkGray', 'darkMagenta'), ('lightGray', 'darkCyan'), ('gray', 'darkYellow')]
+VELOCITY_COLORS = ['darkGreen', 'darkRed', 'darkBlue', 'darkCyan']
+
+
+# Channels created by the backend besides the stages', as (attribute, PV name): the loop gain. Fake PV for gain
+# for now (gain keyword is not configured for the new RTC). Actual keyword is o1wgs
+CHANNELS = [('gain_keyword', 'k1:ao:wc:dt:sv:gain')]
+
+# KTL keywords created by the backend, as (attribute, service, keyword)
+KEYWORDS = [
+    ('dt_keyword', 'ao1', 'dtlp'),
+    ('dm_keyword', 'ao1', 'dmlp'),
+    # Alternate keyword for frame rate for now (framerate keyword is not configured for the new RTC). Actual keyword
+    # is o1fps
+    ('frameRate_keyword', 'ao1', 'wsfrrt'),
+]
+
+# Edit boxes of the first stage of each role, as (box, role, field): the box shows the field's monitor and takes a
+# setpoint within the field's limits
+STAGE_BOXES = [('posBox', 'wind', 'RBV'), ('velBox', 'wind', 'VELO'), ('accelBox', 'wind', 'ACCL'),
+               ('altBox', 'alt', 'RBV')]
+
+# Edit boxes showing "connecting..." until their channel has connected
+CONNECTING_BOXES = ['posBox', 'velBox', 'accelBox', 'altBox', 'gainInput', 'frameRateInput']
+
+# Widget state applied once on entry to each state, as (widget, property, value). 'controls' stands for every
+# widget in self.controls. Widgets a state does not mention keep whatever the previous state left them with.
+STATE_VIEWS = {
+    TelSimStates.CONNECTING: [
+        ('startButton', 'visible', True), ('startButton', 'enabled', False),
+        ('stopButton', 'visible', False),
+        ('setupTelSIMButton', 'enabled', False), ('setupTelSIMButton', 'visible', True),
+        ('closeTelSIMButton', 'enabled', False), ('closeTelSIMButton', 'visible', False),
+        ('controls', 'enabled', False),
+    ],
+    TelSimStates.OFF: [
+        ('startButton', 'visible', True), ('startButton', 'enabled', False),
+        ('stopButton', 'visible', False),
+        ('setupTelSIMButton', 'enabled', True), ('setupTelSIMButton', 'visible', True),
+        ('closeTelSIMButton', 'enabled', False), ('closeTelSIMButton', 'visible', False),
+        ('controls', 'enabled', False),
+    ],
+    TelSimStates.IDLE: [
+        ('startstopBox', 'enabled', True),
+        ('startButton', 'visible', True), ('startButton', 'enabled', True),
+        ('stopButton', 'visible', False), ('stopButton', 'enabled', False),
+        ('setupTelSIMButton', 'enabled', False), ('setupTelSIMButton', 'visible', False),
+        ('closeTelSIMButton', 'enabled', True), ('closeTelSIMButton', 'visible', True),
+        ('LCDnumbers', 'display', '0.00'),
+        ('controls', 'enabled', True),
+    ],
+    TelSimStates.AWAIT_ALT: [
+        ('controls', 'enabled', False),
+        ('startButton', 'visible', False), ('startButton', 'enabled', False),
+        ('stopButton', 'visible', True), ('stopButton', 'enabled', True),
+    ],
+    TelSimStates.AWAIT_BOTH: [
+        ('controls', 'enabled', False),
+        ('startButton', 'visible', False), ('startButton', 'enabled', False),
+        ('stopButton', 'visible', True), ('stopButton', 'enabled', True),
+    ],
+    TelSimStates.PAUSED: [
+        ('controls', 'enabled', False),
+        ('startButton', 'visible', False), ('startButton', 'enabled', False),
+        ('stopButton', 'visible', True), ('stopButton', 'enabled', True),
+    ],
+    TelSimStates.CLEANUP: [
+        ('closeTelSIMButton', 'visible', False), ('closeTelSIMButton', 'enabled', False),
+        ('setupTelSIMButton', 'visible', True), ('setupTelSIMButton', 'enabled', False),
+        ('startstopBox', 'enabled', False),
+        ('controls', 'enabled', False),
+    ],
+}
+
+# Qt setter for each view property
+VIEW_SETTERS = {'visible': 'setVisible', 'enabled': 'setEnabled', 'display': 'display', 'message': 'showMessage'}
+
+# Widgets that write, kept disabled whatever the state on a read-only backend (a telemetry proxy client without
+# control)
+WRITE_WIDGETS = ['controls', 'startButton', 'stopButton', 'setupTelSIMButton', 'closeTelSIMButton']
+
+
+def telemetryChannels(stages):
+    '''Channels the telemetry recorder keeps, for a StageRegistry'''
+    return [stage.pv(field) for stage in stages for field in STAGE_TELEMETRY[stage.role]] + LOOP_TELEMETRY
+
+
+def chartPanels(stages):
+    '''
+    Strip chart panels for a StageRegistry, as (title, (bottom, top), [(telemetry channel, color), ...]): every wind
+    stage's position and velocity, every altitude stage's position, and the loop state.
+    '''
+    def positions(role):
+        lines = []
+        for stage, (setpoint, readback) in zip(stages.role(role), itertools.cycle(CHART_COLORS)):
+            lines += [(stage.pv('VAL'), setpoint), (stage.pv('RBV'), readback)]
+        return lines
+
+    def span(role, field):
+        limits = [stage.limits[field] for stage in stages.role(role)]
+        return min(limit.low for limit in limits), max(limit.high for limit in limits)
+
+    velocities = [(stage.pv('VELO'), color)
+                  for stage, color in zip(stages.role('wind'), itertools.cycle(VELOCITY_COLORS))]
+    return [
+        ('Wind position', span('wind', 'VAL'), positions('wind')),
+        ('Wind velocity', (0, span('wind', 'VELO')[1]), velocities),
+        ('Altitude', span('alt', 'VAL'), positions('alt')),
+        ('Loop closed', (0, 1), [('ao1.dtlp', 'red'), ('ao1.dmlp', 'darkRed')]),
+    ]
 
 
 def showDialog(text, yes=False, cancel=False):
@@ -116,8 +203,35 @@ def showDialog(text, yes=False, cancel=False):
         return False
 
 
+class StartupProfile:
+    '''Per-phase startup timing for --profile-startup'''
+
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    def mark(self, phase):
+        '''Record the time since the previous mark as phase'''
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def add(self, phase, seconds):
+        '''Record a phase that ran in the background, overlapping the others'''
+        self.phases.append((phase, seconds))
+
+    def report(self):
+        print('Startup profile:')
+        for phase, seconds in self.phases:
+            print(f'  {phase:<40s} {seconds * 1000:8.1f} ms')
+        print(f'  {"total until ready":<40s} {(time.perf_counter() - self.start) * 1000:8.1f} ms')
+
+
 class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
 
+    stateChanged = QtCore.pyqtSignal(object)
+
     # -----------------------------------------------------------------------------
     def __init__(self, *args, **kwargs):
 
@@ -138,12 +252,43 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         if not os.path.exists(filename):
             filename = os.path.join(os.environ['KROOT'], 'rel/ao/default/data', uifile)
 
-        uic.loadUi(filename, self)
+        # Use the precompiled module unless telsim.ui has been edited since it was generated
+        compiled = Ui_MainWindow is not None and \
+            os.path.getmtime(sys.modules['telsim_ui'].__file__) >= os.path.getmtime(filename)
+        if compiled:
+            ui = Ui_MainWindow()
+            ui.setupUi(self)
+            self.__dict__.update(vars(ui))
+        else:
+            uic.loadUi(filename, self)
 
     # -----------------------------------------------------------------------------
-    def setupUI(self, channels=None):
+    def setupUI(self, backend=None, recordPath=None, chartFps=CHART_FPS, chartWindow=CHART_WINDOW_S,
+                backgroundConnect=False, profile=None, stages=None):
+        '''
+        Build the widgets, channels and state machine.
+
+        :param backend: Source of channels and keywords; KeckBackend (live EPICS/KTL) if not given
+        :param recordPath: Telemetry log file to write; telemetry is only kept in memory if not given
+        :param chartFps: Strip chart repaint rate
+        :param chartWindow: Seconds of history in the strip chart
+        :param backgroundConnect: Return without waiting for the channels; they are created in parallel off the GUI
+                                  thread while the state machine waits in CONNECTING
+        :param profile: StartupProfile to record phases in, if any
+        :param stages: stages.StageRegistry of the stages to drive; loaded from stages.ini if not given
+        '''
+        self.profile = profile
+        if backend is None:
+            backend = KeckBackend()
+        self.backend = backend
+        self.readOnly = getattr(backend, 'readOnly', False)
+        self.stages = StageRegistry.load() if stages is None else stages
+        self.recorder = TelemetryRecorder(telemetryChannels(self.stages), recordPath,
+                                          historyCapacity(chartWindow, RING_CAPACITY))
 
         title = 'Telescope Simulator GUI'
+        if self.readOnly:
+            title += ' (read only)'
         self.setWindowTitle(title)
 
         # -----------------------------------------------------------------------------
@@ -153,9 +298,13 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         # Timers
         self.countdownTimer = QTimer()  # Display timer
         self.countdownTimer.setSingleShot(True)
-        self.LCDnumbers.display("0.00")
         self.secondsToMove = 0
 
+        # Last value applied to each (widget, property) by setView(), and how many Qt calls that took
+        self._view = {}
+        self.widgetMutations = 0
+        self.setView('LCDnumbers', 'display', '0.00')
+
         # Enabling/disabling feature when TelSIM button pressed
         self.controls = [self.windTSBox, self.TSBox, self.altGroupBox, self.wavefrontGroupBox, self.fileGroupBox,
                          self.loopocBox, self.loopControlLabel]
@@ -169,21 +318,11 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         self.unbin.toggled.connect(lambda: self.frameRateCheck(self.frameRateInput.text()))
 
         # Creates 'changed' attributes for the background color feature while editing
-        setattr(self.posBox, 'changed', False)
-        self.posBox.editingFinished.connect(lambda: self.posCheck(self.posBox.text()))
-        self.posBox.textChanged.connect(lambda: self.editTextChanged(self.posBox))
-
-        setattr(self.velBox, 'changed', False)
-        self.velBox.editingFinished.connect(lambda: self.velCheck(self.velBox.text()))
-        self.velBox.textChanged.connect(lambda: self.editTextChanged(self.velBox))
-
-        setattr(self.accelBox, 'changed', False)
-        self.accelBox.editingFinished.connect(lambda: self.accelCheck(self.accelBox.text()))
-        self.accelBox.textChanged.connect(lambda: self.editTextChanged(self.accelBox))
-
-        setattr(self.altBox, 'changed', False)
-        self.altBox.editingFinished.connect(lambda: self.altCheck(self.altBox.text()))
-        self.altBox.textChanged.connect(lambda: self.editTextChanged(self.altBox))
+        for name, role, field in STAGE_BOXES:
+            box = getattr(self, name)
+            setattr(box, 'changed', False)
+            box.editingFinished.connect(functools.partial(self.stageCheck, box, self.stages.primary(role), field))
+            box.textChanged.connect(functools.partial(self.editTextChanged, box))
 
         setattr(self.gainInput, 'changed', False)
         self.gainInput.editingFinished.connect(lambda: self.gainCheck(self.gainInput.text()))
@@ -193,306 +332,315 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         self.frameRateInput.editingFinished.connect(lambda: self.frameRateCheck(self.frameRateInput.text()))
         self.frameRateInput.textChanged.connect(lambda: self.editTextChanged(self.frameRateInput))
 
-        # Channel creation for the emulator
-        self.posChan = kPyQt.caFactory("wndsim:ln:m1.RBV", kPyQt.Channel.caFloat)
-        self.posWritingChan = kPyQt.caFactory("wndsim:ln:m1.VAL", kPyQt.Channel.caFloat)
-        self.posMovingChan = kPyQt.caFactory("wndsim:ln:m1.MOVN", kPyQt.Channel.caFloat)
-        self.velChan = kPyQt.caFactory("wndsim:ln:m1.VELO", kPyQt.Channel.caFloat)
-        self.accelChan = kPyQt.caFactory("wndsim:ln:m1.ACCL", kPyQt.Channel.caFloat)
-        self.altChan = kPyQt.caFactory("altsim:ln:m1.RBV", kPyQt.Channel.caFloat)
-        self.altWritingChan = kPyQt.caFactory("altsim:ln:m1.VAL", kPyQt.Channel.caFloat)
-        self.altMovingChan = kPyQt.caFactory("altsim:ln:m1.MOVN", kPyQt.Channel.caFloat)
-        self.windStopChan = kPyQt.caFactory("wndsim:ln:m1.SPMG", kPyQt.Channel.caFloat)
-        self.altStopChan = kPyQt.caFactory("altsim:ln:m1.SPMG", kPyQt.Channel.caFloat)
-
-        # Other GUI connections dropdown
-        self.oth1.triggered.connect(self.openOther)
-        self.oth2.triggered.connect(self.openOther)
-        self.oth3.triggered.connect(self.openOther)
-
-        # --------- Reading telemetry example -----------------------------------------
-        service = 'ao1'
-        ao1 = ktl.cache(service)
-        # -----------------------------------------------------------------------------------------
-        # A label attached to an KTL string keyword
-        dt_key = 'dtlp'
-        self.dt_keyword = kPyQt.kFactory(ao1[dt_key])
-
-        dm_key = 'dmlp'
-        self.dm_keyword = kPyQt.kFactory(ao1[dm_key])
-
-        fr_key = 'wsfrrt'  # Alternate keyword for frame rate for now (framerate keyword is not configured for the new RTC). Actual keyword is o1fps
-        self.frameRate_keyword = kPyQt.kFactory(ao1[fr_key])
-
-        gain_key = 'dtgain'  # Fake keyword for gain for now (gain keyword is not configured for the new RTC). Actual keyword is o1wgs
-        self.gain_keyword = kPyQt.caFactory('k1:ao:wc:dt:sv:gain', kPyQt.Channel.caFloat)
-
-        # -----------------------------------------------------------------------------------
+        for name in CONNECTING_BOXES:
+            getattr(self, name).setPlaceholderText('connecting...')
+
+        # Strip chart of the recorded telemetry, in a dock that starts hidden (View menu)
+        self.chart = StripChart(self.recorder, chartPanels(self.stages), window=chartWindow, fps=chartFps)
+        self.chartDock = QDockWidget('Strip chart', self)
+        self.chartDock.setWidget(self.chart)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.chartDock)
+        self.chartDock.hide()
+        self.menuView = self.menubar.addMenu('View')
+        self.menuView.addAction(self.chartDock.toggleViewAction())
+
+        # Move both stages at once instead of alt first, then wind, from the next move on
+        self.menuMotion = self.menubar.addMenu('Motion')
+        self.parallelAction = self.menuMotion.addAction('Move alt and wind together')
+        self.parallelAction.setCheckable(True)
+        self.parallelAction.toggled.connect(lambda checked: setattr(self.controller, 'parallel', checked))
+
+        # Other GUI connections dropdown. The GUIs start in the background; Running lists them, and stops one when
+        # clicked. Opening the menu gets the SSH connection ready for the launch.
+        self.launcher = ProcessLauncher(parent=self)
+        self.launcher.message.connect(self.postMessage)
+        for action in [self.oth1, self.oth2, self.oth3]:
+            action.triggered.connect(lambda checked, action=action: self.openOther(action))
+        self.menuOther_GUIs.aboutToShow.connect(self.launcher.warm)
+        self.menuRunning = self.menuOther_GUIs.addMenu('Running')
+        self.menuRunning.aboutToShow.connect(self.updateRunningMenu)
+        self.launcher.changed.connect(self.updateRunningMenu)
+        self.updateRunningMenu()
 
         # ------ Translation stages' toggles --------------------------------------------
-        self.TS1 = PToggle(handle_color=Qt.red, checked_color=Qt.green)
-        TS1lay = QVBoxLayout()
-        TS1lay.addWidget(self.TS1)
-        self.TS1tog.setLayout(TS1lay)
-        self.TS1.setCheckState(Qt.Unchecked)
-
-        self.TS2 = PToggle(handle_color=Qt.red, checked_color=Qt.green)
-        TS2lay = QVBoxLayout()
-        TS2lay.addWidget(self.TS2)
-        self.TS2tog.setLayout(TS2lay)
-        self.TS2.setCheckState(Qt.Unchecked)
+        # One row per stage in TSBox, checked once the stage's channels have connected. telsim.ui has the holders
+        # and labels of the first two rows (TS1tog, translation1ConnectionLabel, ...); further rows are added here.
+        self.stageToggles = {}
+        for row, stage in enumerate(self.stages):
+            number = row + 1
+            if not hasattr(self, f'TS{number}tog'):
+                holder = QWidget()
+                holder.setMinimumWidth(90)
+                holder.setMaximumWidth(120)
+                label = QLabel()
+                label.setMaximumSize(192, 18)
+                self.TSBox.layout().addWidget(holder, row, 0)
+                self.TSBox.layout().addWidget(label, row, 1, Qt.AlignHCenter)
+                setattr(self, f'TS{number}tog', holder)
+                setattr(self, f'translation{number}ConnectionLabel', label)
+            getattr(self, f'translation{number}ConnectionLabel').setText(stage.label)
+
+            toggle = PToggle(handle_color=Qt.red, checked_color=Qt.green)
+            layout = QVBoxLayout()
+            layout.addWidget(toggle)
+            getattr(self, f'TS{number}tog').setLayout(layout)
+            toggle.setCheckState(Qt.Unchecked)
+            setattr(self, f'TS{number}', toggle)
+            self.stageToggles[stage.name] = toggle
         # --------------------------------------------------------------------
 
-        # State machine support
-        self.setupTelSIMButtonWasPressed = False
+        # State machine support. The sequencing itself lives in the controller; the window drives it from the
+        # buttons and follows it through its signals.
+        self.controller = TelSimController(stages=self.stages, parent=self)
+        self.controller.confirm = lambda text: showDialog(text, yes=True, cancel=True)
+        self.controller.stateChanged.connect(self.controllerStateChanged)
+        self.controller.message.connect(self.postMessage)
+        self.controller.predicted.connect(
+            lambda prediction: self.setView('LCDnumbers', 'display', f"{prediction.total:0.2f}"))
+        self.controller.moveStarted.connect(self.startCountdown)
+        self.controller.arrived.connect(lambda stage, seconds: log.info(f'{stage} arrived after {seconds:0.2f} s'))
+        self.controller.progress.connect(lambda report: self.setView('statusbar', 'message',
+                                                                     f'{self.statusMessage()} | {report}'))
+        self.controller.pendingChanged.connect(lambda pending: self.setView('statusbar', 'message',
+                                                                            self.statusMessage()))
         self.setupTelSIMButton.clicked.connect(self.setupTelSIMButtonPressed)
-        self.closeTelSIMButtonWasPressed = False
         self.closeTelSIMButton.clicked.connect(self.closeTelSIMButtonPressed)
-        self.startButtonWasPressed = False
         self.startButton.clicked.connect(self.startButtonPressed)
-        self.stopButtonWasPressed = False
         self.stopButton.clicked.connect(self.stopButtonPressed)
-        self.stateTimeout = QTimer()
-        self.stateTimeout.setSingleShot(True)
-        self.stateMachineTimer = QTimer()
-        self.stateMachineTimer.timeout.connect(self.stateMachine)
-        self.stateMachineTimer.start(75)
-        self.state = TelSimStates.INIT
+
+        # Transition, channel and dialog timings, in a dock that starts hidden (View menu)
+        self.timingDock = QDockWidget('Timing', self)
+        self.timingDock.setWidget(TimingPanel(self.controller.timing))
+        self.addDockWidget(Qt.RightDockWidgetArea, self.timingDock)
+        self.timingDock.hide()
+        self.menuView.addAction(self.timingDock.toggleViewAction())
+        self.countdownDisplayTimer = QTimer()  # Only runs while a stage is moving
+        self.countdownDisplayTimer.timeout.connect(self.countdownDisplay)
+        # Timed loop open/close writes, which may not block the GUI thread
+        self.loopSequencer = ActionSequencer(self)
+        self.loopSequencer.pendingChanged.connect(lambda pending: self.setView('statusbar', 'message',
+                                                                              self.statusMessage()))
+        self.reconMatrix = None
+        self.display = DisplayCoalescer(parent=self)
+        self.errorStatus.setMaximumBlockCount(MESSAGE_LIMIT)
+        if self.profile:
+            self.profile.mark('setup widgets')
+
+        # Channel creation for the emulator
+        channels = self.stages.channels() + CHANNELS
+        if backgroundConnect:
+            self.connector = ChannelConnector(backend, channels, KEYWORDS, parent=self)
+            self.connector.connected.connect(self.channelsConnected)
+            self.connector.failed.connect(lambda message: showDialog(f"Could not connect channels: {message}"))
+            self.controller.setState(TelSimStates.CONNECTING)
+            self.connector.start()
+        else:
+            objects = {attr: backend.channel(name) for attr, name in channels}
+            objects.update({attr: backend.keyword(service, name) for attr, service, name in KEYWORDS})
+            self.channelsConnected(objects, None)
+
+    def channelsConnected(self, objects, seconds):
+        '''
+        Take the created channels and keywords, hook up the displays and start the state machine.
+
+        :param objects: {attribute: channel or keyword}, with the stage channels under their stage keys
+        :param seconds: Time the background connection took, or None if it ran on the GUI thread
+        '''
+        # Time every read and write, under the PV or service.keyword name
+        names = dict(self.stages.channels() + CHANNELS)
+        names.update({attr: f'{service}.{name}' for attr, service, name in KEYWORDS})
+        objects = {attr: self.controller.timing.channel(channel, names[attr]) for attr, channel in objects.items()}
+        stageChannels = {key: objects.pop(key) for key, _ in self.stages.channels()}
+        for attr, channel in objects.items():
+            setattr(self, attr, channel)
+        for name in CONNECTING_BOXES:
+            getattr(self, name).setPlaceholderText('')
+        if self.profile:
+            if seconds is None:
+                self.profile.mark('connect channels')
+            else:
+                self.profile.add('connect channels (background)', seconds)
+
+        # Record every monitor update, ahead of the callbacks that display it
+        for stage in self.stages:
+            for field in STAGE_TELEMETRY[stage.role]:
+                stageChannels[stage.key(field)].floatCallback.connect(self.recorder.recorder(stage.pv(field)))
+        self.gain_keyword.floatCallback.connect(self.recorder.recorder('k1:ao:wc:dt:sv:gain'))
+        for keyword, name in [(self.dt_keyword, 'ao1.dtlp'), (self.dm_keyword, 'ao1.dmlp'),
+                              (self.frameRate_keyword, 'ao1.wsfrrt')]:
+            keyword.stringCallback.connect(functools.partial(self.recorder.recordKeyword, name))
+
+        # Connects to the channels to read and display the values. Box updates are coalesced to one per display
+        # frame; the controller still sees every update.
+        for name, role, field in STAGE_BOXES:
+            stage = self.stages.primary(role)
+            self.display.register(name, functools.partial(self.stageBoxSetText, getattr(self, name), stage, field))
+            stageChannels[stage.key(field)].floatCallback.connect(self.display.poster(name))
+        self.display.register('frBox', self.frBoxSetText)
+        self.display.register('gainBox', self.gainBoxSetText)
+
+        # The controller primes the stage channels as it initialises, and tracks their health; the loop keywords
+        # and gain are tracked too, for showing
+        self.controller.health.changed.connect(self.healthChanged)
+        self.controller.attach(stageChannels, getattr(self.backend, 'clock', None))
+        for attr, channel in objects.items():
+            self.controller.health.add(names[attr], channel)
+        for toggle in self.stageToggles.values():
+            toggle.setCheckState(Qt.Checked)
+
+        self.dt_keyword.stringCallback.connect(self.loopController)
+        self.dt_keyword.primeCallback()
+
+        self.dm_keyword.stringCallback.connect(self.loopController)
+        self.dm_keyword.primeCallback()
+
+        self.frameRate_keyword.stringCallback.connect(self.display.poster('frBox'))
+        self.frameRate_keyword.primeCallback()
+
+        self.gain_keyword.floatCallback.connect(self.display.poster('gainBox'))
+        self.gain_keyword.runCallbacks()
+
+        if self.profile:
+            self.profile.mark('first callbacks')
+            # Report from the event loop, once the window is up
+            profile, self.profile = self.profile, None
+            QTimer.singleShot(0, lambda: profile.report())
 
     def setupTelSIMButtonPressed(self):
         """
         Trigger the state machine with a button press.
         """
-        self.setupTelSIMButtonWasPressed = True
+        self.controller.setup()
 
     def closeTelSIMButtonPressed(self):
         """
         Closes the state machine with a button press.
         """
-        self.closeTelSIMButtonWasPressed = True
+        self.controller.close()
 
     def startButtonPressed(self):
         """
-        Trigger MOVE_ALT stage with a button press.
+        Trigger MOVE_ALT stage with a button press, or play the selected sequence file.
         """
-        self.startButtonWasPressed = True
+        if self.controller.state != TelSimStates.IDLE:
+            return
+        if self.fileImportTxt.text():
+            self.controller.playSequenceFile(self.fileImportTxt.text())
+            return
+        self.controller.start(Segment(None, float(self.posBox.text()), float(self.velBox.text()),
+                                      float(self.accelBox.text()), float(self.altBox.text())))
 
     def stopButtonPressed(self):
         """
-        Trigger MOVE_ALT stage with a button press.
+        Trigger STOPPED stage with a button press.
         """
-        self.stopButtonWasPressed = True
+        self.controller.stop()
 
-    def stateMachine(self):
-        """
-        State machine processing.
-        """
-        self.statusbar.showMessage(f'STATE: {self.state.name}')
-
-        # ----- STATE 0 ------------------------------------------------
-        if self.state == TelSimStates.INIT:
-            # Connects to the channels to read and display the values
-            self.posChan.floatCallback.connect(self.posBoxSetText)
-            self.posChan.runCallbacks()
-            self.velChan.floatCallback.connect(self.velBoxSetText)
-            self.velChan.runCallbacks()
-            self.accelChan.floatCallback.connect(self.accelBoxSetText)
-            self.accelChan.runCallbacks()
-            self.altChan.floatCallback.connect(self.altBoxSetText)
-            self.altChan.runCallbacks()
-
-            self.dt_keyword.stringCallback.connect(self.loopController)
-            self.dt_keyword.primeCallback()
-
-            self.dm_keyword.stringCallback.connect(self.loopController)
-            self.dm_keyword.primeCallback()
+    def controllerStateChanged(self, state):
+        '''
+        Follow a controller transition: show the state's view, mark the setpoints as sent once their move has
+        started, and stop the countdown when the stages are no longer moving.
 
-            self.frameRate_keyword.stringCallback.connect(self.frBoxSetText)
-            self.frameRate_keyword.primeCallback()
+        :param state: TelSimStates member
+        '''
+        self.applyStateView(state)
+        sent = {TelSimStates.AWAIT_ALT: ['alt'], TelSimStates.MOVE_WIND: ['wind'],
+                TelSimStates.AWAIT_BOTH: ['alt', 'wind']}
+        if state in sent:
+            for name, role, _ in STAGE_BOXES:
+                if role in sent[state]:
+                    getattr(self, name).changed = False
+        elif state in [TelSimStates.IDLE, TelSimStates.STOPPED, TelSimStates.OFF, TelSimStates.PAUSED]:
+            self.countdownTimer.stop()
+            self.countdownDisplayTimer.stop()
 
-            self.gain_keyword.floatCallback.connect(self.gainBoxSetText)
-            self.gain_keyword.runCallbacks()
+    def healthChanged(self, name):
+        '''
+        A channel has become healthy or unhealthy. A stage's toggle is checked while all of its channels are connected
+        and up to date; the change is posted once per stage rather than per channel.
 
-            self.state = TelSimStates.OFF
+        :param name: Stage channel key (wind.RBV) or PV/keyword name
+        '''
+        health = self.controller.health.channels
+        stageName, _, _ = name.rpartition('.')
+        if stageName not in self.stageToggles:
+            self.postMessage(f'{name} {health[name].describe()}')
             return
-
-        # ----- STATE 1 ------------------------------------------------
-        elif self.state == TelSimStates.OFF:
-
-            # Update GUI widgets for the OFF state
-            self.startButton.setVisible(True)
-            self.startButton.setEnabled(False)
-            self.stopButton.setVisible(False)
-
-            self.setupTelSIMButton.setEnabled(True)
-            self.setupTelSIMButton.setVisible(True)
-
-            self.closeTelSIMButton.setEnabled(False)
-            self.closeTelSIMButton.setVisible(False)
-
-            for i in self.controls:
-                i.setEnabled(False)  # Disable the widgets
-
-            # If setup is pressed, advance to IDLE
-            if self.setupTelSIMButtonWasPressed:
-                self.setupTelSIMButtonWasPressed = False
-
-                # Advance the state machine
-                self.state = TelSimStates.IDLE
-                return
-
+        stage = self.stages[stageName]
+        unhealthy = [health[stage.key(field)] for field in FIELDS if not health[stage.key(field)].healthy]
+        toggle = self.stageToggles[stageName]
+        label = getattr(self, f'translation{list(self.stageToggles).index(stageName) + 1}ConnectionLabel')
+        if not unhealthy:
+            if toggle.checkState() != Qt.Checked:
+                self.postMessage(f'{stage.label} channels are back')
+            toggle.setCheckState(Qt.Checked)
+            label.setText(stage.label)
             return
+        problem = 'stale' if all(entry.connected for entry in unhealthy) else 'lost'
+        if toggle.checkState() == Qt.Checked:
+            self.postMessage(f'{stage.label} {problem}: {health[name].name} {health[name].describe()}')
+        toggle.setCheckState(Qt.Unchecked)
+        label.setText(f'{stage.label} ({problem})')
 
-        # ----- STATE 2 -----------------------------------------
-        elif self.state == TelSimStates.IDLE:
-
-            # Update GUI widgets visibility
-            self.startstopBox.setEnabled(True)
-            self.startButton.setVisible(True)
-            self.startButton.setEnabled(True)
-            self.stopButton.setVisible(False)
-            self.stopButton.setEnabled(False)
-            self.setupTelSIMButton.setEnabled(False)
-            self.setupTelSIMButton.setVisible(False)
-            self.closeTelSIMButton.setEnabled(True)
-            self.closeTelSIMButton.setVisible(True)
-            self.LCDnumbers.display("0.00")
-
-            for i in self.controls:
-                i.setEnabled(True)  # Enable the widgets
-
-            if self.startButtonWasPressed:
-                self.startButtonWasPressed = False
-                self.state = TelSimStates.MOVE_ALT
-                return
-
-            if self.closeTelSIMButtonWasPressed:
-                self.closeTelSIMButtonWasPressed = False
-                self.state = TelSimStates.CLEANUP
-                return
+    def postMessage(self, text):
+        '''Append a line to the message pane below the controls'''
+        self.errorStatus.appendPlainText(f'{time.strftime("%H:%M:%S")} {text}')
 
-            return
-
-        # ----- STATE 3 -----------------------------------------
-        elif self.state == TelSimStates.MOVE_ALT:
-            self.finalPos = self.posBox.text()
-            self.finalAlt = self.altBox.text()
-
-            self.initialPos = float(self.posChan.read())
-            self.secondsToMove = abs(float(self.initialPos) - float(self.finalPos)) / float(
-                self.velBox.text())  # Note: self.velBox.text() is only assigned after being validated
-            self.LCDnumbers.display(f"{self.secondsToMove:0.2f}")
-            self.initialAlt = float(self.altChan.read())
-            if showDialog("Are you sure you want to START?", yes=True, cancel=True):
-                for i in self.controls:
-                    i.setEnabled(False)  # Disable the widgets
-                self.startButton.setVisible(False)
-                self.startButton.setEnabled(False)
-                self.stopButton.setVisible(True)
-                self.stopButton.setEnabled(True)
-                self.altStopChan.write(MOVE)
-                self.altWrite(self.altBox.text())
-                self.altBox.changed = False
-                self.stateTimeout.start(TIMEOUT_MS)
-                self.state = TelSimStates.AWAIT_ALT
-                return
-            else:
-                self.state = TelSimStates.IDLE
-                return
-
-
-        # ----- STATE 4 -----------------------------------------
-        elif self.state == TelSimStates.AWAIT_ALT:
-            if math.isclose(float(self.altChan.read()), float(self.finalAlt), abs_tol=0.05):
-                self.stateTimeout.stop()
-                self.stateTimeout.start(TIMEOUT_MS)
-                self.state = TelSimStates.MOVE_WIND
-                return
-            if self.stopButtonWasPressed:
-                self.stateTimeout.stop()
-                self.stopButtonWasPressed = False
-                self.state = TelSimStates.STOPPED
-                return
-
-            if not self.stateTimeout.isActive():
-                raise TimeoutError("Alt TS took more than 45 seconds to move")
-                return
-            return
+    def startCountdown(self, seconds):
+        '''
+        Count the LCD down over the predicted time of the move that is starting
 
-        # ----- STATE 5 -----------------------------------------
-        elif self.state == TelSimStates.MOVE_WIND:
-            self.posBox.changed = False
-            self.velBox.changed = False
-            self.accelBox.changed = False
-            self.windStopChan.write(MOVE)
-            self.accelWrite(self.accelBox.text())
-            self.velWrite(self.velBox.text())
-            self.posWrite(self.posBox.text())
-            self.countdownTimer.start(int(self.secondsToMove) * 1000)
-            self.stateTimeout.start(TIMEOUT_MS)
-            self.state = TelSimStates.AWAIT_WIND
-            return
+        :param seconds: Predicted duration of the altitude or wind phase
+        '''
+        self.countdownTimer.start(round(seconds * 1000 / self.controller.clockSpeed()))
+        self.countdownDisplayTimer.start(75)
 
-        # ----- STATE 6 -----------------------------------------
-        elif self.state == TelSimStates.AWAIT_WIND:
-            self.timeLeft = self.countdownTimer.remainingTime() / 1000
-            self.LCDnumbers.display(f"{self.timeLeft:0.2f}")
-            if math.isclose(float(self.posChan.read()), float(self.finalPos), abs_tol=0.05):
-                self.stateTimeout.stop()
-                self.state = TelSimStates.IDLE
-                return
-            if self.stopButtonWasPressed:
-                self.stopButtonWasPressed = False
-                self.stateTimeout.stop()
-                self.state = TelSimStates.STOPPED
-                return
-            if not self.stateTimeout.isActive():
-                raise TimeoutError("Wind TS took more than 45 seconds to move")
-                return
+    def countdownDisplay(self):
+        '''Refresh the countdown LCD while a stage is moving'''
+        # In backend seconds, like the prediction: simulated time runs at the simulator's speed
+        self.timeLeft = self.countdownTimer.remainingTime() / 1000 * self.controller.clockSpeed()
+        self.setView('LCDnumbers', 'display', f"{max(self.timeLeft, 0):0.2f}")
 
-            return
+    def applyStateView(self, state):
+        '''
+        Apply the STATE_VIEWS entry and status bar message for a state. Only properties that differ from what is
+        already shown reach Qt.
 
-        # ----- STATE 7 -----------------------------------------
-        elif self.state == TelSimStates.STOPPED:
-            self.windStopChan.write(STOP)
-            self.altStopChan.write(STOP)
-            self.countdownTimer.stop()
-            self.state = TelSimStates.IDLE
-            return
+        :param state: TelSimStates member
+        '''
+        for name, prop, value in STATE_VIEWS.get(state, []):
+            self.setView(name, prop, value)
+        self.setView('statusbar', 'message', self.statusMessage())
+        log.debug(f'{state.name}: {self.widgetMutations} widget mutations so far')
+
+    def statusMessage(self):
+        '''Status bar text: the current state, followed by any sequenced steps still in flight'''
+        pending = self.controller.pending() + self.loopSequencer.pending()
+        if pending:
+            return f'STATE: {self.controller.state.name} | ' + ' > '.join(pending)
+        return f'STATE: {self.controller.state.name}'
+
+    def setView(self, name, prop, value):
+        '''
+        Set one widget property, skipping the Qt call if the widget already shows that value.
 
-        # ----- STATE 8 -----------------------------------------
-        elif self.state == TelSimStates.CLEANUP:
-            self.closeTelSIMButton.setVisible(False)
-            self.closeTelSIMButton.setEnabled(False)
-            self.setupTelSIMButton.setVisible(True)
-            self.setupTelSIMButton.setEnabled(False)
-            self.startstopBox.setEnabled(False)
-            for i in self.controls:
-                i.setEnabled(False)
-            self.windStopChan.write(MOVE)
-            self.altStopChan.write(MOVE)
-            self.posWrite(WIND_POS_HOME)
-            self.velWrite(VEL_HOME)
-            self.accelWrite(ACCEL_HOME)
-            self.altWrite(ALT_POS_HOME)
-            time.sleep(2)
-            self.stateTimeout.start(TIMEOUT_MS)
-            self.state = TelSimStates.AWAIT_CLEANUP
-            return
+        :param name: Widget attribute name, or 'controls' for every widget in self.controls
+        :param prop: Key of VIEW_SETTERS
+        :param value: Value passed to the Qt setter
+        '''
+        if self.readOnly and prop == 'enabled' and name in WRITE_WIDGETS:
+            value = False
+        if name == 'controls':
+            widgets = [i.objectName() for i in self.controls]
+        else:
+            widgets = [name]
 
-        # ----- STATE 9 -----------------------------------------
-        elif self.state == TelSimStates.AWAIT_CLEANUP:
-            if int(self.altMovingChan.read()) == 0:
-                if int(self.posMovingChan.read()) == 0:
-                    if math.isclose(float(self.accelChan.read()), 0.2, abs_tol=0.2):
-                        if math.isclose(float(self.velChan.read()), 2.1, abs_tol=0.2):
-                            self.state = TelSimStates.OFF
-                            return
-
-            if not self.stateTimeout.isActive():
-                raise TimeoutError("Cleanup took more than 45 seconds")
-                return
-            return
+        for widget in widgets:
+            if (widget, prop) in self._view and self._view[(widget, prop)] == value:
+                continue
+            getattr(getattr(self, widget), VIEW_SETTERS[prop])(value)
+            self._view[(widget, prop)] = value
+            self.widgetMutations += 1
 
     # -----------------------------------------------------------------------------
     def editTextChanged(self, edit):
@@ -513,51 +661,44 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
             edit.changed = False
             edit.setStyleSheet(self.editStyleSheet)
 
-    def openOther(self):
-        '''Open external GUIs'''
-        subprocess.call(['ssh', 'k1obsao@k1aoserver-new', '/kroot/rel/ao/qfix/setup_ao.csh'])
-
-    def posBoxSetText(self, val):
-        if not self.posBox.changed:
-            self.posBox.setStyleSheet("")
-            self.posBox.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.posBox.setText(f"{val:0.2f}")
-            self.posBox.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
-
-    def velBoxSetText(self, val):
-        if not self.velBox.changed:
-            self.velBox.setStyleSheet("")
-            self.velBox.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.velBox.setText(f"{val:0.2f}")
-            self.velBox.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
-
-    def accelBoxSetText(self, val):
-        if not self.accelBox.changed:
-            self.accelBox.setStyleSheet("")
-            self.accelBox.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.accelBox.setText(f"{val:0.2f}")
-            self.accelBox.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
-
-    def altBoxSetText(self, val):
-        if not self.altBox.changed:
-            self.altBox.setStyleSheet("")
-            self.altBox.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.altBox.setText(f"{val:0.1f}")
-            self.altBox.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
+    def openOther(self, action):
+        '''Open an external GUI, without waiting for it'''
+        self.launcher.launch(action.text())
+
+    def updateRunningMenu(self):
+        '''List the launched GUIs, and how the finished ones exited, in Other GUIs > Running'''
+        self.menuRunning.clear()
+        for child in self.launcher.children:
+            action = self.menuRunning.addAction(child.describe())
+            if child.running:
+                action.setToolTip('Click to stop')
+                action.triggered.connect(lambda checked, child=child: self.launcher.stop(child))
+            else:
+                action.setEnabled(False)
+        self.menuRunning.setEnabled(bool(self.launcher.children))
+
+    def boxSetText(self, box, text):
+        '''
+        Show a channel value in an edit box, unless a human is editing it. Skips the style recompute and the
+        setText when nothing would change.
+        '''
+        if box.changed:
+            return
+        if box.styleSheet():
+            box.setStyleSheet("")
+        if box.text() != text:
+            box.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
+            box.setText(text)
+            box.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
+
+    def stageBoxSetText(self, box, stage, field, val):
+        self.boxSetText(box, stage.format(field, val))
 
     def frBoxSetText(self, val):
-        if not self.frameRateInput.changed:
-            self.frameRateInput.setStyleSheet("")
-            self.frameRateInput.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.frameRateInput.setText(f"{val}")
-            self.frameRateInput.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
+        self.boxSetText(self.frameRateInput, f"{val}")
 
     def gainBoxSetText(self, val):
-        if not self.gainInput.changed:
-            self.gainInput.setStyleSheet("")
-            self.gainInput.blockSignals(True)  # Turn off signals to the edit, a human is not editing it!
-            self.gainInput.setText(f"{val:0.2f}")
-            self.gainInput.blockSignals(False)  # Turn on signals to the edit, a human is not editing it!
+        self.boxSetText(self.gainInput, f"{val:0.2f}")
 
     # ---- Select file buttons -----------------------------------------------
     def fileSelection(self):
@@ -565,94 +706,73 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         self.fileImportTxt.setText(fname[0])
 
     def reconstructorSelection(self):
+        '''
+        Parse and validate the chosen reconstructor matrix in a worker thread; the path only shows in self.recon
+        once the matrix has loaded and passed validation.
+        '''
         fname = QFileDialog.getOpenFileName(self, 'Open File', '~', 'TXT files (*.txt)')
-        self.recon.setText(fname[0])
+        if not fname[0]:
+            return
+        self.recon.clear()
+        self.recon.setPlaceholderText('loading...')
+        self.reconstructorButton.setEnabled(False)
+        self.reconLoader = ReconstructorLoader(fname[0], self.stages.reconstructorShape, parent=self)
+        self.reconLoader.loaded.connect(self.reconstructorLoaded)
+        self.reconLoader.failed.connect(self.reconstructorFailed)
+        self.reconLoader.start()
+
+    def reconstructorLoaded(self, path, matrix, message):
+        self.reconMatrix = matrix
+        self.recon.setPlaceholderText('')
+        self.recon.setText(path)
+        self.reconstructorButton.setEnabled(True)
+        self.postMessage(message)
+
+    def reconstructorFailed(self, path, message):
+        self.recon.setPlaceholderText('')
+        self.reconstructorButton.setEnabled(True)
+        showDialog(f"Cannot use reconstructor {path}:\n\n{message}")
 
     # -----------------------------------------------------------------------
 
     # --- Corrects pos/vel/accel/alt values after edited? --------------------
-    def posCheck(self, msg):
+    def stageCheck(self, box, stage, field):
         '''
-        Makes sure the value entered in the field is within bounds. If not, will show error message. Also assigns
-        self.finalPos used later for calculating time it will take to move
-        :param msg: Value entered in posBox text box
-        '''
-        self.posBox.validator = QDoubleValidator(WIND_POS_MIN, WIND_POS_MAX, 2,
-                                                 notation=QDoubleValidator.StandardNotation)
-        if QDoubleValidator.validate(self.posBox.validator, str(msg), 0)[
-            0] != 2:  # When this object is != 2, that means that it's not an acceptable input
-            self.posBox.setText(f"{float(self.posChan.read()):0.2f}")
-            showDialog("Position must be a float between -40.00 and 40.00")
-
-    def velCheck(self, msg):
-        self.velBox.validator = QDoubleValidator(VEL_MIN, VEL_MAX, 2, notation=QDoubleValidator.StandardNotation)
-        if QDoubleValidator.validate(self.velBox.validator, str(msg), 0)[0] != 2:
-            self.velBox.setText(f"{float(self.velChan.read()):0.2f}")
-            showDialog("Velocity must be a float between 2.00 and 80.00")
-        else:
-            # Ensures self.velVal assignment ONLY if the input passes the validator
-            self.velVal = msg
+        Makes sure the value entered in a stage's box is within the field's limits. If not, puts back the channel's
+        value and shows an error message.
 
-    def accelCheck(self, msg):
-        self.accelBox.validator = QDoubleValidator(ACCEL_MIN, ACCEL_MAX, 2, notation=QDoubleValidator.StandardNotation)
-        if QDoubleValidator.validate(self.accelBox.validator, str(msg), 0)[0] != 2:
-            self.accelBox.setText(f"{float(self.accelChan.read()):0.2f}")
-            showDialog("Acceleration must be a float between 0.00 and 10.00")
+        :param box: Edit box
+        :param stage: stages.Stage the box belongs to
+        :param field: Motor record field the box shows
+        '''
+        if stage.validator(field).validate(box.text(), 0)[0] != QDoubleValidator.Acceptable:
+            box.setText(stage.format(field, float(self.controller.channel(stage, field).read())))
+            limits = stage.limits[field]
+            what = {'VELO': 'Velocity', 'ACCL': 'Acceleration'}.get(field, stage.quantity)
+            showDialog(f"{what} must be a float between {stage.format(field, limits.low)} and "
+                       f"{stage.format(field, limits.high)}")
 
     def gainCheck(self, msg):
-        self.gainInput.validator = QDoubleValidator(GAIN_MIN, GAIN_MAX, 2, notation=QDoubleValidator.StandardNotation)
-        if QDoubleValidator.validate(self.gainInput.validator, str(msg), 0)[0] != 2:
-            self.gainInput.setText(f"{float(self.gain_keyword.read()):0.2f}")
-            showDialog("Gain must be between 0 and 1")
+        if validator(GAIN).validate(str(msg), 0)[0] != QDoubleValidator.Acceptable:
+            self.gainInput.setText(f"{float(self.gain_keyword.read()):0.{GAIN.precision}f}")
+            showDialog(f"Gain must be between {GAIN.low:g} and {GAIN.high:g}")
         else:
             self.gain_keyword.write(msg)
         self.gainInput.changed = False
 
-    def altCheck(self, msg):
-        self.altBox.validator = QDoubleValidator(ALT_MIN, ALT_MAX, 1, notation=QDoubleValidator.StandardNotation)
-        if QDoubleValidator.validate(self.altBox.validator, str(msg), 0)[0] != 2:
-            self.altBox.setText(f"{float(self.altChan.read()):0.1f}")
-            showDialog("Altitude must be between 5.0 and 12.0")
-
     def frameRateCheck(self, msg):
-        if self.unbin.isChecked() == True:
-            self.frameRateInput.validator = QIntValidator(FRAMERATE_MIN, UNBINNED_MODE, self)
-        else:
-            self.frameRateInput.validator = QIntValidator(FRAMERATE_MIN, BINNED_MODE, self)
-        if QIntValidator.validate(self.frameRateInput.validator, str(msg), 0)[0] != 2:
-            self.frameRateInput.setText("1")
-            showDialog("Frame rate must be integer between 1-2000 when in unbinned mode and "
-                       "1-3600 when in binned mode; automatically reset frame to 1")
+        limits = FRAME_RATE[not self.unbin.isChecked()]
+        if validator(limits).validate(str(msg), 0)[0] != QIntValidator.Acceptable:
+            self.frameRateInput.setText(f"{FRAME_RATE[False].low:g}")
+            showDialog(f"Frame rate must be integer between {FRAME_RATE[False].low:g}-{FRAME_RATE[False].high:g} "
+                       f"when in unbinned mode and {FRAME_RATE[True].low:g}-{FRAME_RATE[True].high:g} when in binned "
+                       f"mode; automatically reset frame to {FRAME_RATE[False].low:g}")
         else:
             self.frameRate_keyword.write(msg)
         self.frameRateInput.changed = False
 
     # ---------------------------------------------------------------------
 
-    # ---- Writes the pos/vel/accel/alt to the emulator --------------------------------------------
-    def posWrite(self, msg):
-        '''
-        Writes the value to the writing channel
-
-        :param msg: Position value
-        '''
-        f = float(msg)
-        self.posWritingChan.write(f, wait=False)
-
-    def velWrite(self, msg):
-        f = float(msg)
-        self.velChan.write(f)
-
-    def accelWrite(self, msg):
-        f = float(msg)
-        self.accelChan.write(f)
-
-    def altWrite(self, msg):
-        f = float(msg)
-        self.altWritingChan.write(f, wait=False)
-
-    # -------------------------------------------------------------------------
-
     def loopController(self):
         """
         Selects the correct radio button based on status of dmlp and dtlp keywords
@@ -667,18 +787,32 @@ class TurbulenceSimulatorGUIMain(QtWidgets.QMainWindow):
         Turns loop off (opens loop)
         """
         if self.dt_keyword.read() == "CLOSE" or self.dm_keyword.read() == "CLOSE":
-            self.dm_keyword.write("OPEN")
-            time.sleep(0.5)
-            self.dt_keyword.write("OPEN")
+            self.loopSequencer.call(lambda: self.dm_keyword.write("OPEN"), 'dmlp OPEN')
+            self.confirmLoopKeyword(self.dm_keyword, 'dmlp', 'OPEN')
+            self.loopSequencer.call(lambda: self.dt_keyword.write("OPEN"), 'dtlp OPEN')
 
     def closeLoopButton_clicked(self):
         """
         Turns loop on (closes loop)
         """
         if self.dt_keyword.read() == "OPEN" or self.dm_keyword.read() == "OPEN":
-            self.dt_keyword.write("CLOSE")
-            time.sleep(0.5)
-            self.dm_keyword.write("CLOSE")
+            self.loopSequencer.call(lambda: self.dt_keyword.write("CLOSE"), 'dtlp CLOSE')
+            self.confirmLoopKeyword(self.dt_keyword, 'dtlp', 'CLOSE')
+            self.loopSequencer.call(lambda: self.dm_keyword.write("CLOSE"), 'dmlp CLOSE')
+
+    def confirmLoopKeyword(self, keyword, name, value):
+        '''
+        Queue the wait between the two loop keyword writes: until the first one reads back value, then LOOP_SETTLE_MS.
+        If it never does, the second write is dropped.
+
+        :param keyword: The keyword just written
+        :param name: Its name, for the status bar and messages
+        :param value: The value written
+        '''
+        self.loopSequencer.waitUntil(lambda: keyword.read() == value, LOOP_CONFIRM_MS, f'{name} reads {value}',
+                                     lambda: self.postMessage(f'{name} did not read back {value} within '
+                                                              f'{LOOP_CONFIRM_MS / 1000:g} s; the other loop keyword was not written'))
+        self.loopSequencer.wait(LOOP_SETTLE_MS)
 
 
 if __name__ == '__main__':
@@ -687,7 +821,71 @@ if __name__ == '__main__':
     # Commandline arguments
     parser = argparse.ArgumentParser(description='Turbulence Simulator GUI')
     parser.add_argument('-d', '--debug', help='Enable debugging output', action='store_true')
+    parser.add_argument('--sim', help='Use the in-process stage and keyword simulator instead of EPICS/KTL',
+                        action='store_true')
+    parser.add_argument('--record', help='Write a telemetry log of the stage and loop monitors into this directory',
+                        metavar='DIR')
+    parser.add_argument('--chart-fps', help=f'Strip chart repaint rate (default {CHART_FPS})', type=float,
+                        default=CHART_FPS)
+    parser.add_argument('--chart-window', help=f'Seconds of history in the strip chart (default {CHART_WINDOW_S}); '
+                        f'history is kept for at least {CHART_RATE_HZ} updates/s per channel', type=float,
+                        default=CHART_WINDOW_S)
+    parser.add_argument('--background-connect', help='Show the window at once and connect channels in the background',
+                        action='store_true')
+    parser.add_argument('--profile-startup', help='Print a per-phase startup timing breakdown', action='store_true')
+    parser.add_argument('--headless', help='Run one move (--alt/--pos/--vel/--accel) or sequence file (--file) '
+                        'without a window, homing the stages before and after', action='store_true')
+    parser.add_argument('--alt', help='Altitude setpoint for --headless', type=float)
+    parser.add_argument('--pos', help='Wind position setpoint for --headless', type=float)
+    parser.add_argument('--vel', help='Wind velocity for --headless', type=float)
+    parser.add_argument('--accel', help='Wind acceleration for --headless (default the wind stage\'s home ACCL)',
+                        type=float)
+    parser.add_argument('--file', help='Sequence file to play with --headless')
+    parser.add_argument('--parallel', help='Move the alt and wind stages at the same time', action='store_true')
+    parser.add_argument('--sweep', help='With --headless, sweep a grid of setpoints and write the settle times to '
+                        'this CSV file. Each axis is start:stop:step or a comma separated list', metavar='CSV')
+    parser.add_argument('--sweep-alt', help='Altitudes to sweep (default home)')
+    parser.add_argument('--sweep-pos', help='Wind positions to sweep (default home)')
+    parser.add_argument('--sweep-vel', help='Wind velocities to sweep (default home)')
+    parser.add_argument('--sweep-accel', help='Wind accelerations to sweep (default home)')
+    parser.add_argument('--sweep-loops', help='Loop states to visit at each point: open, closed or open,closed')
+    parser.add_argument('--sweep-dwell', help='Seconds to stay in each loop state', type=float, default=0.0)
+    parser.add_argument('--raster', help='Sweep in raster order instead of minimising stage travel',
+                        action='store_true')
+    parser.add_argument('--timing', help='Export state, channel and dialog timings as JSON lines to this file on exit',
+                        metavar='FILE')
+    parser.add_argument('--sim-speed', help='Simulated time per real second with --sim (default 1.0)', type=float,
+                        default=1.0)
+    parser.add_argument('--stages', help='Stages file (default stages.ini)', metavar='FILE')
+    parser.add_argument('--serve-proxy', help='Hold the channel and keyword subscriptions for GUIs started with '
+                        f'--proxy, on this local socket (default {PROXY_SOCKET})', nargs='?', const=PROXY_SOCKET,
+                        metavar='SOCKET')
+    parser.add_argument('--proxy-shared', help='Let other accounts connect to --serve-proxy; only your own can '
+                        'otherwise', action='store_true')
+    parser.add_argument('--proxy', help='Get the channels and keywords from a --serve-proxy process on this local '
+                        f'socket (default {PROXY_SOCKET}); read only without --control', nargs='?',
+                        const=PROXY_SOCKET, metavar='SOCKET')
+    parser.add_argument('--control', help='With --proxy, take control to move the stages and set the loop',
+                        action='store_true')
+    parser.add_argument('--other-command', help='Run this local command from the Other GUIs menu instead of the AO '
+                        'GUIs over ssh, for testing', metavar='COMMAND')
+    parser.add_argument('--replay', help='Show a telemetry log written with --record instead of the live stages, '
+                        'read only', metavar='LOG')
+    parser.add_argument('--replay-speed', help='Log seconds replayed per real second (default 1.0); 0 replays as '
+                        'fast as possible', type=float, default=1.0)
+    parser.add_argument('--replay-from', help='Start the replay this many seconds into the log', type=float,
+                        metavar='SECONDS')
     args = parser.parse_args()
+    if args.replay is not None and (args.headless or args.serve_proxy is not None):
+        parser.error('--replay cannot be used with --headless or --serve-proxy')
+
+    try:
+        stages = StageRegistry.load(args.stages)
+    except ValueError as e:
+        parser.error(str(e))
+    alt, wind = stages.primary('alt'), stages.primary('wind')
+    if args.accel is None:
+        args.accel = wind.home('ACCL')
 
     # Get the debug argument first, as it drives our logging choices
     if args.debug:
@@ -706,14 +904,84 @@ if __name__ == '__main__':
     # Disable the debug logging from Qt
     logging.getLogger('PyQt5').setLevel(logging.WARNING)
 
-    application = QtWidgets.QApplication(sys.argv)
+    if args.headless:
+        setpoint = None
+        sweep = None
+        if args.sweep is not None:
+            homes = [str(alt.home('VAL')), str(wind.home('VAL')), str(wind.home('VELO')), str(wind.home('ACCL'))]
+            axes = [args.sweep_alt, args.sweep_pos, args.sweep_vel, args.sweep_accel]
+            points = grid(*(parseValues(home if axis is None else axis) for axis, home in zip(axes, homes)))
+            loops = args.sweep_loops.split(',') if args.sweep_loops else [None]
+            sweep = Sweep(points, loops, args.sweep_dwell, reorder=not args.raster)
+        elif args.file is None:
+            if None in [args.alt, args.pos, args.vel]:
+                parser.error('--headless needs --alt, --pos and --vel, or --file')
+            setpoint = Segment(None, args.pos, args.vel, args.accel, args.alt)
+    if args.headless or args.serve_proxy is not None:
+        application = QtCore.QCoreApplication(sys.argv)
+    else:
+        application = QtWidgets.QApplication(sys.argv)
+    if args.replay is not None:
+        from replay import ReplayBackend
+        try:
+            backend = ReplayBackend(args.replay, speed=args.replay_speed or None)
+        except (OSError, ValueError) as e:
+            parser.error(f'Replay: {e}')
+        if args.replay_from is not None:
+            backend.seek(backend.log.start + args.replay_from)
+    elif args.proxy is not None:
+        try:
+            backend = ProxyBackend(args.proxy, control=args.control)
+        except (OSError, TimeoutError) as e:
+            parser.error(f'Telemetry proxy: {e}')
+    elif args.sim:
+        from simulator import SimBackend
+        backend = SimBackend(speed=args.sim_speed, stages=stages)
+    else:
+        backend = KeckBackend()
+    if args.serve_proxy is not None:
+        proxy = TelemetryProxy(backend, args.serve_proxy, shared=args.proxy_shared)
+        proxy.preload(stages.channels() + CHANNELS, KEYWORDS)
+        try:
+            proxy.listen()
+        except OSError as e:
+            parser.error(str(e))
+        application.aboutToQuit.connect(proxy.close)
+        sys.exit(backend.run(application))
+    if args.headless:
+        status = runHeadless(backend, setpoint, args.file, sweep, args.parallel, args.timing, stages)
+        if sweep is not None:
+            sweep.write(args.sweep)
+        sys.exit(status)
+
+    recordPath = None
+    if args.record:
+        recordPath = os.path.join(args.record, time.strftime('telemetry-%Y%m%d-%H%M%S.bin'))
+    profile = None
+    if args.profile_startup:
+        profile = StartupProfile(_importStart)
+        profile.mark('imports and backend')
     mainwin = TurbulenceSimulatorGUIMain()
-    mainwin.setupUI()
+    if profile:
+        profile.mark('load telsim.ui' if Ui_MainWindow is None else 'build precompiled UI')
+    mainwin.setupUI(backend, recordPath, args.chart_fps, args.chart_window, args.background_connect, profile, stages)
+    mainwin.parallelAction.setChecked(args.parallel)
+    if args.other_command:
+        mainwin.launcher.command = shlex.split(args.other_command)
+    if args.replay is not None:
+        backend.finished.connect(lambda: mainwin.postMessage(f'Replay of {args.replay} finished'))
+    application.aboutToQuit.connect(mainwin.recorder.close)
+    application.aboutToQuit.connect(mainwin.controller.shutdown)
+    application.aboutToQuit.connect(mainwin.launcher.shutdown)
+    if args.timing:
+        application.aboutToQuit.connect(lambda: mainwin.controller.timing.export(args.timing))
     # mainwin.setMinimumSize(0, 0)
     # mainwin.resize(10,10)
     mainwin.show()
+    if profile:
+        profile.mark('show window')
 
     # Run the Qt application
-    status = kPyQt.run(application)
+    status = backend.run(application)
     sys.exit(status)
 
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+import pytest
+
+# The modules are flat at the top of the repository, and the GUI is built without a display
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
+
+from controller import TelSimController, TelSimStates
+from simulator import SimBackend
+from stages import StageRegistry
+
+SIM_STEP_S = 0.05  # Simulated seconds per event loop pass while the clock is running
+
+
+@pytest.fixture(scope='session')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def waitFor(app):
+    '''Run the event loop until predicate() is true, failing the test after timeout seconds'''
+    def waitFor(predicate, timeout=5.0, what='condition'):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise AssertionError(f'{what} not reached within {timeout:g} s')
+            app.processEvents()
+            time.sleep(0.001)
+    return waitFor
+
+
+@pytest.fixture
+def stages():
+    return StageRegistry.load(os.path.join(ROOT, 'stages.ini'))
+
+
+@pytest.fixture
+def sim(app, stages):
+    '''Simulated motors on a clock that only moves when the clock fixture (or the test) advances it'''
+    return SimBackend(speed=None, stages=stages)
+
+
+@pytest.fixture
+def clock(sim):
+    '''Advances the simulated clock by SIM_STEP_S on every event loop pass; stop() it to freeze the stages'''
+    timer = QTimer()
+    timer.timeout.connect(lambda: sim.advance(SIM_STEP_S))
+    timer.start(0)
+    yield timer
+    timer.stop()
+
+
+@pytest.fixture
+def controller(sim, stages, clock):
+    '''A TelSimController on the simulator, homed and waiting in IDLE'''
+    controller = TelSimController(stages=stages)
+    controller.connectChannels(sim)
+    controller.setup()
+    controller.waitForState(TelSimStates.IDLE, timeout=5)
+    yield controller
+    controller.shutdown()
+
+
+@pytest.fixture
+def running(app, stages):
+    '''Makes controllers homed into IDLE on simulators running at speed times real time, shut down after the test'''
+    made = []
+
+    def running(speed):
+        controller = TelSimController(stages=stages)
+        made.append(controller)
+        controller.connectChannels(SimBackend(speed=speed, stages=stages))
+        controller.setup()
+        controller.waitForState(TelSimStates.IDLE, timeout=10)
+        return controller
+    yield running
+    for controller in made:
+        controller.shutdown()
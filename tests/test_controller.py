@@ -0,0 +1,222 @@
+import pytest
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+import controller as controllerModule
+import motionprofile
+from controller import TelSimController, TelSimStates, ARRIVAL_TOL
+from sequenceplayer import Segment
+from simulator import SPMG_STOP
+
+
+MONITOR_LAG_MS = 50
+
+
+class LaggingChannel(QtCore.QObject):
+    '''A simulated channel whose monitor updates arrive MONITOR_LAG_MS late, as through the telemetry proxy'''
+
+    floatCallback = pyqtSignal(float)
+
+    def __init__(self, channel):
+        super().__init__()
+        self.channel = channel
+        channel.floatCallback.connect(lambda value: QTimer.singleShot(MONITOR_LAG_MS,
+                                                                      lambda: self.floatCallback.emit(value)))
+
+    def __getattr__(self, attr):
+        return getattr(self.channel, attr)
+
+
+def motor(sim, stages, role):
+    return sim.motors[stages.primary(role).prefix]
+
+
+def states(controller):
+    '''Every state the controller enters from now on'''
+    reached = []
+    controller.stateChanged.connect(reached.append)
+    return reached
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_move_arrives(controller, sim, stages, waitFor, parallel):
+    controller.parallel = parallel
+    reached = states(controller)
+    controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+
+    assert controller.state == TelSimStates.IDLE
+    assert (TelSimStates.AWAIT_BOTH if parallel else TelSimStates.AWAIT_WIND) in reached
+    # Arrival counts from inside the tolerance, so the stages may still be finishing their moves
+    for role, target in [('alt', 8.0), ('wind', 20.0)]:
+        assert motor(sim, stages, role).get('RBV') == pytest.approx(target, abs=ARRIVAL_TOL)
+        waitFor(lambda: motor(sim, stages, role).get('MOVN') == 0, what=f'{role} at rest')
+        assert motor(sim, stages, role).get('RBV') == target
+    assert motor(sim, stages, 'wind').get('VELO') == 10.0
+
+
+def test_stop_while_alt_setpoint_is_in_flight(controller, sim, stages, clock, waitFor):
+    clock.stop()
+    controller.start(Segment(None, 20.0, 10.0, 0.5, 8.0))
+    assert controller.state == TelSimStates.MOVE_ALT
+    controller.stop()
+    controller.waitForState(TelSimStates.IDLE, timeout=5)
+
+    # Whatever setpoint writes had gone out must not restart the stage after the stop
+    waitFor(lambda: not controller.writes.pending(), what='stop writes')
+    clock.start(0)
+    controller.wait(0.2)
+    alt = motor(sim, stages, 'alt')
+    assert alt.get('SPMG') == SPMG_STOP
+    assert alt.get('MOVN') == 0
+    assert alt.get('RBV') == pytest.approx(stages.primary('alt').home('VAL'))
+    assert motor(sim, stages, 'wind').get('RBV') == stages.primary('wind').home('VAL')
+
+
+def test_stop_mid_move(controller, sim, stages, waitFor):
+    alt = motor(sim, stages, 'alt')
+    controller.start(Segment(None, 20.0, 10.0, 0.5, 8.0))
+    waitFor(lambda: alt.get('RBV') > 6.0, what='alt halfway')
+    controller.stop()
+    controller.waitForState(TelSimStates.IDLE, timeout=5)
+    waitFor(lambda: alt.get('MOVN') == 0, what='alt stopped')
+
+    assert alt.get('SPMG') == SPMG_STOP
+    assert 6.0 < alt.get('RBV') < 8.0 - ARRIVAL_TOL
+    # The wind move never started
+    assert motor(sim, stages, 'wind').get('RBV') == stages.primary('wind').home('VAL')
+
+
+@pytest.mark.parametrize('speed', [20.0, 0.5])
+def test_moves_are_timed_on_the_simulated_clock(running, stages, monkeypatch, speed):
+    # A timeout with little to spare, which a slowed-down simulator would overrun on the wall clock
+    monkeypatch.setattr(motionprofile, 'TIMEOUT_FACTOR', 1.0)
+    monkeypatch.setattr(motionprofile, 'TIMEOUT_MARGIN_S', 0.5)
+    controller = running(speed)
+    arrivals = {}
+    controller.arrived.connect(arrivals.__setitem__)
+    home = stages.primary('alt').home('VAL')
+    # Short at half speed, long enough at 20x for the simulator ticks to be small against it
+    controller.move(alt=home + (3.0 if speed > 1 else 0.0), pos=20.0 if speed > 1 else 2.0, vel=10.0, accel=0.5)
+
+    prediction = controller.prediction
+    assert controller.error is None
+    for role, predicted in [('alt', prediction.alt), ('wind', prediction.wind)]:
+        # Arrival counts from inside the tolerance, and the simulator steps every 20 ms of wall-clock time
+        assert predicted - 0.1 <= arrivals[role] <= predicted + 0.1 + 0.02 * speed
+
+
+def test_move_timeout_stops_the_stages_and_raises(controller, sim, stages, clock, monkeypatch):
+    monkeypatch.setattr(motionprofile, 'TIMEOUT_FACTOR', 0.0)
+    monkeypatch.setattr(motionprofile, 'TIMEOUT_MARGIN_S', 0.1)
+    messages = []
+    controller.message.connect(messages.append)
+    clock.stop()
+
+    with pytest.raises(TimeoutError):
+        controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+    assert controller.state == TelSimStates.IDLE
+    assert any('Alt TS took more than' in message for message in messages)
+    controller.wait(0.1)
+    assert motor(sim, stages, 'alt').get('SPMG') == SPMG_STOP
+
+    # The error is raised once, and the controller can move again
+    monkeypatch.undo()
+    clock.start(0)
+    controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+    assert motor(sim, stages, 'alt').get('RBV') == pytest.approx(8.0, abs=ARRIVAL_TOL)
+
+
+def test_cleanup_waits_for_the_stages_to_settle_home(controller, sim, stages):
+    controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+    atOff = []
+    controller.stateChanged.connect(lambda state: atOff.append(
+        {prefix: (m.get('RBV'), m.get('MOVN'), m.get('VELO'), m.get('ACCL')) for prefix, m in sim.motors.items()})
+        if state == TelSimStates.OFF else None)
+    controller.close()
+    controller.waitForState(TelSimStates.OFF, timeout=10)
+
+    assert len(atOff) == 1
+    for stage in stages:
+        rbv, movn, velo, accl = atOff[0][stage.prefix]
+        assert movn == 0
+        assert rbv == pytest.approx(stage.home('VAL'), abs=ARRIVAL_TOL)
+        if stage.home('VELO') is not None:
+            assert (velo, accl) == (stage.home('VELO'), stage.home('ACCL'))
+
+
+def test_cleanup_waits_for_lagging_monitors(sim, stages, clock):
+    controller = TelSimController(stages=stages)
+    controller.attach({key: LaggingChannel(sim.channel(name)) for key, name in stages.channels()})
+    try:
+        controller.setup()
+        controller.waitForState(TelSimStates.IDLE, timeout=5)
+        controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+        controller.wait(0.2)
+        controller.close()
+        controller.waitForState(TelSimStates.OFF, timeout=10)
+
+        # MOVN=0 from before the home move must not count: OFF only once the monitors show the stages home
+        for stage in stages:
+            assert controller.watcher.values[stage.key('MOVN')] == 0
+            assert controller.watcher.values[stage.key('RBV')] == pytest.approx(stage.home('VAL'), abs=ARRIVAL_TOL)
+    finally:
+        controller.shutdown()
+
+
+def test_cleanup_timeout_stops_the_stages(controller, sim, stages, clock, monkeypatch):
+    controller.move(alt=8.0, pos=20.0, vel=10.0, accel=0.5)
+    monkeypatch.setattr(controllerModule, 'TIMEOUT_MS', 200)
+    clock.stop()
+    controller.close()
+
+    with pytest.raises(TimeoutError):
+        controller.waitForState(TelSimStates.OFF, timeout=5)
+    assert controller.state == TelSimStates.IDLE
+    controller.wait(0.2)
+    assert not controller.writes.pending()
+    for prefix, m in sim.motors.items():
+        assert m.get('SPMG') == SPMG_STOP, prefix
+
+
+def test_lost_channel_pauses_the_move_until_it_is_back(controller, sim, stages, clock):
+    altPrefix = stages.primary('alt').prefix
+    clock.stop()
+    reached = states(controller)
+    controller.start(Segment(None, 20.0, 10.0, 0.5, 8.0))
+    controller.waitForState(TelSimStates.AWAIT_ALT, timeout=5)
+
+    sim.setConnected(altPrefix, False)
+    controller.waitForState(TelSimStates.PAUSED, timeout=5)
+    assert not controller.health.healthy()
+
+    sim.setConnected(altPrefix, True)
+    controller.waitForState(TelSimStates.MOVE_ALT, timeout=5)
+    clock.start(0)
+    controller.waitForState(TelSimStates.IDLE, timeout=10)
+
+    assert TelSimStates.STOPPED not in reached
+    assert motor(sim, stages, 'alt').get('RBV') == pytest.approx(8.0, abs=ARRIVAL_TOL)
+    assert motor(sim, stages, 'wind').get('RBV') == pytest.approx(20.0, abs=ARRIVAL_TOL)
+
+
+def test_move_refused_while_a_channel_is_down(controller, sim, stages, waitFor):
+    sim.setConnected(stages.primary('wind').prefix, False)
+    waitFor(lambda: not controller.health.healthy(), what='wind channels lost')
+    messages = []
+    controller.message.connect(messages.append)
+    controller.start(Segment(None, 20.0, 10.0, 0.5, 8.0))
+
+    assert controller.state == TelSimStates.IDLE
+    assert any(message.startswith('Not moving') for message in messages)
+
+
+def test_move_only_from_idle(sim, stages):
+    controller = TelSimController(stages=stages)
+    controller.connectChannels(sim)
+    try:
+        assert controller.state == TelSimStates.OFF
+        with pytest.raises(RuntimeError):
+            controller.move(alt=8.0, pos=20.0, vel=10.0)
+    finally:
+        controller.shutdown()
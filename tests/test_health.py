@@ -0,0 +1,226 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+import health
+from backend import KeckChannel
+from health import HealthMonitor, sameValue
+from timing import Timing
+
+
+class Gateway:
+    '''What the fake channels read through; reads fail while it is down'''
+
+    def __init__(self):
+        self.up = True
+        self.value = 1.0
+
+
+class FakeChannel(QtCore.QObject):
+    '''A kPyQt-like channel with only a floatCallback, as some kPyQt objects have'''
+
+    floatCallback = pyqtSignal(float)
+
+    def __init__(self, gateway):
+        super().__init__()
+        self.gateway = gateway
+        self.dead = False
+
+    def read(self):
+        if not self.gateway.up or self.dead:
+            raise ConnectionError('gateway down')
+        return self.gateway.value
+
+    def primeCallback(self):
+        self.floatCallback.emit(self.gateway.value)
+
+
+class ConnectedChannel(FakeChannel):
+    '''A channel that can say whether it is connected, but does not signal it'''
+
+    def isConnected(self):
+        return self.gateway.up
+
+
+class SignallingChannel(FakeChannel):
+    '''A channel that signals its connection changes, as the simulator and proxy channels do'''
+
+    connectionCallback = pyqtSignal(bool)
+
+
+@pytest.fixture
+def monitor(app, monkeypatch):
+    monkeypatch.setattr(health, 'BACKOFF_MIN_S', 0.05)
+    monkeypatch.setattr(health, 'IDLE_POLL_MS', 10)
+    monitor = HealthMonitor(probeMs=10, staleS=0.1, probeS=0.02)
+    events = []
+    monitor.lost.connect(lambda name: events.append(('lost', name)))
+    monitor.restored.connect(lambda: events.append(('restored',)))
+    monitor.events = events
+    yield monitor
+    monitor.shutdown()
+
+
+def test_same_value():
+    assert sameValue(1, '1.0')
+    assert sameValue('OPEN', 'OPEN')
+    assert not sameValue('OPEN', 'CLOSE')
+    assert not sameValue(1.0, 1.5)
+    # Through text or single precision on one side
+    assert sameValue('12.3457', 12.345678)
+    assert sameValue(0.1, float(np.float32(0.1)))
+    assert not sameValue(0.0, 0.001)
+
+
+def test_quiet_monitor_on_a_changed_value_is_stale(monitor, waitFor):
+    gateway = Gateway()
+    channel = FakeChannel(gateway)
+    monitor.add('x', channel, required=True)
+    monitor.setActive(True)
+    channel.floatCallback.emit(1.0)
+    waitFor(lambda: monitor.channels['x'].lastProbe is not None, what='first probe')
+    assert monitor.healthy()
+
+    # The value changes but no monitor update arrives
+    gateway.value = 2.0
+    waitFor(lambda: monitor.events, what='stale channel')
+    assert monitor.events == [('lost', 'x')]
+    assert monitor.channels['x'].stale
+    assert monitor.unhealthy() == ['x']
+
+    channel.floatCallback.emit(2.0)
+    waitFor(lambda: len(monitor.events) == 2, what='restored')
+    assert monitor.events[-1] == ('restored',)
+    assert monitor.healthy()
+
+
+def test_unchanged_value_is_not_stale(monitor, app):
+    channel = FakeChannel(Gateway())
+    monitor.add('x', channel, required=True)
+    monitor.setActive(True)
+    channel.floatCallback.emit(1.0)
+    deadline = time.monotonic() + 0.4
+    while time.monotonic() < deadline:
+        app.processEvents()
+    assert monitor.events == []
+
+
+def test_dead_gateway_is_reconnected(monitor, waitFor):
+    gateway = Gateway()
+    made = []
+
+    def factory():
+        if not gateway.up:
+            raise ConnectionError('no gateway')
+        made.append(FakeChannel(gateway))
+        return made[-1]
+
+    channel = KeckChannel(factory, 'x')
+    values = []
+    channel.floatCallback.connect(values.append)
+    monitor.add('x', channel, required=True)
+    monitor.setActive(True)
+    made[-1].floatCallback.emit(1.0)
+
+    gateway.up = False
+    waitFor(lambda: monitor.events, what='lost channel')
+    assert monitor.events == [('lost', 'x')]
+    assert not monitor.channels['x'].connected
+
+    # The old object never recovers; only a new one from the factory does
+    made[-1].dead = True
+    gateway.up = True
+    gateway.value = 3.0
+    waitFor(lambda: len(monitor.events) == 2, what='reconnect')
+    assert monitor.events[-1] == ('restored',)
+    assert len(made) == 2
+    assert monitor.channels['x'].reconnects >= 1
+    # The new object's updates come through the same KeckChannel signals
+    assert values[-1] == 3.0
+
+
+def test_optional_channel_does_not_stop_motion(monitor, waitFor):
+    gateway = Gateway()
+    monitor.add('loop', ConnectedChannel(gateway), required=False)
+    gateway.up = False
+    waitFor(lambda: monitor.unhealthy() == ['loop'], what='lost channel')
+    assert monitor.healthy()
+    assert monitor.events == []
+
+
+class CountingChannel(FakeChannel):
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        return super().read()
+
+
+def test_nothing_read_at_rest(monitor, app):
+    channel = CountingChannel(Gateway())
+    monitor.add('x', channel, required=True)
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        app.processEvents()
+    assert channel.reads == 0
+    assert not monitor._timer.isActive()
+
+    monitor.setActive(True)
+    assert monitor._timer.isActive()
+    monitor.setActive(False)
+    assert not monitor._timer.isActive()
+
+
+def test_connection_callback_is_reported_at_once(monitor):
+    channel = SignallingChannel(Gateway())
+    monitor.add('x', channel, required=True)
+    assert not monitor._timer.isActive()
+
+    channel.connectionCallback.emit(False)
+    assert monitor.events == [('lost', 'x')]
+    channel.connectionCallback.emit(True)
+    assert monitor.events[-1] == ('restored',)
+    assert monitor.healthy()
+
+
+def test_dead_gateway_noticed_in_about_a_second(app, waitFor):
+    gateway = Gateway()
+    answering = threading.Event()
+    answering.set()
+
+    class HangingChannel(FakeChannel):
+        def read(self):
+            # A read through a dead gateway does not fail, it just does not come back
+            answering.wait()
+            return super().read()
+
+    monitor = HealthMonitor()
+    try:
+        monitor.add('x', HangingChannel(gateway), required=True)
+        monitor.setActive(True)
+        answering.clear()
+        start = time.monotonic()
+        waitFor(lambda: not monitor.healthy(), timeout=3, what='dead gateway')
+        assert time.monotonic() - start < 1.5
+    finally:
+        answering.set()
+        monitor.shutdown()
+
+
+def test_probes_are_not_timed(monitor, waitFor):
+    timing = Timing()
+    probed = CountingChannel(Gateway())
+    channel = timing.channel(probed, 'x')
+    monitor.add('x', channel, required=True)
+    monitor.setActive(True)
+    waitFor(lambda: probed.reads >= 2, what='probe reads')
+    assert [kind for kind, *_ in timing.stats()] == []
+    channel.read()
+    assert [kind for kind, *_ in timing.stats()] == ['read']
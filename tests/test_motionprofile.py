@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from motionprofile import trapezoid, moveTime, moveTimes, predictSequence, timeoutMs, TIMEOUT_FACTOR, \
+    TIMEOUT_MARGIN_S
+
+
+def travel(phases):
+    '''(distance covered, final velocity) of trapezoid() phases'''
+    position = 0.0
+    for duration, velocity, accel in phases:
+        position += velocity * duration + 0.5 * accel * duration * duration
+        velocity += accel * duration
+    return position, (velocity if phases else 0.0)
+
+
+@pytest.mark.parametrize('distance, velocity, accelTime', [
+    (20.0, 10.0, 0.5),  # Reaches VELO
+    (-20.0, 10.0, 0.5),
+    (1.0, 10.0, 0.5),  # Too short to reach VELO
+])
+def test_trapezoid_covers_the_distance_and_ends_at_rest(distance, velocity, accelTime):
+    phases = trapezoid(distance, velocity, accelTime)
+    covered, final = travel(phases)
+    assert covered == pytest.approx(distance)
+    assert final == pytest.approx(0.0, abs=1e-12)
+    assert all(abs(v) <= velocity + 1e-12 for _, v, _ in phases)
+
+
+def test_no_acceleration_phase():
+    assert trapezoid(-3.0, 2.0, 0.0) == [(1.5, -2.0, 0.0)]
+
+
+def test_no_move():
+    assert trapezoid(0.0, 10.0, 0.5) == []
+    assert trapezoid(5.0, 0.0, 0.5) == []
+    assert moveTime(0.0, 10.0, 0.5) == 0.0
+
+
+def test_move_time():
+    # 0.5 s up to 10 units/s and 0.5 s back down cover 5 units; the other 15 take 1.5 s
+    assert moveTime(20.0, 10.0, 0.5) == pytest.approx(2.5)
+    # Triangular: accelerating at 20 units/s^2 for sqrt(1/20) s covers half of 1 unit
+    assert moveTime(1.0, 10.0, 0.5) == pytest.approx(2 * np.sqrt(1.0 / 20.0))
+
+
+def test_move_times_match_move_time():
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(-50, 50, 200)
+    velocity = rng.uniform(0.5, 80, 200)
+    accelTime = rng.uniform(0, 10, 200)
+    expected = [moveTime(d, v, a) for d, v, a in zip(distance, velocity, accelTime)]
+    np.testing.assert_allclose(moveTimes(distance, velocity, accelTime), expected)
+
+
+def test_predict_sequence():
+    alt = [(3.0, 1.0, 0.5)]
+    wind = [(20.0, 10.0, 0.5), (10.0, 10.0, 0.5)]
+    sequential = predictSequence(alt, wind)
+    assert sequential.alt == pytest.approx(3.5)
+    assert sequential.wind == pytest.approx(2.5)
+    assert sequential.total == pytest.approx(6.0)
+    assert predictSequence(alt, wind, parallel=True).total == pytest.approx(3.5)
+    assert predictSequence([], wind).alt == 0.0
+
+
+def test_timeout():
+    assert timeoutMs(2.0) == round((2.0 * TIMEOUT_FACTOR + TIMEOUT_MARGIN_S) * 1000)
+    assert timeoutMs(0.0) == round(TIMEOUT_MARGIN_S * 1000)
@@ -0,0 +1,144 @@
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+from controller import TelSimController, TelSimStates, ARRIVAL_TOL
+from proxy import TelemetryProxy, ProxyBackend, channelId
+from simulator import SimBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WIND_RBV = 'wndsim:ln:m1.RBV'
+
+
+def serve(path):
+    '''Start a simulator proxy process on path and wait until it is listening'''
+    process = subprocess.Popen([sys.executable, 'telsim.py', '--sim', '--sim-speed', '20', '--serve-proxy', path],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            ProxyBackend(path).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise
+            time.sleep(0.05)
+
+
+@pytest.fixture
+def proxyPath(tmp_path):
+    path = str(tmp_path / 'proxy')
+    process = serve(path)
+    yield path
+    process.terminate()
+    process.wait(10)
+
+
+def test_read_only_client(app, proxyPath):
+    client = ProxyBackend(proxyPath)
+    try:
+        assert client.readOnly
+        channel = client.channel(WIND_RBV)
+        assert channel.read() == 0.0
+        assert client.keyword('ao1', 'dtlp').read() == 'OPEN'
+        with pytest.raises(PermissionError):
+            channel.write(1.0)
+    finally:
+        client.close()
+
+
+def test_control_client_moves_the_stages_for_everyone(app, proxyPath, stages, waitFor):
+    watcher = ProxyBackend(proxyPath)
+    position = watcher.channel(WIND_RBV)
+    controller = TelSimController(stages=stages)
+    controller.connectChannels(ProxyBackend(proxyPath, control=True))
+    try:
+        assert not controller.backend.readOnly
+        with pytest.raises(PermissionError):
+            ProxyBackend(proxyPath, control=True)
+
+        controller.setup()
+        controller.waitForState(TelSimStates.IDLE, timeout=10)
+        controller.move(alt=6.0, pos=5.0, vel=10.0)
+        waitFor(lambda: abs(position.read() - 5.0) <= ARRIVAL_TOL, what='wind position seen by the other client')
+
+        controller.close()
+        controller.waitForState(TelSimStates.OFF, timeout=30)
+        assert controller.readback('wind') == pytest.approx(0.0, abs=ARRIVAL_TOL)
+        assert controller.readback('wind', 'MOVN') == 0
+    finally:
+        controller.shutdown()
+        controller.backend.close()
+        watcher.close()
+
+
+def test_writes_are_answered(app, proxyPath):
+    client = ProxyBackend(proxyPath, control=True)
+    try:
+        # An id this client never subscribed to gets an error reply, not silence
+        with pytest.raises(RuntimeError, match='not subscribed'):
+            client.write(channelId('wndsim:ln:m1.VAL'), 1.0)
+
+        # A put with wait gives up after its timeout: this one lasts as long as the move
+        channel = client.channel('wndsim:ln:m1.VAL')
+        with pytest.raises(TimeoutError):
+            client.write(channel.id, 40.0, timeout=0.05)
+    finally:
+        client.close()
+
+
+def test_client_reconnects_to_a_restarted_proxy(app, tmp_path, waitFor):
+    path = str(tmp_path / 'proxy')
+    process = serve(path)
+    client = ProxyBackend(path)
+    try:
+        channel = client.channel(WIND_RBV)
+        values = []
+        channel.floatCallback.connect(values.append)
+        process.terminate()
+        process.wait(10)
+        waitFor(lambda: not client.connected, what='proxy gone')
+        assert not client.reconnect()
+
+        process = serve(path)
+        assert client.reconnect()
+        assert channel.isConnected()
+        waitFor(lambda: values, what='value sent again on reconnecting')
+        assert values[-1] == 0.0
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(10)
+
+
+def test_second_proxy_refused_and_socket_private(app, proxyPath, stages):
+    assert stat.S_IMODE(os.stat(proxyPath).st_mode) & 0o077 == 0
+    proxy = TelemetryProxy(SimBackend(stages=stages), proxyPath)
+    try:
+        with pytest.raises(OSError, match='already running'):
+            proxy.listen()
+    finally:
+        proxy.close()
+
+
+def test_stale_socket_replaced(app, tmp_path, stages):
+    path = str(tmp_path / 'proxy')
+    # A socket file nobody is listening on, as left by a proxy that was killed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    proxy = TelemetryProxy(SimBackend(stages=stages), path)
+    try:
+        proxy.listen()
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.connect(path)
+        probe.close()
+    finally:
+        proxy.close()
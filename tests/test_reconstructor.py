@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+import reconstructor
+from reconstructor import loadReconstructor, fileKey
+from stages import StageRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def matrixPath(tmp_path):
+    path = str(tmp_path / 'recon.txt')
+    np.savetxt(path, np.arange(12.0).reshape(3, 4))
+    return path
+
+
+def test_parsed_once_then_cached(matrixPath, tmp_path):
+    cache = str(tmp_path / 'cache')
+    matrix, fromCache = loadReconstructor(matrixPath, (3, 4), cache)
+    assert not fromCache
+    again, fromCache = loadReconstructor(matrixPath, (3, 4), cache)
+    assert fromCache
+    np.testing.assert_array_equal(again, np.arange(12.0).reshape(3, 4))
+    assert not again.flags.writeable
+
+
+def test_changed_file_is_parsed_again(matrixPath, tmp_path):
+    cache = str(tmp_path / 'cache')
+    loadReconstructor(matrixPath, None, cache)
+    np.savetxt(matrixPath, np.ones((3, 4)))
+    os.utime(matrixPath, ns=(1, 1))
+    matrix, fromCache = loadReconstructor(matrixPath, None, cache)
+    assert not fromCache
+    assert matrix.sum() == 12.0
+
+
+def test_file_hashed_once_per_version(matrixPath, monkeypatch):
+    key = fileKey(matrixPath)
+    monkeypatch.setattr(reconstructor.hashlib, 'sha1', lambda: pytest.fail('file hashed again'))
+    assert fileKey(matrixPath) == key
+    monkeypatch.undo()
+
+    os.utime(matrixPath, ns=(1, 1))
+    assert fileKey(matrixPath) != key
+
+
+@pytest.mark.parametrize('contents, shape, message', [
+    ('1 2\n3 4\n', (3, 4), 'does not match the expected'),
+    ('1 nan\n3 4\n', None, 'non-finite'),
+])
+def test_invalid_matrix(tmp_path, contents, shape, message):
+    path = tmp_path / 'recon.txt'
+    path.write_text(contents)
+    with pytest.raises(ValueError, match=message):
+        loadReconstructor(str(path), shape, str(tmp_path / 'cache'))
+
+
+def test_expected_shape_from_the_stages_file(tmp_path):
+    with open(os.path.join(ROOT, 'stages.ini')) as f:
+        text = f.read()
+    path = tmp_path / 'stages.ini'
+    path.write_text(text)
+    assert StageRegistry.load(str(path)).reconstructorShape is None
+
+    path.write_text(text + '\n[loop]\nreconstructor_rows = 3\nreconstructor_columns = 4\n')
+    registry = StageRegistry.load(str(path))
+    assert registry.reconstructorShape == (3, 4)
+    assert [stage.name for stage in registry] == ['alt', 'wind']
+
+    path.write_text(text + '\n[loop]\nreconstructor_rows = 3\n')
+    with pytest.raises(ValueError, match='reconstructor_columns'):
+        StageRegistry.load(str(path))
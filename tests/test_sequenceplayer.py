@@ -0,0 +1,60 @@
+import pytest
+
+from controller import TelSimStates, ARRIVAL_TOL
+from sequenceplayer import SequencePlayer
+
+
+def test_next_segment_is_queued_before_the_move_arrives(controller, sim, stages, tmp_path):
+    path = tmp_path / 'sequence.txt'
+    # All due at once: each segment is posted while the one before is still moving
+    path.write_text('0 10 10 0.5 5\n0 -10 10 0.5 5\n0 5 10 0.5 5\n')
+    arrivals = []
+    controller.stateChanged.connect(
+        lambda state: arrivals.append(controller.queued) if state == TelSimStates.IDLE else None)
+    messages = []
+    controller.message.connect(messages.append)
+
+    assert controller.playSequenceFile(str(path))
+    controller.waitForPlayback(timeout=30)
+
+    # Each arrival but the last finds the next segment waiting, and IDLE starts it at once
+    assert [segment.position if segment else None for segment in arrivals] == [-10.0, 5.0, None]
+    assert controller.player.completed == 3
+    assert sim.motors[stages.primary('wind').prefix].get('RBV') == pytest.approx(5.0, abs=ARRIVAL_TOL)
+    assert messages[-1].startswith(f'{path}: finished. 3 segments, ')
+
+
+def test_segments_checked_as_they_are_streamed(controller, sim, stages, tmp_path):
+    path = tmp_path / 'sequence.txt'
+    # The bad row is only reached after the first has been played
+    path.write_text('0 10 10 0.5 5\n0.2 500 10 0.5 5\n0.4 5 10 0.5 5\n')
+    messages = []
+    controller.message.connect(messages.append)
+
+    assert controller.playSequenceFile(str(path))
+    controller.waitForPlayback(timeout=30)
+    controller.waitForState(TelSimStates.IDLE, timeout=10)
+
+    assert messages[-1].startswith(f'{path}: line 2: ')
+    assert controller.player.completed == 1
+    assert sim.motors[stages.primary('wind').prefix].get('RBV') == pytest.approx(10.0, abs=ARRIVAL_TOL)
+
+
+def test_no_rates_until_two_segments(app, waitFor, tmp_path):
+    path = tmp_path / 'sequence.txt'
+    path.write_text('0 0 10 0.5 5\n0.1 0 10 0.5 5\n0.3 0 10 0.5 5\n')
+    posted = []
+    player = SequencePlayer(str(path), posted.append)
+    player.start()
+    waitFor(lambda: posted, what='first segment')
+    assert player.rates() is None
+    assert player.rateReport() == '0 segments'
+
+    player.segmentDone()
+    assert player.rates() is None
+    waitFor(lambda: len(posted) == 2, what='second segment')
+    player.segmentDone()
+    achieved, requested = player.rates()
+    assert requested == pytest.approx(10.0)
+    assert achieved > 0
+    player.stop()
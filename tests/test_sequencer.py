@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from sequencer import ActionSequencer
+
+
+@pytest.fixture
+def sequencer(app):
+    sequencer = ActionSequencer(pollMs=5)
+    sequencer.shown = []
+    sequencer.pendingChanged.connect(sequencer.shown.append)
+    return sequencer
+
+
+def test_steps_run_in_order_without_blocking(sequencer, waitFor):
+    done = []
+    sequencer.call(lambda: done.append('first'), 'first').wait(20, 'settle').call(lambda: done.append('second'),
+                                                                                   'second')
+    assert done == []
+    assert sequencer.pending() == ['first', 'settle', 'second']
+
+    waitFor(lambda: done == ['first'], what='first step')
+    assert sequencer.pending() == ['settle', 'second']
+    waitFor(lambda: not sequencer.isBusy(), what='sequence end')
+    assert done == ['first', 'second']
+    assert sequencer.shown[-1] == []
+
+
+def test_wait_until_a_condition(sequencer, app, waitFor):
+    ready = []
+    done = []
+    sequencer.waitUntil(lambda: ready, 5000, 'ready').call(lambda: done.append(True), 'after')
+    # While the condition is false it is polled, and the step after it waits
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        app.processEvents()
+    assert sequencer.pending() == ['ready', 'after']
+    assert done == []
+
+    ready.append(True)
+    waitFor(lambda: done, what='step after the condition')
+    assert not sequencer.isBusy()
+
+
+def test_wait_until_times_out(sequencer, waitFor):
+    timedOut = []
+    done = []
+    sequencer.waitUntil(lambda: False, 30, 'never', lambda: timedOut.append(True))
+    sequencer.call(lambda: done.append(True), 'after')
+    waitFor(lambda: timedOut, what='timeout')
+    assert done == []
+    assert sequencer.pending() == []
+    assert not sequencer.isBusy()
+
+
+def test_cancel(sequencer, waitFor):
+    done = []
+    sequencer.waitUntil(lambda: False, 5000, 'never').call(lambda: done.append(True), 'after')
+    waitFor(lambda: sequencer.pending() == ['never', 'after'], what='waiting')
+    sequencer.cancel()
+    assert sequencer.pending() == []
+    assert not sequencer.isBusy()
+    assert done == []
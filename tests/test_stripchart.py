@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from stripchart import ColumnTrace, StripChart, LABEL_WIDTH
+from telemetry import RingBuffer, TelemetryRecorder
+
+PANELS = [('Wind', (-50, 50), [('a', 'blue'), ('b', 'red')])]
+
+
+def reference(times, values, span, newest, width):
+    '''(low, high) of the width columns up to newest, worked out column by column from every sample'''
+    low = np.full(width, np.nan)
+    high = np.full(width, np.nan)
+    for j, column in enumerate(range(newest - width + 1, newest + 1)):
+        held = [v for t, v in zip(times, values) if t < column * span][-1:]
+        inside = [v for t, v in zip(times, values) if column * span <= t < (column + 1) * span]
+        if held or inside:
+            low[j] = min(held + inside)
+            high[j] = max(held + inside)
+    return low, high
+
+
+def test_folding_in_new_samples_matches_the_whole_window():
+    rng = np.random.default_rng(1)
+    times = np.cumsum(rng.exponential(0.3, 400)) + 100.0
+    values = rng.uniform(-10, 10, 400)
+    ring = RingBuffer(1000)
+    span, width = 0.5, 40
+
+    trace = ColumnTrace(ring, span, width)
+    trace.fill(times[0] - 5.0)
+    for batch in np.array_split(np.arange(400), 37):
+        for i in batch:
+            ring.append(times[i], values[i])
+        trace.update()
+        newest = int(times[batch[-1]] // span)
+        low, high = trace.columns(newest)
+        expected = reference(times[:batch[-1] + 1], values[:batch[-1] + 1], span, newest, width)
+        np.testing.assert_array_equal(low, expected[0])
+        np.testing.assert_array_equal(high, expected[1])
+
+        fresh = ColumnTrace(ring, span, width)
+        fresh.fill(newest * span)
+        np.testing.assert_array_equal(fresh.columns(newest), (low, high))
+
+    # Time goes on with nothing recorded
+    np.testing.assert_array_equal(trace.columns(newest + 15), reference(times, values, span, newest + 15, width))
+
+
+def test_timer_runs_only_while_shown(app):
+    recorder = TelemetryRecorder(['a', 'b'])
+    chart = StripChart(recorder, PANELS, window=60, fps=20)
+    chart.resize(400, 200)
+    assert not chart._timer.isActive()
+
+    chart.show()
+    app.processEvents()
+    assert chart._timer.isActive()
+    chart.setFps(10)
+    assert chart._timer.interval() == 100
+
+    chart.hide()
+    assert not chart._timer.isActive()
+    chart.setFps(5)
+    assert not chart._timer.isActive()
+    recorder.close()
+
+
+def test_frames_fold_in_only_new_samples(app, monkeypatch):
+    recorder = TelemetryRecorder(['a', 'b'])
+    for i in range(1000):
+        recorder.record('a', float(i % 50))
+    chart = StripChart(recorder, PANELS, window=60)
+    chart.resize(400, 200)
+    chart.grab()
+
+    monkeypatch.setattr(RingBuffer, 'window', lambda *args: pytest.fail('window copied out again'))
+    recorder.record('a', 1.0)
+    recorder.record('b', 2.0)
+    chart.grab()
+    assert chart._traces['b'].held == 2.0
+    monkeypatch.undo()
+
+    # Resized, the columns change and the window is copied out again
+    chart.resize(300, 200)
+    chart.grab()
+    assert chart._traces['a'].width == 300 - LABEL_WIDTH
+    recorder.close()
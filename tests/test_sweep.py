@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import sweep as sweepModule
+from controller import ARRIVAL_TOL
+from sequenceplayer import Segment
+from sweep import Sweep, SweepResult, parseValues, grid, transitionTimes, order, pathTime
+
+
+def test_parse_values():
+    assert parseValues('5:12:1') == [5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0]
+    assert parseValues('-0.3:0.3:0.1') == [-0.3, -0.2, -0.1, 0.0, 0.1, 0.2, 0.3]
+    assert parseValues('10,20,40') == [10.0, 20.0, 40.0]
+
+
+def test_grid():
+    points = grid([5, 6], [0, 10, 20], [10], [0.5])
+    assert len(points) == 6
+    assert points[0] == Segment(None, 0, 10, 0.5, 5)
+    assert points[-1] == Segment(None, 20, 10, 0.5, 6)
+
+
+def test_order_visits_every_point_once_and_is_no_slower():
+    rng = np.random.default_rng(3)
+    points = [Segment(None, position, 10.0, 0.5, altitude)
+              for position, altitude in zip(rng.uniform(-40, 40, 12), rng.uniform(5, 12, 12))]
+    costs = transitionTimes(points, Segment(None, 0.0, 2.0, 0.1, 5.0), 1.0, 0.5)
+    tour = order(costs)
+
+    assert tour[0] == 0
+    assert sorted(tour) == list(range(len(points) + 1))
+    assert pathTime(costs, tour) <= pathTime(costs, range(len(points) + 1))
+
+
+def test_order_is_optimal_on_a_small_sweep():
+    points = grid([5, 8], [-20, 0, 20], [10], [0.5])
+    costs = transitionTimes(points, Segment(None, 0.0, 2.0, 0.1, 5.0), 1.0, 0.5)
+    best = min(pathTime(costs, (0,) + tour) for tour in itertools.permutations(range(1, len(points) + 1)))
+    assert pathTime(costs, order(costs)) == pytest.approx(best)
+
+
+def test_transition_times_in_parallel_are_the_longer_move():
+    points = [Segment(None, 20.0, 10.0, 0.5, 8.0)]
+    start = Segment(None, 0.0, 2.0, 0.1, 5.0)
+    sequential = transitionTimes(points, start, 1.0, 0.5)
+    parallel = transitionTimes(points, start, 1.0, 0.5, parallel=True)
+    assert sequential[0, 1] == pytest.approx(3.5 + 2.5)
+    assert parallel[0, 1] == pytest.approx(3.5)
+
+
+def test_sweep_run(controller, sim, stages, tmp_path, monkeypatch):
+    monkeypatch.setattr(sweepModule, 'LOOP_SETTLE_MS', 10)
+    points = grid([8, 6], [20, -20], [10], [0.5])
+    measured = []
+    sweep = Sweep(points, loops=['closed', 'open'], measure=lambda point, loop: measured.append((point, loop)))
+    reported = []
+    results = sweep.run(controller, report=reported.append)
+
+    assert len(results) == len(points) * 2
+    assert reported == results
+    assert sorted(result.index for result in results) == sorted(list(range(len(points))) * 2)
+    assert [loop for _, loop in measured] == ['closed', 'open'] * len(points)
+    assert sweep.predicted[1] <= sweep.predicted[0]
+    last = points[results[-1].index]
+    assert sim.motors[stages.primary('wind').prefix].get('RBV') == pytest.approx(last.position, abs=ARRIVAL_TOL)
+    assert sim.services['ao1'].get('dtlp') == 'OPEN'
+
+    path = tmp_path / 'sweep.csv'
+    sweep.write(str(path))
+    lines = path.read_text().splitlines()
+    assert lines[0].split(',') == list(SweepResult._fields)
+    assert len(lines) == len(results) + 1
+
+
+def test_settle_times_on_a_fast_simulator(running, monkeypatch):
+    monkeypatch.setattr(sweepModule, 'LOOP_SETTLE_MS', 10)
+    controller = running(20.0)
+    sweep = Sweep(grid([8, 6], [20, -20], [10], [0.5]))
+    results = sweep.run(controller)
+
+    assert len(results) == 4
+    for result in results:
+        # The simulator follows the predicted profile, and the times are in its seconds
+        assert 0.0 <= result.settleAlt < 1.0
+        assert 0.0 <= result.settleWind < 1.0
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from telemetry import RingBuffer, TelemetryLog, TelemetryRecorder, RECORD_DTYPE, MAGIC, readLog
+
+
+@pytest.mark.parametrize('count', [0, 5, 8, 13, 16, 21])
+def test_ring_window(count):
+    ring = RingBuffer(8)
+    for i in range(count):
+        ring.append(float(i), i * 10.0)
+    kept = list(range(max(0, count - 8), count))
+
+    for t0 in np.arange(-1, 23, 0.5):
+        times, values, before, end = ring.window(t0)
+        assert end == count
+        assert list(times) == [i for i in kept if i >= t0]
+        assert list(values) == [i * 10.0 for i in kept if i >= t0]
+        earlier = [i for i in kept if i < t0]
+        assert before == (earlier[-1] * 10.0 if earlier else None)
+
+
+def test_ring_since_skips_overwritten_samples():
+    ring = RingBuffer(4)
+    for i in range(6):
+        ring.append(float(i), float(i))
+    times, values, end = ring.since(0)
+    assert list(times) == [2.0, 3.0, 4.0, 5.0]
+    assert end == 6
+
+
+def test_recorder_round_trip(tmp_path):
+    path = str(tmp_path / 'telemetry.bin')
+    recorder = TelemetryRecorder(['a', 'ao1.dtlp'], path)
+    for i in range(100):
+        recorder.record('a', float(i))
+    recorder.recordKeyword('ao1.dtlp', 'CLOSE')
+    recorder.recordKeyword('ao1.dtlp', '3')
+    recorder.recordKeyword('ao1.dtlp', 'not a number')
+    recorder.close()
+
+    channels, records = readLog(path)
+    assert channels == ['a', 'ao1.dtlp']
+    assert np.all(np.diff(records['time']) >= 0)
+    assert list(records[records['channel'] == 0]['value']) == [float(i) for i in range(100)]
+    assert list(records[records['channel'] == 1]['value']) == [1.0, 3.0]
+    assert recorder.dropped == 0
+
+
+def slowClock(clock):
+    '''clock, pausing after reading it: a sample's time is taken a while before it is appended'''
+    sleep = time.sleep
+
+    def slow():
+        t = clock()
+        sleep(0.00005)
+        return t
+    return slow
+
+
+def test_log_stays_in_order_while_flushing_concurrently(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, 'monotonic', slowClock(time.monotonic))
+    monkeypatch.setattr(time, 'time', slowClock(time.time))
+    path = str(tmp_path / 'telemetry.bin')
+    recorder = TelemetryRecorder(['a', 'b', 'c'], path)
+    stop = threading.Event()
+
+    def flushing():
+        while not stop.is_set():
+            recorder.flush()
+
+    def recording(name):
+        for i in range(300):
+            recorder.record(name, float(i))
+
+    flusher = threading.Thread(target=flushing)
+    flusher.start()
+    writers = [threading.Thread(target=recording, args=(name,)) for name in ['a', 'b', 'c']]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    stop.set()
+    flusher.join()
+    recorder.close()
+
+    _, records = readLog(path)
+    assert len(records) == 900
+    assert np.all(np.diff(records['time']) >= 0)
+    for channel in range(3):
+        assert list(records[records['channel'] == channel]['value']) == [float(i) for i in range(300)]
+
+
+def test_samples_are_stamped_on_a_monotonic_clock(tmp_path):
+    path = str(tmp_path / 'telemetry.bin')
+    before = time.monotonic()
+    recorder = TelemetryRecorder(['a'], path)
+    recorder.record('a', 1.0)
+    recorder.close()
+
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC
+        header = json.loads(f.readline())
+    _, records = readLog(path)
+    assert before <= records['time'][0] <= time.monotonic()
+    assert header['wallOffset'] == pytest.approx(time.time() - time.monotonic(), abs=1.0)
+    assert TelemetryLog(path).wallOffset == header['wallOffset']
+
+
+def writeLog(path, channels, records):
+    recorder = TelemetryRecorder(channels, path)
+    recorder.close()
+    with open(path, 'ab') as f:
+        records.tofile(f)
+
+
+def randomRecords(count, channels, seed=1):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    records['time'] = 1000.0 + np.cumsum(rng.uniform(0, 0.01, count))
+    records['channel'] = rng.integers(0, channels, count)
+    records['value'] = rng.normal(size=count)
+    return records
+
+
+def test_log_locate_and_snapshot(tmp_path):
+    path = str(tmp_path / 'telemetry.bin')
+    records = randomRecords(5000, 3)
+    writeLog(path, ['a', 'b', 'c'], records)
+    log = TelemetryLog(path, stride=64)
+
+    assert len(log) == len(records)
+    assert log.start == records['time'][0] and log.end == records['time'][-1]
+    for t in np.r_[records['time'][::97], records['time'][0] - 1, records['time'][-1] + 1]:
+        assert log.locate(t) == np.searchsorted(records['time'], t, side='left')
+    for n in [0, 1, 63, 64, 65, 1000, 4999, 5000]:
+        expected = np.full(3, np.nan)
+        for channel in range(3):
+            before = np.flatnonzero(records['channel'][:n] == channel)
+            if len(before):
+                expected[channel] = records['value'][before[-1]]
+        np.testing.assert_array_equal(log.snapshot(n), expected)
+
+
+def test_log_index_is_saved_and_rebuilt_when_the_log_grows(tmp_path, monkeypatch):
+    path = str(tmp_path / 'telemetry.bin')
+    records = randomRecords(1000, 2)
+    writeLog(path, ['a', 'b'], records[:600])
+    TelemetryLog(path, stride=64)
+    assert os.path.exists(path + '.index.npz')
+
+    # An up-to-date index is loaded, not built
+    monkeypatch.setattr(TelemetryLog, '_buildIndex', lambda self: pytest.fail('index rebuilt'))
+    assert len(TelemetryLog(path, stride=64)) == 600
+    monkeypatch.undo()
+
+    with open(path, 'ab') as f:
+        records[600:].tofile(f)
+        # A record still being written is not read
+        f.write(b'\0' * (RECORD_DTYPE.itemsize // 2))
+    log = TelemetryLog(path, stride=64)
+    assert len(log) == 1000
+    assert log.locate(records['time'][800]) == 800
+
+
+def test_not_a_log(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'something else\n')
+    with pytest.raises(ValueError):
+        TelemetryLog(str(path))
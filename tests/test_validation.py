@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from controller import TelSimStates
+from motionprofile import moveTime
+from sequenceplayer import Segment
+from validation import validateTable, validateFile, readTable
+
+ALT_MOTION = [(1.0, 0.5)]  # VELO/ACCL of the alt stage, which stages.ini does not home
+
+
+def table(*rows, **extra):
+    '''A setpoint table from (time, position, velocity, accel, altitude) rows'''
+    columns = dict(zip(Segment._fields, np.array(rows, dtype=float).T))
+    columns.update({name: np.array(values, dtype=float) for name, values in extra.items()})
+    return columns
+
+
+def test_valid_table(stages):
+    rows = table((0, 0, 10, 0.5, 5), (10, 20, 10, 0.5, 6), (20, -20, 20, 1, 7))
+    assert validateTable(rows, stages, altMotion=ALT_MOTION) == []
+
+
+def test_limits(stages):
+    rows = table((0, 50, 10, 0.5, 5), (10, 0, 1, 0.5, 13), (5, 0, 10, 11, 6), gain=[0.5, 1.5, 0.2],
+                 frameRate=[1000, 2500, 10.5])
+    violations = validateTable(rows, stages, altMotion=ALT_MOTION)
+    found = {(violation.row, violation.field) for violation in violations if violation.kind == 'limit'}
+    assert found == {(0, 'position'), (1, 'velocity'), (1, 'altitude'), (1, 'gain'), (1, 'frameRate'),
+                     (2, 'accel'), (2, 'time'), (2, 'frameRate')}
+    assert [violation.row for violation in violations] == sorted(violation.row for violation in violations)
+
+
+def test_binned_frame_rate(stages):
+    rows = table((0, 0, 10, 0.5, 5), frameRate=[2500])
+    assert validateTable(rows, stages, binned=False)
+    assert validateTable(rows, stages, binned=True) == []
+
+
+def test_late_segments(stages):
+    start = Segment(None, 0.0, 2.0, 0.1, 5.0)
+    # Row 0 moves alt 5 -> 8 (3.5 s) then wind 0 -> 20 (2.5 s) with 5 s to spare; row 1 only moves wind back
+    rows = table((0, 20, 10, 0.5, 8), (5, 0, 10, 0.5, 8), (10, 0, 10, 0.5, 8))
+    violations = validateTable(rows, stages, start=start, altMotion=ALT_MOTION)
+    assert [(violation.row, violation.kind) for violation in violations] == [(0, 'timing')]
+    predicted = moveTime(3.0, 1.0, 0.5) + moveTime(20.0, 10.0, 0.5)
+    assert f'{predicted:0.2f} s' in violations[0].message
+
+    # Moving together, the alt move alone decides
+    assert validateTable(rows, stages, start=start, altMotion=ALT_MOTION, parallel=True) == []
+
+
+def test_unknown_alt_motion_still_checks_the_wind(stages):
+    start = Segment(None, 0.0, 2.0, 0.1, 5.0)
+    rows = table((0, 40, 10, 0.5, 8), (2, 40, 10, 0.5, 8), (4, 40, 10, 0.5, 8))
+    violations = validateTable(rows, stages, start=start)
+    assert [(violation.row, violation.kind) for violation in violations] == [(0, 'timing'), (0, 'unchecked')]
+    assert 'Alt TS' in violations[1].message
+
+
+def test_file(stages, tmp_path):
+    path = tmp_path / 'sequence.txt'
+    path.write_text('# time position velocity accel altitude\n'
+                    '0, 0, 10, 0.5, 5\n'
+                    '\n'
+                    '10 50 10 0.5 6\n')
+    columns, lines = readTable(str(path))
+    assert list(lines) == [2, 4]
+    assert list(columns['position']) == [0.0, 50.0]
+
+    violations = validateFile(str(path), stages, altMotion=ALT_MOTION)
+    assert [(violation.line, violation.field) for violation in violations] == [(4, 'position')]
+
+
+@pytest.mark.parametrize('text, message', [('0 0 10 0.5\n', 'line 1: expected 5 columns'),
+                                           ('0 0 10 0.5 5\n0 x 10 0.5 5\n', 'line 2: not a number')])
+def test_bad_file(stages, tmp_path, text, message):
+    path = tmp_path / 'sequence.txt'
+    path.write_text(text)
+    with pytest.raises(ValueError, match=message):
+        readTable(str(path))
+
+
+def test_sequence_file_before_the_channels_have_values(controller, tmp_path):
+    path = tmp_path / 'sequence.txt'
+    path.write_text('0 0 10 0.5 5\n')
+    messages = []
+    controller.message.connect(messages.append)
+    # As just after connecting, before the first monitor update of the alt velocity
+    del controller.watcher.values['alt.VELO']
+
+    assert not controller.playSequenceFile(str(path))
+    assert messages == [f'Cannot play {path}: no value yet from alt.VELO']
+    assert controller.state == TelSimStates.IDLE
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from writepipeline import WritePipeline
+
+
+class Channel:
+    '''Records its writes; a write of a value in hold blocks until that value's event is set'''
+
+    def __init__(self, log, name, hold=None, fail=()):
+        self.log = log
+        self.name = name
+        self.hold = hold or {}
+        self.fail = fail
+
+    def write(self, value, wait=True):
+        if value in self.hold:
+            self.hold[value].wait(5)
+        if value in self.fail:
+            raise ConnectionError(f'{self.name} refused {value}')
+        self.log.append((self.name, value))
+
+
+@pytest.fixture
+def pipeline(app):
+    pipeline = WritePipeline()
+    signals = []
+    pipeline.groupDone.connect(lambda groupId: signals.append(('done', groupId)))
+    pipeline.groupFailed.connect(lambda groupId, message: signals.append(('failed', groupId, message)))
+    pipeline.signals = signals
+    yield pipeline
+    pipeline.shutdown()
+
+
+def test_stages_run_in_order(pipeline, waitFor):
+    log = []
+    release = threading.Event()
+    spmg = Channel(log, 'SPMG', hold={'go': release})
+    velo, val = Channel(log, 'VELO'), Channel(log, 'VAL')
+    groupId, done = pipeline.group('move', [[(spmg, 'go', True)], [(velo, 2.0, True)], [(val, 20.0, False)]])
+
+    assert pipeline.pending() == ['move']
+    assert log == []
+    release.set()
+    assert done.result(5) == groupId
+    assert log == [('SPMG', 'go'), ('VELO', 2.0), ('VAL', 20.0)]
+    waitFor(lambda: pipeline.signals, what='groupDone')
+    assert pipeline.signals == [('done', groupId)]
+    assert pipeline.pending() == []
+
+
+def test_failed_write_stops_the_group(pipeline, waitFor):
+    log = []
+    groupId, done = pipeline.group('move', [[(Channel(log, 'SPMG', fail=['go']), 'go', True)],
+                                            [(Channel(log, 'VAL'), 20.0, False)]])
+
+    with pytest.raises(ConnectionError):
+        done.result(5)
+    assert log == []
+    waitFor(lambda: pipeline.signals, what='groupFailed')
+    assert pipeline.signals == [('failed', groupId, 'SPMG refused go')]
+
+
+def test_cancel_sends_no_more_stages(pipeline, app):
+    log = []
+    release = threading.Event()
+    spmg = Channel(log, 'SPMG', hold={'go': release})
+    groupId, done = pipeline.group('move', [[(spmg, 'go', True)], [(Channel(log, 'VAL'), 20.0, False)]])
+
+    inflight = pipeline.cancel(groupId)
+    assert len(inflight) == 1
+    release.set()
+    inflight[0].result(5)
+    assert done.cancelled()
+    assert log == [('SPMG', 'go')]
+    assert pipeline.pending() == []
+    app.processEvents()
+    assert pipeline.signals == []
+    # A finished group has nothing left to cancel
+    assert pipeline.cancel(groupId) == []
+
+
+def test_group_waits_for_the_writes_it_comes_after(pipeline):
+    log = []
+    release = threading.Event()
+    spmg = Channel(log, 'SPMG', hold={'go': release})
+    groupId, _ = pipeline.group('move', [[(spmg, 'go', True)]])
+    inflight = pipeline.cancel(groupId)
+
+    _, stopped = pipeline.group('stop', [[(spmg, 'stop', True)]], after=inflight)
+    assert not stopped.done()
+    release.set()
+    stopped.result(5)
+    assert log == [('SPMG', 'go'), ('SPMG', 'stop')]
@@ -0,0 +1,167 @@
+import collections
+import contextlib
+import json
+import threading
+import time
+
+import numpy as np
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QFileDialog, \
+    QHeaderView
+
+# Durations kept per operation for the percentiles, and timed events kept for export
+TIMING_SAMPLES = 10000
+TIMING_EVENTS = 100000
+PANEL_REFRESH_MS = 1000
+
+
+class Timing:
+    '''
+    Monotonic timestamps and durations of state transitions, channel reads and writes, and dialog waits.
+
+    Every operation is recorded as (kind, name, seconds): kind groups them ('state', 'event', 'read', 'write',
+    'dialog', 'validate'), name says which state, event, channel, dialog or table. record() may be called from any
+    thread; channel writes are timed on the write pipeline's workers.
+    '''
+
+    def __init__(self, samples=TIMING_SAMPLES, events=TIMING_EVENTS):
+        '''
+        :param samples: Most recent durations kept per operation for stats()
+        :param events: Most recent events kept for export()
+        '''
+        self.samples = samples
+        self.events = collections.deque(maxlen=events)  # (monotonic start, wall clock start, kind, name, seconds)
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds, start=None):
+        '''
+        Record one timed operation.
+
+        :param start: time.monotonic() when it started; now minus seconds if not given
+        '''
+        now = time.monotonic()
+        if start is None:
+            start = now - seconds
+        with self._lock:
+            self.events.append((start, time.time() - (now - start), kind, name, seconds))
+            if (kind, name) not in self._durations:
+                self._durations[(kind, name)] = collections.deque(maxlen=self.samples)
+            self._durations[(kind, name)].append(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        '''Record how long the body of a with statement takes'''
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.monotonic() - start, start)
+
+    def channel(self, channel, name):
+        '''Wrap a channel or keyword so its reads and writes are timed under name'''
+        return TimedChannel(channel, name, self)
+
+    def stats(self):
+        '''
+        Per operation (kind, name, count, p50, p95, max) over the retained durations, in seconds, sorted by kind and
+        name.
+        '''
+        with self._lock:
+            durations = {key: np.array(values) for key, values in self._durations.items()}
+        rows = []
+        for (kind, name), values in sorted(durations.items()):
+            p50, p95 = np.percentile(values, [50, 95])
+            rows.append((kind, name, len(values), float(p50), float(p95), float(values.max())))
+        return rows
+
+    def export(self, path):
+        '''
+        Write every retained event, then the stats, as JSON lines. Events have type "event" and monotonic/wall start
+        times; stats have type "stats".
+        '''
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            for start, wall, kind, name, seconds in events:
+                f.write(json.dumps({'type': 'event', 'monotonic': start, 'time': wall, 'kind': kind, 'name': name,
+                                    'seconds': seconds}) + '\n')
+            for kind, name, count, p50, p95, longest in self.stats():
+                f.write(json.dumps({'type': 'stats', 'kind': kind, 'name': name, 'count': count, 'p50': p50,
+                                    'p95': p95, 'max': longest}) + '\n')
+
+
+class TimedChannel:
+    '''
+    A channel or keyword whose read() and write() are timed. Everything else, such as the callback signals, is passed
+    straight through to the wrapped object.
+    '''
+
+    def __init__(self, channel, name, timing):
+        self._channel = channel
+        self._name = name
+        self._timing = timing
+
+    def read(self, *args, **kwargs):
+        with self._timing.timed('read', self._name):
+            return self._channel.read(*args, **kwargs)
+
+    def write(self, *args, **kwargs):
+        with self._timing.timed('write', self._name):
+            return self._channel.write(*args, **kwargs)
+
+    @property
+    def untimed(self):
+        '''The wrapped channel, for reads that should not count in the stats, such as health probes'''
+        return self._channel
+
+    def __getattr__(self, attr):
+        return getattr(self._channel, attr)
+
+
+class TimingPanel(QWidget):
+    '''
+    Debug panel with the p50/p95/max of every timed operation, refreshed while it is visible, and a button to export
+    the timings as JSON lines.
+    '''
+
+    COLUMNS = ['Kind', 'Name', 'Count', 'p50 ms', 'p95 ms', 'Max ms']
+
+    def __init__(self, timing, parent=None):
+        super().__init__(parent)
+        self.timing = timing
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().hide()
+        self.exportButton = QPushButton('Export...')
+        self.exportButton.clicked.connect(self.exportClicked)
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addWidget(self.exportButton)
+        self.setLayout(layout)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(PANEL_REFRESH_MS)
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        rows = self.timing.stats()
+        self.table.setRowCount(len(rows))
+        for row, (kind, name, count, p50, p95, longest) in enumerate(rows):
+            cells = [kind, name, str(count), f'{p50 * 1000:0.2f}', f'{p95 * 1000:0.2f}', f'{longest * 1000:0.2f}']
+            for column, text in enumerate(cells):
+                item = self.table.item(row, column)
+                if item is None:
+                    self.table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+
+    def exportClicked(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export timings', 'timing.jsonl', 'JSON lines (*.jsonl)')
+        if path:
+            self.timing.export(path)
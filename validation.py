@@ -0,0 +1,170 @@
+import collections
+
+import numpy as np
+
+from motionprofile import moveTimes
+from sequenceplayer import Segment
+from stages import Limits
+
+# Loop gain and WFS frame rate limits; the frame rate range depends on whether the WFS is binned
+GAIN = Limits(0, 1, None, 2)
+FRAME_RATE = {False: Limits(1, 2000, None, 0), True: Limits(1, 3600, None, 0)}
+
+# One problem with one row of a setpoint table. kind is 'limit' for a value outside its limits (the row cannot be
+# sent), 'timing' for a move predicted to outlast its segment (the sequence will run late), or 'unchecked' for a
+# check that could not be made. line is the sequence file line, for tables read from a file.
+Violation = collections.namedtuple('Violation', ['row', 'field', 'value', 'kind', 'message', 'line'],
+                                   defaults=[None])
+
+
+def readTable(path):
+    '''
+    A whole sequence file as arrays, one per Segment field, in the same format as sequenceplayer.readSegments().
+
+    :param path: Sequence .txt file
+    :return: ({field: array}, array of the file line number of each row)
+    :raises ValueError: On a row that does not have five numbers
+    '''
+    with open(path) as f:
+        text = f.read().replace(',', ' ')
+    rows = []
+    numbers = []
+    for number, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#'):
+            rows.append(stripped)
+            numbers.append(number)
+
+    columns = len(Segment._fields)
+    counts = np.fromiter((len(row.split()) for row in rows), dtype=int, count=len(rows))
+    bad = np.flatnonzero(counts != columns)
+    if len(bad):
+        raise ValueError(f'{path} line {numbers[bad[0]]}: expected {columns} columns, got {counts[bad[0]]}')
+    try:
+        values = np.array(' '.join(rows).split(), dtype=float).reshape(-1, columns)
+    except ValueError:
+        for row, number in zip(rows, numbers):
+            try:
+                [float(value) for value in row.split()]
+            except ValueError:
+                raise ValueError(f'{path} line {number}: not a number in "{row}"') from None
+        raise
+    return dict(zip(Segment._fields, values.T)), np.array(numbers)
+
+
+def validateTable(table, stages, start=None, altMotion=None, parallel=False, binned=False):
+    '''
+    Check every row of a setpoint table at once against the stage limits, the loop gain and frame rate limits, that
+    segment times never go backwards, and the predicted time of each move against the time until the next segment
+    is due.
+
+    :param table: {column: array}: the Segment fields (time may be left out for a table of single moves), plus
+                  optionally gain and frameRate
+    :param stages: stages.StageRegistry
+    :param start: Segment the stages start from, so the first row's move can be timed; it is not timed if None
+    :param altMotion: (VELO, ACCL) of each alt stage, in registry order, for predicting the altitude moves; each alt
+                      stage's home VELO/ACCL if not given. The wind moves alone are checked for an alt stage with
+                      neither, and an 'unchecked' violation says so.
+    :param parallel: The alt and wind stages move at the same time
+    :param binned: The WFS is binned, which allows higher frame rates
+    :return: Violations, sorted by row
+    '''
+    violations = []
+
+    def check(field, values, limits, what):
+        values = np.asarray(values, dtype=float)
+        rows = np.flatnonzero(~((values >= limits.low) & (values <= limits.high)))
+        for row in rows:
+            violations.append(Violation(int(row), field, float(values[row]), 'limit',
+                                        f'{what} {values[row]:g} is outside {limits.low:g}..{limits.high:g}'))
+
+    for stage in stages:
+        if stage.role == 'alt':
+            check('altitude', table['altitude'], stage.limits['VAL'], f'{stage.label} altitude')
+        else:
+            check('position', table['position'], stage.limits['VAL'], f'{stage.label} position')
+            check('velocity', table['velocity'], stage.limits['VELO'], f'{stage.label} velocity')
+            check('accel', table['accel'], stage.limits['ACCL'], f'{stage.label} acceleration')
+    if 'gain' in table:
+        check('gain', table['gain'], GAIN, 'Gain')
+    if 'frameRate' in table:
+        frameRate = np.asarray(table['frameRate'], dtype=float)
+        check('frameRate', frameRate, FRAME_RATE[binned], f'{"Binned" if binned else "Unbinned"} frame rate')
+        for row in np.flatnonzero(np.isfinite(frameRate) & (frameRate != np.round(frameRate))):
+            violations.append(Violation(int(row), 'frameRate', float(frameRate[row]), 'limit',
+                                        f'Frame rate {frameRate[row]:g} is not a whole number'))
+
+    if 'time' in table and len(table['time']) > 1:
+        time = np.asarray(table['time'], dtype=float)
+        for row in np.flatnonzero(np.diff(time) < 0) + 1:
+            violations.append(Violation(int(row), 'time', float(time[row]), 'limit',
+                                        f'Time {time[row]:g} is before {time[row - 1]:g}'))
+        violations += moveTimeViolations(table, stages, start, altMotion, parallel)
+    violations.sort(key=lambda violation: violation.row)
+    return violations
+
+
+def moveTimeViolations(table, stages, start, altMotion, parallel):
+    '''
+    Segments whose move is predicted to take longer than the time until the next segment is due, each move starting
+    from the previous row's setpoint at the row's velocity and acceleration (clamped as the controller does).
+
+    An alt stage whose VELO/ACCL is not known adds nothing to the predicted times, so only a segment late on the
+    other moves alone is reported, plus one 'unchecked' violation naming the stage.
+    '''
+    altStages = stages.role('alt')
+    if altMotion is None:
+        altMotion = [(stage.home('VELO'), stage.home('ACCL')) for stage in altStages]
+    unknown = [stage for stage, motion in zip(altStages, altMotion) if None in motion]
+    altMotion = [motion for motion in altMotion if None not in motion]
+
+    time = np.asarray(table['time'], dtype=float)
+    altitude = np.asarray(table['altitude'], dtype=float)
+    position = np.asarray(table['position'], dtype=float)
+    if start is None:
+        altFrom, positionFrom, first = altitude[:-2], position[:-2], 1
+    else:
+        altFrom = np.r_[start.altitude, altitude[:-2]]
+        positionFrom = np.r_[start.position, position[:-2]]
+        first = 0
+    # Every row but the last has a next segment to be ready for
+    rows = np.arange(first, len(time) - 1)
+    altTo, positionTo = altitude[rows], position[rows]
+
+    # A zero velocity limit or a NaN setpoint gives NaN times, which are never late; the limit checks report them
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alt = np.zeros(len(rows))
+        for velocity, accelTime in altMotion:
+            alt = np.maximum(alt, moveTimes(altTo - altFrom, velocity, accelTime))
+        wind = np.zeros(len(rows))
+        for stage in stages.role('wind'):
+            velocity = np.clip(np.asarray(table['velocity'], dtype=float)[rows], stage.limits['VELO'].low,
+                               stage.limits['VELO'].high)
+            accelTime = np.clip(np.asarray(table['accel'], dtype=float)[rows], stage.limits['ACCL'].low,
+                                stage.limits['ACCL'].high)
+            wind = np.maximum(wind, moveTimes(positionTo - positionFrom, velocity, accelTime))
+        predicted = np.maximum(alt, wind) if parallel else alt + wind
+        available = time[rows + 1] - time[rows]
+        # A segment due before the previous one is reported by validateTable() instead
+        late = np.flatnonzero((predicted > available) & (available >= 0))
+    violations = [Violation(int(rows[i]), 'time', float(time[rows[i]]), 'timing',
+                            f'Move predicted to take {predicted[i]:0.2f} s, but the next segment is due after '
+                            f'{available[i]:0.2f} s')
+                  for i in late]
+    if unknown and len(rows):
+        violations.append(Violation(int(rows[0]), 'altitude', float(altitude[rows[0]]), 'unchecked',
+                                    f"Altitude move times not checked: no VELO/ACCL for "
+                                    f"{', '.join(stage.label for stage in unknown)}"))
+    return violations
+
+
+def validateFile(path, stages, start=None, altMotion=None, parallel=False):
+    '''
+    validateTable() for a sequence file.
+
+    :return: Violations, sorted by row, with their file line numbers
+    :raises ValueError: If the file is not a valid sequence file (see readTable())
+    '''
+    table, lines = readTable(path)
+    violations = validateTable(table, stages, start, altMotion, parallel)
+    return [violation._replace(line=int(lines[violation.row])) for violation in violations]
@@ -0,0 +1,87 @@
+import functools
+import itertools
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+
+class ConditionWatcher(QtCore.QObject):
+    '''
+    Waits for a condition over several channels without reading any of them.
+
+    Each input is subscribed to once, through its floatCallback monitor, and its latest value cached. A watch is a
+    predicate over those cached values; it is evaluated when it is started and again only when one of the inputs it
+    depends on changes value. The first time it holds, met(id) is emitted and the watch is dropped.
+    '''
+
+    met = pyqtSignal(int)
+    pendingChanged = pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.values = {}
+        self._ids = itertools.count(1)
+        self._watches = {}
+        self._connections = []  # (signal, slot) of every channel connected, to disconnect on shutdown
+
+    def add(self, name, channel):
+        '''
+        Cache the monitor updates of a channel under name. Connect before the channel's first runCallbacks(), so the
+        initial value is cached too.
+        '''
+        slot = functools.partial(self.update, name)
+        channel.floatCallback.connect(slot)
+        self._connections.append((channel.floatCallback, slot))
+
+    def shutdown(self):
+        '''Hear nothing more from the channels, which may outlive this watcher'''
+        for signal, slot in self._connections:
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        self._connections = []
+
+    def update(self, name, value):
+        '''Take a new value for input name and re-check the watches that depend on it'''
+        value = float(value)
+        if self.values.get(name) == value:
+            return
+        self.values[name] = value
+        for watchId, (names, predicate, _) in list(self._watches.items()):
+            if name in names:
+                self._check(watchId, names, predicate)
+
+    def watch(self, names, predicate, description):
+        '''
+        Start waiting for a condition.
+
+        :param names: Inputs the predicate reads
+        :param predicate: Called with {name: latest value}; true once the condition holds
+        :param description: Shown in pending() until the condition is met or cancelled
+        :return: Watch id, passed to met when the condition holds
+        '''
+        watchId = next(self._ids)
+        self._watches[watchId] = (set(names), predicate, description)
+        self.pendingChanged.emit(self.pending())
+        self._check(watchId, names, predicate)
+        return watchId
+
+    def cancel(self, watchId=None):
+        '''Drop one watch, or all of them if watchId is None'''
+        if watchId is None:
+            self._watches.clear()
+        else:
+            self._watches.pop(watchId, None)
+        self.pendingChanged.emit(self.pending())
+
+    def pending(self):
+        '''Descriptions of the watches still waiting'''
+        return [description for _, _, description in self._watches.values()]
+
+    def _check(self, watchId, names, predicate):
+        if not all(name in self.values for name in names) or not predicate(self.values):
+            return
+        self._watches.pop(watchId, None)
+        self.pendingChanged.emit(self.pending())
+        self.met.emit(watchId)
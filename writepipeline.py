@@ -0,0 +1,135 @@
+import concurrent.futures
+import itertools
+import threading
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+PUT_WORKERS = 8
+
+
+class WritePipeline(QtCore.QObject):
+    '''
+    Issues channel writes from worker threads, so a group of setpoints goes out concurrently and the GUI thread never
+    waits on a put.
+
+    A group is a list of stages, each a list of (channel, value, wait) writes. The writes of a stage are sent at the
+    same time; the next stage starts once every put of the previous one has completed. That is how the motor record
+    ordering is kept (SPMG, then VELO/ACCL, then VAL) without serialising anything else. With wait=True a write
+    completes when the IOC reports put-completion, which for a motor VAL means the move has finished.
+
+    groupDone(id) or groupFailed(id, message) is emitted when a group finishes; connect them from the GUI thread and
+    they are delivered there. A cancelled group starts no more stages and emits neither.
+    '''
+
+    groupDone = pyqtSignal(int)
+    groupFailed = pyqtSignal(int, str)
+    pendingChanged = pyqtSignal(list)
+
+    def __init__(self, workers=PUT_WORKERS, parent=None):
+        super().__init__(parent)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telsim-put')
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}  # Group id: futures of the stage being written
+        self._cancelled = set()
+
+    def write(self, channel, value, wait=True):
+        '''
+        Put one value from a worker thread.
+
+        :return: concurrent.futures.Future completing with the put
+        '''
+        return self._pool.submit(channel.write, value, wait=wait)
+
+    def group(self, description, stages, after=()):
+        '''
+        Start a group of writes.
+
+        :param description: Shown in pending() until the group finishes
+        :param stages: List of stages, each a list of (channel, value, wait)
+        :param after: Futures to wait for before the first stage, e.g. the writes cancel() left in flight
+        :return: (group id, concurrent.futures.Future completing when the last stage has)
+        '''
+        groupId = next(self._ids)
+        done = concurrent.futures.Future()
+        with self._lock:
+            self._pending[groupId] = description
+        self.pendingChanged.emit(self.pending())
+        self._whenDone(list(after), lambda: self._runStage(groupId, list(stages), 0, done))
+        return groupId, done
+
+    def cancel(self, groupId):
+        '''
+        Start no more stages of a group. Writes already sent cannot be recalled.
+
+        :return: Futures of the group's writes still in flight, to pass as group(after=...)
+        '''
+        with self._lock:
+            if groupId not in self._pending:
+                return []
+            self._cancelled.add(groupId)
+            return [future for future in self._inflight.get(groupId, []) if not future.done()]
+
+    def pending(self):
+        '''Descriptions of the groups still in flight'''
+        with self._lock:
+            return list(self._pending.values())
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def _whenDone(self, futures, callback):
+        '''Call callback once every future has completed, from the thread that completes the last one'''
+        if not futures:
+            callback()
+            return
+
+        remaining = [len(futures)]
+
+        def futureDone(future):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            callback()
+
+        for future in futures:
+            future.add_done_callback(futureDone)
+
+    def _runStage(self, groupId, stages, index, done):
+        # Sent under the lock, so cancel() either stops this stage or sees its writes in flight
+        with self._lock:
+            last = index == len(stages) or groupId in self._cancelled
+            if not last:
+                futures = [self.write(channel, value, wait) for channel, value, wait in stages[index]]
+                self._inflight[groupId] = futures
+        if last:
+            self._finish(groupId, done, None)
+            return
+
+        def stageDone():
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                self._finish(groupId, done, errors[0])
+            else:
+                self._runStage(groupId, stages, index + 1, done)
+
+        self._whenDone(futures, stageDone)
+
+    def _finish(self, groupId, done, error):
+        with self._lock:
+            self._pending.pop(groupId, None)
+            self._inflight.pop(groupId, None)
+            cancelled = groupId in self._cancelled
+            self._cancelled.discard(groupId)
+        if cancelled:
+            done.cancel()
+        elif error is None:
+            done.set_result(groupId)
+            self.groupDone.emit(groupId)
+        else:
+            done.set_exception(error)
+            self.groupFailed.emit(groupId, str(error))
+        self.pendingChanged.emit(self.pending())